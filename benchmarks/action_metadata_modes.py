@@ -0,0 +1,83 @@
+"""
+Compares the single-stage and two-stage action metadata extraction on a fixture set:
+input tokens, latency and how often each field matches the expected label.
+
+Calls the OpenAI API with the settings from src/.env, bypassing the llm cache.
+
+    python benchmarks/action_metadata_modes.py [--fixtures benchmarks/fixtures/action_metadata.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, "src"))
+
+from ai import get_action_metadata_from_chat_history  # noqa: E402
+from metrics import get_metrics  # noqa: E402
+
+modes = ["single", "two_stage"]
+fields = ["action_type", "action_category", "action_subcategory", "action_subtype"]
+
+
+def get_input_tokens(mode: str) -> float:
+    histogram = get_metrics()["histograms"].get(
+        f"action_metadata_input_tokens{{mode={mode}}}"
+    )
+    if not histogram:
+        return 0
+
+    return histogram["mean"] * histogram["count"]
+
+
+async def run_mode(mode: str, fixtures: list) -> dict:
+    latencies = []
+    num_matches = {field: 0 for field in fields}
+    tokens_before = get_input_tokens(mode)
+
+    for fixture in fixtures:
+        started_at = time.perf_counter()
+        action_metadata = await get_action_metadata_from_chat_history(
+            fixture["chat_history"], use_cache=False, mode=mode
+        )
+        latencies.append(time.perf_counter() - started_at)
+
+        for field in fields:
+            if action_metadata[field] == fixture["expected"][field]:
+                num_matches[field] += 1
+
+    latencies.sort()
+
+    return {
+        "input_tokens_per_call": (get_input_tokens(mode) - tokens_before)
+        / len(fixtures),
+        "latency_p50_seconds": latencies[len(latencies) // 2],
+        "latency_max_seconds": latencies[-1],
+        "accuracy": {
+            field: num_matches[field] / len(fixtures) for field in fields
+        },
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--fixtures",
+        default=os.path.join(root_dir, "benchmarks", "fixtures", "action_metadata.json"),
+    )
+    args = parser.parse_args()
+
+    with open(args.fixtures) as f:
+        fixtures = json.load(f)
+
+    results = {mode: await run_mode(mode, fixtures) for mode in modes}
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,433 @@
+"""
+Stress test of concurrent writes to SQLite: simulated students create actions, chat and
+have them extracted, all at once, directly against db.py on a temporary database. The
+calls db.py makes to Frappe are replaced by a delay drawn from a log-normal distribution,
+so that the time they keep write transactions open shows up without a network.
+
+    create_action_for_user -> --turns x add_messages_to_action_history -> extraction
+
+where the extraction does the writes of the extraction job: the job and its events, the
+llm cache entries, update_action_for_user and the hours invested.
+
+Reports per operation latency and errors, throughput, and histograms of
+
+- lock waits: the time of the first write of a transaction, which waits for the write
+  lock held by other connections (up to the busy timeout, then `database is locked`),
+- commit latency,
+- transaction hold: from the first write of a transaction to the end of its commit,
+  the time other writers wait on.
+
+    python benchmarks/db_contention.py [--students 200] [--turns 5] [--think-time-ms 0]
+        [--frappe-median-ms 80] [--frappe-p95-ms 400] [--output report.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+import aiosqlite
+import numpy as np
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, "src"))
+sys.path.insert(0, os.path.join(root_dir, "standins"))
+sys.path.insert(0, os.path.join(root_dir, "benchmarks"))
+
+import db  # noqa: E402
+from models import AddChatMessageRequest, ActionCategory, ActionType  # noqa: E402
+from latency import LatencyDistribution, add_latency_arguments  # noqa: E402
+from generate_data import create_database, generate_text  # noqa: E402
+from e2e_load import get_git_commit, get_percentiles  # noqa: E402
+
+histogram_bounds_ms = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+write_statements = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+extraction_stages = ["action_metadata", "skill_relevance", "subclassification"]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.lock_waits = []
+        self.commits = []
+        self.transaction_holds = []
+        # when the open transaction of a connection made its first write
+        self.transaction_started_at = {}
+
+    def record(self, operation: str, latency: float, error: str | None = None):
+        if error is not None:
+            self.errors[operation][error] += 1
+            return
+
+        self.latencies[operation].append(latency)
+
+
+@contextmanager
+def instrument_sqlite(recorder: Recorder):
+    """Times the statements and commits of every aiosqlite connection, db.py's included."""
+    execute = aiosqlite.Cursor.execute
+    executemany = aiosqlite.Cursor.executemany
+    commit = aiosqlite.Connection.commit
+    rollback = aiosqlite.Connection.rollback
+
+    async def timed(cursor, method, sql, parameters):
+        connection = cursor._conn
+        is_first_write = not connection.in_transaction and sql.lstrip().upper().startswith(
+            write_statements
+        )
+
+        started_at = time.perf_counter()
+
+        try:
+            result = await method(cursor, sql, parameters)
+        finally:
+            # waits that end in `database is locked` count too
+            if is_first_write:
+                recorder.lock_waits.append(time.perf_counter() - started_at)
+
+        if is_first_write:
+            recorder.transaction_started_at[id(connection)] = started_at
+
+        return result
+
+    async def timed_execute(cursor, sql, parameters=None):
+        return await timed(cursor, execute, sql, parameters)
+
+    async def timed_executemany(cursor, sql, parameters):
+        return await timed(cursor, executemany, sql, parameters)
+
+    async def timed_commit(connection):
+        started_at = time.perf_counter()
+        await commit(connection)
+        finished_at = time.perf_counter()
+
+        recorder.commits.append(finished_at - started_at)
+        transaction_started_at = recorder.transaction_started_at.pop(
+            id(connection), None
+        )
+        if transaction_started_at is not None:
+            recorder.transaction_holds.append(finished_at - transaction_started_at)
+
+    async def timed_rollback(connection):
+        recorder.transaction_started_at.pop(id(connection), None)
+        await rollback(connection)
+
+    aiosqlite.Cursor.execute = timed_execute
+    aiosqlite.Cursor.executemany = timed_executemany
+    aiosqlite.Connection.commit = timed_commit
+    aiosqlite.Connection.rollback = timed_rollback
+
+    try:
+        yield
+    finally:
+        aiosqlite.Cursor.execute = execute
+        aiosqlite.Cursor.executemany = executemany
+        aiosqlite.Connection.commit = commit
+        aiosqlite.Connection.rollback = rollback
+
+
+@contextmanager
+def stub_frappe(latency: LatencyDistribution):
+    add_message_to_chat_history = db.add_message_to_chat_history
+
+    async def add_message_to_chat_history_stub(*args, **kwargs):
+        await latency.wait()
+
+    db.add_message_to_chat_history = add_message_to_chat_history_stub
+
+    try:
+        yield
+    finally:
+        db.add_message_to_chat_history = add_message_to_chat_history
+
+
+async def timed_operation(recorder: Recorder, operation: str, coroutine):
+    started_at = time.perf_counter()
+
+    try:
+        result = await coroutine
+    except Exception as exception:
+        recorder.record(operation, 0, error=f"{type(exception).__name__}: {exception}"[:120])
+        return None, False
+
+    recorder.record(operation, time.perf_counter() - started_at)
+    return result, True
+
+
+def generate_coach_message(rng: random.Random, is_done: bool) -> str:
+    return json.dumps(
+        {
+            "chain_of_thought": generate_text(rng, 20),
+            "response": generate_text(rng, rng.randint(15, 60)),
+            "is_done": is_done,
+            "create_action": True,
+            "language": "english",
+        }
+    )
+
+
+async def run_extraction(
+    recorder: Recorder, rng: random.Random, action: dict, skill_ids: dict
+) -> bool:
+    action_uuid = action["uuid"]
+
+    job, succeeded = await timed_operation(
+        recorder,
+        "create_job",
+        db.create_job("extract_action_metadata", {"action_uuid": action_uuid}, action_uuid),
+    )
+    if not succeeded:
+        return False
+
+    for stage in extraction_stages:
+        await timed_operation(
+            recorder, "add_job_event", db.add_job_event(job["id"], stage, "started")
+        )
+        await timed_operation(
+            recorder,
+            "set_llm_cache_entry",
+            db.set_llm_cache_entry(
+                uuid.uuid4().hex, stage, "stress", json.dumps({"text": generate_text(rng, 80)})
+            ),
+        )
+        await timed_operation(
+            recorder, "add_job_event", db.add_job_event(job["id"], stage, "completed")
+        )
+
+    skills = [
+        {"id": skill_id, "relevance": generate_text(rng, 15)}
+        for skill_id in rng.sample(list(skill_ids.values()), 4)
+    ]
+    action, succeeded = await timed_operation(
+        recorder,
+        "update_action_for_user",
+        db.update_action_for_user(
+            action_uuid,
+            generate_text(rng, 6),
+            generate_text(rng, 60),
+            "published",
+            rng.choice(list(ActionCategory)).value,
+            rng.choice(list(ActionType)).value,
+            skills,
+        ),
+    )
+    if not succeeded:
+        return False
+
+    await timed_operation(
+        recorder,
+        "update_action_hours_invested",
+        db.update_action_hours_invested(action_uuid, rng.randint(1, 12), "hours"),
+    )
+    _, succeeded = await timed_operation(
+        recorder,
+        "finish_job",
+        db.finish_job(job["id"], "completed", {"action_uuid": action_uuid}),
+    )
+
+    return succeeded
+
+
+async def run_student(recorder: Recorder, args, index: int, skill_ids: dict):
+    rng = random.Random(f"{args.seed}:{index}")
+
+    async def think():
+        if args.think_time_ms:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_time_ms) / 1000)
+
+    action, succeeded = await timed_operation(
+        recorder,
+        "create_action_for_user",
+        db.create_action_for_user(
+            "",
+            f"stress-{index}@example.com",
+            generate_text(rng, 20),
+            generate_coach_message(rng, is_done=False),
+        ),
+    )
+    if not succeeded:
+        return "failed"
+
+    for turn in range(args.turns):
+        await think()
+        await timed_operation(
+            recorder,
+            "add_messages_to_action_history",
+            db.add_messages_to_action_history(
+                action["uuid"],
+                [
+                    AddChatMessageRequest(
+                        role="user",
+                        content=generate_text(rng, rng.randint(5, 40)),
+                        response_type="text",
+                    ),
+                    AddChatMessageRequest(
+                        role="assistant",
+                        content=generate_coach_message(
+                            rng, is_done=turn == args.turns - 1
+                        ),
+                        response_type="text",
+                    ),
+                ],
+            ),
+        )
+
+    await think()
+    if not await run_extraction(recorder, rng, action, skill_ids):
+        return "failed"
+
+    return "completed"
+
+
+def get_histogram(values: list) -> dict:
+    """Counts per bucket, keyed by the upper bound of the bucket in milliseconds."""
+    counts = np.histogram(
+        np.array(values) * 1000, bins=[0, *histogram_bounds_ms, np.inf]
+    )[0]
+
+    return {
+        **{f"<={bound}": int(count) for bound, count in zip(histogram_bounds_ms, counts)},
+        f">{histogram_bounds_ms[-1]}": int(counts[-1]),
+    }
+
+
+def get_distribution(values: list) -> dict:
+    return {
+        "count": len(values),
+        "seconds": {
+            **get_percentiles(values),
+            "max": max(values) if values else 0,
+        },
+        "histogram_ms": get_histogram(values),
+    }
+
+
+def build_report(recorder: Recorder, args, duration: float, outcomes: list) -> dict:
+    operations = sorted(set(recorder.latencies) | set(recorder.errors))
+    num_succeeded = sum(len(latencies) for latencies in recorder.latencies.values())
+
+    return {
+        "started_at": args.started_at,
+        "git_commit": get_git_commit(),
+        "config": {
+            "students": args.students,
+            "turns": args.turns,
+            "think_time_ms": args.think_time_ms,
+            "frappe_median_ms": args.frappe_median_ms,
+            "frappe_p95_ms": args.frappe_p95_ms,
+            "seed": args.seed,
+        },
+        "duration_seconds": duration,
+        "students": {outcome: outcomes.count(outcome) for outcome in set(outcomes)},
+        "operations_per_second": num_succeeded / duration,
+        "commits_per_second": len(recorder.commits) / duration,
+        "operations": {
+            operation: {
+                "count": len(recorder.latencies[operation]),
+                "errors": dict(recorder.errors[operation]),
+                "latency_seconds": get_percentiles(recorder.latencies[operation]),
+            }
+            for operation in operations
+        },
+        "lock_waits": get_distribution(recorder.lock_waits),
+        "commits": get_distribution(recorder.commits),
+        "transaction_holds": get_distribution(recorder.transaction_holds),
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"{report['duration_seconds']:.1f}s, students: "
+        + ", ".join(f"{outcome} {count}" for outcome, count in report["students"].items())
+        + f", {report['operations_per_second']:.1f} operations/s, "
+        f"{report['commits_per_second']:.1f} commits/s"
+    )
+
+    print(f"\n{'operation':<32} {'count':>6} {'errors':>6} {'p50':>7} {'p95':>7} {'p99':>7}")
+    for operation, stats in report["operations"].items():
+        latency = stats["latency_seconds"]
+        print(
+            f"{operation:<32} {stats['count']:>6} {sum(stats['errors'].values()):>6} "
+            + " ".join(f"{latency.get(f'p{p}', 0):>7.3f}" for p in [50, 95, 99])
+        )
+
+        for error, count in stats["errors"].items():
+            print(f"    {count} x {error}")
+
+    distributions = ["lock_waits", "commits", "transaction_holds"]
+    print(f"\n{'ms':<8}" + "".join(f"{name:>20}" for name in distributions))
+    for bucket in report["lock_waits"]["histogram_ms"]:
+        print(
+            f"{bucket:<8}"
+            + "".join(
+                f"{report[name]['histogram_ms'][bucket]:>20}" for name in distributions
+            )
+        )
+    for statistic in ["p50", "p95", "p99", "max"]:
+        print(
+            f"{statistic:<8}"
+            + "".join(
+                f"{report[name]['seconds'].get(statistic, 0) * 1000:>18.1f}ms"
+                for name in distributions
+            )
+        )
+
+
+async def run(args, database_path: str):
+    await create_database(database_path)
+    skill_ids = await db.get_skill_ids_by_name()
+
+    recorder = Recorder()
+    latency = LatencyDistribution(
+        args.frappe_median_ms, args.frappe_p95_ms, random.Random(args.seed)
+    )
+
+    with instrument_sqlite(recorder), stub_frappe(latency):
+        started_at = time.perf_counter()
+        outcomes = await asyncio.gather(
+            *[
+                run_student(recorder, args, index, skill_ids)
+                for index in range(args.students)
+            ]
+        )
+        duration = time.perf_counter() - started_at
+
+    return build_report(recorder, args, duration, outcomes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=200, help="concurrent students")
+    parser.add_argument("--turns", type=int, default=5, help="chat turns per student")
+    parser.add_argument("--think-time-ms", type=float, default=0)
+    add_latency_arguments(parser, "frappe", 80, 400, "latency of the calls to Frappe")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    args.started_at = datetime.now().isoformat()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report = asyncio.run(run(args, os.path.join(temp_dir, "db.sqlite")))
+
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+End-to-end load test: simulated students go through the whole flow against a running
+service, concurrently:
+
+    login -> POST /actions -> basic chat turns -> extract_action_metadata
+        -> GET /portfolio -> detail chat turns
+
+Basic chat turns go on (up to --max-turns) until the coach allows creating the action,
+flows where it never does skip the rest. Detail chat turns stop early when the coach
+ends the reflection. Reports p50/p95/p99 latency, time to the first
+chunk of streams, requests/s and errors per endpoint, and writes them as JSON along with
+the metrics of the service so that runs can be compared over time.
+
+Meant for the service running on the offline stand-ins (see standins/ and the README):
+
+    python standins/openai_server.py &
+    python standins/frappe_server.py &
+    cd src; uvicorn main:app --port 8002 &
+    python benchmarks/e2e_load.py [--base-url http://localhost:8002] [--users 20]
+        [--flows-per-user 3] [--output benchmarks/results/e2e.json] [--compare previous.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import httpx
+import numpy as np
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+percentiles = [50, 95, 99]
+
+student_messages = [
+    "We cleaned up the lake near our school last Saturday with 15 volunteers",
+    "We collected around 40 bags of plastic and segregated them for recycling",
+    "I mapped the garbage black spots in our ward using an app and shared them",
+    "The ward office agreed to put two more bins near the bus stop",
+    "It took us about 6 hours including the planning with the resident association",
+    "Next month we want to do the same at the park and involve the shopkeepers",
+]
+
+detail_messages = [
+    "The hardest part was convincing the shopkeepers to join us",
+    "I learnt how to talk to officials and follow up until something happens",
+    "We used a shared sheet to track the bags and the spots we cleaned",
+]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.first_chunk_latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.flows = defaultdict(int)
+        self.flow_latencies = []
+
+    def record(
+        self,
+        endpoint: str,
+        latency: float,
+        error: str | None = None,
+        first_chunk_latency: float | None = None,
+    ):
+        if error is not None:
+            self.errors[endpoint][error] += 1
+            return
+
+        self.latencies[endpoint].append(latency)
+        if first_chunk_latency is not None:
+            self.first_chunk_latencies[endpoint].append(first_chunk_latency)
+
+
+class FlowError(Exception):
+    pass
+
+
+def get_percentiles(values: list) -> dict:
+    if not values:
+        return {}
+
+    return {
+        f"p{percentile}": float(np.percentile(values, percentile))
+        for percentile in percentiles
+    }
+
+
+async def call(
+    client: httpx.AsyncClient,
+    recorder: Recorder,
+    endpoint: str,
+    method: str,
+    url: str,
+    **kwargs,
+):
+    started_at = time.perf_counter()
+
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as exception:
+        recorder.record(endpoint, 0, error=type(exception).__name__)
+        raise FlowError(endpoint) from exception
+
+    latency = time.perf_counter() - started_at
+
+    if response.status_code != 200:
+        recorder.record(endpoint, latency, error=str(response.status_code))
+        raise FlowError(f"{endpoint}: {response.status_code} {response.text[:200]}")
+
+    recorder.record(endpoint, latency)
+    return response.json()
+
+
+async def stream_chat_turn(
+    client: httpx.AsyncClient, recorder: Recorder, endpoint: str, url: str, body: dict
+) -> dict:
+    """Returns the last response of the coach, before the line with the stored message ids."""
+    started_at = time.perf_counter()
+    first_chunk_latency = None
+    chunks = []
+
+    try:
+        async with client.stream("POST", url, json=body) as response:
+            if response.status_code != 200:
+                await response.aread()
+                recorder.record(
+                    endpoint,
+                    time.perf_counter() - started_at,
+                    error=str(response.status_code),
+                )
+                raise FlowError(f"{endpoint}: {response.status_code} {response.text[:200]}")
+
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+
+                if first_chunk_latency is None:
+                    first_chunk_latency = time.perf_counter() - started_at
+
+                chunks.append(json.loads(line))
+    except httpx.HTTPError as exception:
+        recorder.record(endpoint, 0, error=type(exception).__name__)
+        raise FlowError(endpoint) from exception
+
+    if not chunks or "message_ids" not in chunks[-1]:
+        recorder.record(endpoint, time.perf_counter() - started_at, error="incomplete")
+        raise FlowError(f"{endpoint}: the stream ended before the turn was stored")
+
+    recorder.record(
+        endpoint,
+        time.perf_counter() - started_at,
+        first_chunk_latency=first_chunk_latency,
+    )
+    return chunks[-1]
+
+
+async def run_flow(
+    client: httpx.AsyncClient, recorder: Recorder, args, email: str, rng: random.Random
+):
+    async def think():
+        if args.think_time_ms:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_time_ms) / 1000)
+
+    await call(
+        client,
+        recorder,
+        "POST /login",
+        "POST",
+        "/login",
+        json={"email": email, "password": "load-test"},
+    )
+
+    created = await call(
+        client,
+        recorder,
+        "POST /actions",
+        "POST",
+        "/actions",
+        json={"user_email": email, "user_message": rng.choice(student_messages)},
+    )
+    action_uuid = created["action"]["uuid"]
+
+    last_response = created["ai_response"]
+    num_turns = 0
+
+    while num_turns < args.max_turns and (
+        num_turns < args.turns
+        or not (last_response["is_done"] and last_response["create_action"])
+    ):
+        await think()
+        last_response = await stream_chat_turn(
+            client,
+            recorder,
+            "POST /ai/basic_action_chat_stream",
+            "/ai/basic_action_chat_stream",
+            {
+                "action_uuid": action_uuid,
+                "last_user_message": rng.choice(student_messages),
+                "persist": True,
+            },
+        )
+        num_turns += 1
+
+    if not last_response["create_action"]:
+        return "skipped"
+
+    await call(
+        client,
+        recorder,
+        "POST /ai/extract_action_metadata",
+        "POST",
+        "/ai/extract_action_metadata",
+        params={"action_uuid": action_uuid, "use_cache": args.use_cache},
+    )
+
+    await call(
+        client,
+        recorder,
+        "GET /portfolio/{username}",
+        "GET",
+        f"/portfolio/{email}",
+    )
+
+    for _ in range(args.detail_turns):
+        await think()
+        last_response = await stream_chat_turn(
+            client,
+            recorder,
+            "POST /ai/detail_action_chat_stream",
+            "/ai/detail_action_chat_stream",
+            {
+                "action_uuid": action_uuid,
+                "last_user_message": rng.choice(detail_messages),
+                "persist": True,
+            },
+        )
+
+        # the coach ended the reflection
+        if last_response["is_done"] or not last_response["create_action"]:
+            break
+
+    return "completed"
+
+
+async def run_user(client: httpx.AsyncClient, recorder: Recorder, args, index: int):
+    rng = random.Random(f"{args.seed}:{index}")
+    email = f"load-{args.run_id}-{index}@example.com"
+
+    for _ in range(args.flows_per_user):
+        started_at = time.perf_counter()
+
+        try:
+            outcome = await run_flow(client, recorder, args, email, rng)
+        except FlowError:
+            outcome = "failed"
+
+        recorder.flows[outcome] += 1
+        if outcome == "completed":
+            recorder.flow_latencies.append(time.perf_counter() - started_at)
+
+
+def build_report(recorder: Recorder, args, duration: float, server_metrics) -> dict:
+    endpoints = sorted(set(recorder.latencies) | set(recorder.errors))
+
+    return {
+        "run_id": args.run_id,
+        "started_at": args.started_at,
+        "git_commit": get_git_commit(),
+        "config": {
+            "base_url": args.base_url,
+            "users": args.users,
+            "flows_per_user": args.flows_per_user,
+            "turns": args.turns,
+            "max_turns": args.max_turns,
+            "detail_turns": args.detail_turns,
+            "think_time_ms": args.think_time_ms,
+            "seed": args.seed,
+            "use_cache": args.use_cache,
+        },
+        "duration_seconds": duration,
+        "flows": {
+            **recorder.flows,
+            "latency_seconds": get_percentiles(recorder.flow_latencies),
+        },
+        "endpoints": {
+            endpoint: {
+                "requests": len(recorder.latencies[endpoint])
+                + sum(recorder.errors[endpoint].values()),
+                "errors": dict(recorder.errors[endpoint]),
+                "requests_per_second": len(recorder.latencies[endpoint]) / duration,
+                "latency_seconds": get_percentiles(recorder.latencies[endpoint]),
+                "first_chunk_seconds": get_percentiles(
+                    recorder.first_chunk_latencies[endpoint]
+                ),
+            }
+            for endpoint in endpoints
+        },
+        "server_metrics": server_metrics,
+    }
+
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=root_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict, previous: dict | None):
+    print(
+        f"{report['duration_seconds']:.1f}s, flows: "
+        + ", ".join(
+            f"{outcome} {count}"
+            for outcome, count in report["flows"].items()
+            if outcome != "latency_seconds"
+        )
+    )
+    print(
+        f"{'endpoint':<36} {'reqs':>6} {'errs':>5} {'req/s':>7} "
+        f"{'p50':>7} {'p95':>7} {'p99':>7} {'ttfc p50':>9} {'ttfc p95':>9}"
+    )
+
+    for endpoint, stats in report["endpoints"].items():
+        latency = stats["latency_seconds"]
+        first_chunk = stats["first_chunk_seconds"]
+        line = (
+            f"{endpoint:<36} {stats['requests']:>6} {sum(stats['errors'].values()):>5} "
+            f"{stats['requests_per_second']:>7.2f} "
+            + " ".join(f"{latency.get(f'p{p}', 0):>7.3f}" for p in percentiles)
+            + f" {first_chunk.get('p50', 0):>9.3f} {first_chunk.get('p95', 0):>9.3f}"
+        )
+
+        previous_p95 = (
+            ((previous or {}).get("endpoints", {}).get(endpoint) or {})
+            .get("latency_seconds", {})
+            .get("p95")
+        )
+        if previous_p95 and latency.get("p95"):
+            line += f"  p95 {(latency['p95'] / previous_p95 - 1) * 100:+.0f}% vs previous"
+
+        print(line)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8002")
+    parser.add_argument("--users", type=int, default=20, help="concurrent students")
+    parser.add_argument("--flows-per-user", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=3, help="basic chat turns per flow")
+    parser.add_argument("--max-turns", type=int, default=6)
+    parser.add_argument("--detail-turns", type=int, default=2)
+    parser.add_argument("--think-time-ms", type=float, default=0)
+    parser.add_argument("--timeout-seconds", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    # the same seed replays the same chats, which would hit the llm cache from the
+    # previous run unlike the chats of real students
+    parser.add_argument("--use-cache", action="store_true")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="report of an earlier run")
+    args = parser.parse_args()
+
+    args.run_id = uuid.uuid4().hex[:8]
+    args.started_at = datetime.now().isoformat()
+    output = args.output or os.path.join(
+        root_dir, "benchmarks", "results", f"e2e-{args.run_id}.json"
+    )
+
+    recorder = Recorder()
+
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        timeout=args.timeout_seconds,
+        # below the keep-alive of uvicorn (5s), so that idle connections are not
+        # reused as the server closes them
+        limits=httpx.Limits(max_connections=None, keepalive_expiry=4),
+    ) as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(
+            *[run_user(client, recorder, args, index) for index in range(args.users)]
+        )
+        duration = time.perf_counter() - started_at
+
+        server_metrics = (await client.get("/metrics")).json()
+
+    report = build_report(recorder, args, duration, server_metrics)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+
+    print_report(report, previous)
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,307 @@
+"""
+Generates synthetic users with a given amount of history, for benchmarks and load tests:
+N actions per user, M skill assignment log entries (with the duplicates Frappe has) and
+K chat messages per action. Writes them into a SQLite database of the service and/or
+into a JSON list of Frappe profiles, the shape get_user_profile returns (which
+standins/frappe_server.py takes with --users).
+
+    python benchmarks/generate_data.py [--users 10] [--actions 50] [--log-entries 200]
+        [--messages 20] [--sqlite data.sqlite] [--frappe-json users.json] [--seed 0]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, "src"))
+
+import db  # noqa: E402
+from config import (  # noqa: E402
+    users_table_name,
+    actions_table_name,
+    chat_history_table_name,
+    skills_table_name,
+    action_skills_table_name,
+)
+from migrations import run_migrations  # noqa: E402
+from models import ActionType, ActionCategory  # noqa: E402
+from utils import skill_to_name  # noqa: E402
+
+words = (
+    "we cleaned the lake shore with volunteers from the school and mapped the waste "
+    "points in our ward before meeting the officials to ask for more bins near the "
+    "market and then followed up every week with photos and a shared sheet"
+).split()
+
+microskill_levels = ["L1", "L2", "L3", "L4", "L5"]
+
+
+def generate_text(rng: random.Random, num_words: int) -> str:
+    return " ".join(rng.choice(words) for _ in range(num_words)).capitalize()
+
+
+def generate_chat_history(rng: random.Random, num_messages: int) -> List[Dict]:
+    """Alternating student and coach turns, the coach turns as the JSON the model outputs."""
+    chat_history = []
+
+    for index in range(num_messages):
+        if index % 2 == 0:
+            chat_history.append(
+                {"role": "user", "content": generate_text(rng, rng.randint(5, 40))}
+            )
+            continue
+
+        is_last_turn = index >= num_messages - 2
+        chat_history.append(
+            {
+                "role": "assistant",
+                "content": json.dumps(
+                    {
+                        "chain_of_thought": generate_text(rng, 20),
+                        "response": generate_text(rng, rng.randint(15, 60)),
+                        "is_done": is_last_turn,
+                        "create_action": True,
+                        "language": "english",
+                    }
+                ),
+            }
+        )
+
+    return chat_history
+
+
+def generate_user(
+    rng: random.Random,
+    index: int,
+    num_actions: int,
+    num_log_entries: int,
+    num_messages: int,
+) -> Dict:
+    skill_names = list(skill_to_name)
+    started_at = datetime(2025, 1, 1)
+
+    actions = []
+    for action_index in range(num_actions):
+        created_at = started_at + timedelta(hours=action_index * 7)
+        actions.append(
+            {
+                "uuid": str(uuid.UUID(int=rng.getrandbits(128))),
+                "title": generate_text(rng, rng.randint(3, 8)),
+                "description": generate_text(rng, rng.randint(20, 80)),
+                "category": rng.choice(list(ActionCategory)).value,
+                "type": rng.choice(list(ActionType)).value,
+                "hours_invested": rng.randint(1, 12),
+                "created_at": created_at.isoformat(sep=" "),
+                "chat_history": generate_chat_history(rng, num_messages),
+            }
+        )
+
+    # log entries of the same skill and action repeat, sometimes without a reason,
+    # like on frappe
+    log_entries = []
+    for log_index in range(num_log_entries if actions else 0):
+        action = rng.choice(actions)
+        log_entries.append(
+            {
+                "skill": rng.choice(skill_names),
+                "action_uuid": action["uuid"],
+                "reason": generate_text(rng, 15) if rng.random() < 0.8 else "",
+                "level": rng.choice(microskill_levels),
+                "created_at": (
+                    started_at + timedelta(minutes=log_index)
+                ).isoformat(sep=" "),
+            }
+        )
+
+    return {
+        "first_name": f"Student{index}",
+        "last_name": "Synthetic",
+        "username": f"synthetic-{index}",
+        "email": f"synthetic-{index}@example.com",
+        "actions": actions,
+        "log_entries": log_entries,
+    }
+
+
+def generate_users(
+    num_users: int,
+    num_actions: int,
+    num_log_entries: int,
+    num_messages: int,
+    seed: int = 0,
+) -> List[Dict]:
+    rng = random.Random(seed)
+
+    return [
+        generate_user(rng, index, num_actions, num_log_entries, num_messages)
+        for index in range(num_users)
+    ]
+
+
+def to_frappe_profile(user: Dict) -> Dict:
+    return {
+        "current_user": {
+            "first_name": user["first_name"],
+            "last_name": user["last_name"],
+            "full_name": f"{user['first_name']} {user['last_name']}",
+            "username": user["username"],
+            "email": user["email"],
+            "is_verified": False,
+            "bio": "",
+            "user_image": "",
+            "state": "Karnataka",
+            "city": "Bengaluru",
+            "location": "India",
+            "highlighted_action": {},
+            "partner": None,
+        },
+        "actions": [
+            {
+                "event_id": action["uuid"],
+                "title": action["title"],
+                "description": action["description"],
+                "category": action["category"],
+                "type": action["type"],
+                "hours_invested": action["hours_invested"],
+                "creation": action["created_at"],
+            }
+            for action in reversed(user["actions"])
+        ],
+        "skills": [{"name": skill_label} for skill_label in skill_to_name.values()],
+        "skill_assignment_log": [
+            {
+                "badge": skill_to_name[entry["skill"]],
+                "reference_name": entry["action_uuid"],
+                "reason": entry["reason"],
+                "microskill": {
+                    "title": f"{skill_to_name[entry['skill']]} {entry['level']}",
+                    "level": entry["level"],
+                    "description": "",
+                },
+                "creation": entry["created_at"],
+            }
+            for entry in user["log_entries"]
+        ],
+        "reviews": [],
+        "user_metadata": {},
+    }
+
+
+async def create_database(path: str):
+    db.sqlite_db_path = os.path.abspath(path)
+
+    await db.init_db()
+    await run_migrations()
+    await db.seed_skills()
+
+
+def write_sqlite(path: str, users: List[Dict]):
+    """Writes the users into a new database at `path`, created with the tables of the service."""
+    if os.path.exists(path):
+        os.remove(path)
+
+    asyncio.run(create_database(path))
+
+    conn = sqlite3.connect(path)
+    skill_ids = dict(conn.execute(f"SELECT name, id FROM {skills_table_name}"))
+
+    for user in users:
+        user_id = conn.execute(
+            f"INSERT INTO {users_table_name} (email, first_name, last_name, username) VALUES (?, ?, ?, ?)",
+            (user["email"], user["first_name"], user["last_name"], user["username"]),
+        ).lastrowid
+
+        action_ids = {}
+        for action in user["actions"]:
+            action_ids[action["uuid"]] = conn.execute(
+                f"INSERT INTO {actions_table_name} (uuid, title, description, user_id, status, category, type, time_invested_value, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    action["uuid"],
+                    action["title"],
+                    action["description"],
+                    user_id,
+                    "published",
+                    action["category"],
+                    action["type"],
+                    action["hours_invested"],
+                    action["created_at"],
+                ),
+            ).lastrowid
+
+            conn.executemany(
+                f"INSERT INTO {chat_history_table_name} (action_id, role, content, response_type, chain_of_thought, is_done, create_action, language) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        action_ids[action["uuid"]],
+                        message["role"],
+                        columns["content"],
+                        "text",
+                        columns["chain_of_thought"],
+                        columns["is_done"],
+                        columns["create_action"],
+                        columns["language"],
+                    )
+                    for message in action["chat_history"]
+                    for columns in [
+                        db.split_chat_message_content(
+                            message["role"], message["content"]
+                        )
+                    ]
+                ],
+            )
+
+        # the database keeps one summary per skill and action
+        action_skills = {
+            (entry["action_uuid"], entry["skill"]): entry["reason"]
+            for entry in user["log_entries"]
+        }
+        conn.executemany(
+            f"INSERT INTO {action_skills_table_name} (action_id, skill_id, summary) VALUES (?, ?, ?)",
+            [
+                (action_ids[action_uuid], skill_ids[skill], reason)
+                for (action_uuid, skill), reason in action_skills.items()
+            ],
+        )
+
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--actions", type=int, default=50, help="per user")
+    parser.add_argument("--log-entries", type=int, default=200, help="per user")
+    parser.add_argument("--messages", type=int, default=20, help="per action")
+    parser.add_argument("--sqlite", default=None)
+    parser.add_argument("--frappe-json", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.sqlite and not args.frappe_json:
+        parser.error("Expected --sqlite and/or --frappe-json")
+
+    users = generate_users(
+        args.users, args.actions, args.log_entries, args.messages, args.seed
+    )
+
+    if args.sqlite:
+        write_sqlite(args.sqlite, users)
+        print(f"Wrote {len(users)} users to {args.sqlite}")
+
+    if args.frappe_json:
+        with open(args.frappe_json, "w") as f:
+            json.dump([to_frappe_profile(user) for user in users], f)
+        print(f"Wrote {len(users)} profiles to {args.frappe_json}")
+
+
+if __name__ == "__main__":
+    main()
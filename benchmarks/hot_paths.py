@@ -0,0 +1,268 @@
+"""
+Micro-benchmarks of the functions whose cost grows with the history of a student, at
+several sizes of synthetic users (see generate_data.py):
+
+    frappe_portfolio         frappe.convert_frappe_profile_to_portfolio, per action and log entry
+    db_portfolio             db.get_user_portfolio, per row read
+    detail_chat_history      ai.transform_raw_chat_history_for_detail_action_chat, per message
+    action_pipeline_check    ai.chat_history_allows_action_pipeline, per message
+
+Fails (exit code 1) on a regression, when either
+
+- the time at a size is more than --tolerance above the baseline committed in
+  benchmarks/fixtures/hot_paths_baseline.json, or
+- the time grows faster with the size than --max-growth-exponent allows (1 is linear).
+
+Times are compared in units of a fixed pure Python workload timed right before each
+benchmark, so that the baseline holds on machines faster or slower than the one it was
+saved on, and as the fastest round, which noise from other processes can only make
+slower. After an
+intended change, save a new baseline with --save-baseline and commit it.
+
+    python benchmarks/hot_paths.py [--rounds 7] [--tolerance 0.5] [--max-growth-exponent 1.5]
+        [--baseline benchmarks/fixtures/hot_paths_baseline.json] [--save-baseline]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, "src"))
+sys.path.insert(0, os.path.join(root_dir, "benchmarks"))
+
+import db  # noqa: E402
+from ai import (  # noqa: E402
+    transform_raw_chat_history_for_detail_action_chat,
+    chat_history_allows_action_pipeline,
+)
+from frappe import convert_frappe_profile_to_portfolio  # noqa: E402
+from models import ChatMode  # noqa: E402
+from generate_data import generate_user, to_frappe_profile, write_sqlite  # noqa: E402
+
+# actions, log entries and messages per action of a user
+sizes = {
+    "small": (10, 40, 10),
+    "medium": (40, 160, 40),
+    "large": (160, 640, 160),
+}
+
+default_baseline_path = os.path.join(
+    root_dir, "benchmarks", "fixtures", "hot_paths_baseline.json"
+)
+
+# keeps a round long enough for the clock to measure the fast functions
+min_round_seconds = 0.02
+
+
+def time_per_call(function, rounds: int) -> dict:
+    """Runs `function` in rounds of as many calls as take `min_round_seconds`."""
+    number = 1
+    while True:
+        started_at = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - started_at
+
+        if elapsed >= min_round_seconds:
+            break
+
+        number *= 2
+
+    timings = [elapsed / number]
+    for _ in range(rounds - 1):
+        started_at = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - started_at) / number)
+
+    return {
+        "min_ms": min(timings) * 1000,
+        "median_ms": statistics.median(timings) * 1000,
+    }
+
+
+def calibration_workload():
+    """Dict, string and list work like that of the benchmarks, independent of the service."""
+    rows = [{"id": index, "text": f"message {index}" * 4} for index in range(200)]
+    json.loads(json.dumps(sorted(rows, key=lambda row: row["text"])))
+
+
+def get_detail_chat_history(chat_history: list) -> list:
+    """The chat history as the detail chat passes it on, see ai.start_detail_action_chat_stream."""
+    return [
+        {**message, "mode": ChatMode.BASIC, "content": message["text"]}
+        for message in chat_history
+    ]
+
+
+def run_benchmarks(rounds: int, database_path: str) -> dict:
+    rng = random.Random(0)
+    users = {
+        size: generate_user(rng, index, *sizes[size])
+        for index, size in enumerate(sizes)
+    }
+
+    write_sqlite(database_path, list(users.values()))
+
+    # the event loop is kept across calls, as in the service
+    loop = asyncio.new_event_loop()
+    results = {}
+
+    for size, user in users.items():
+        frappe_profile = to_frappe_profile(user)
+        chat_history = loop.run_until_complete(
+            db.get_action_chat_history(user["actions"][0]["uuid"])
+        )
+        detail_chat_history = get_detail_chat_history(chat_history)
+
+        benchmarks = {
+            "frappe_portfolio": (
+                len(user["actions"]) + len(user["log_entries"]),
+                lambda: convert_frappe_profile_to_portfolio(frappe_profile),
+            ),
+            "db_portfolio": (
+                sum(1 + len(action["chat_history"]) for action in user["actions"])
+                + len(user["log_entries"]),
+                lambda: loop.run_until_complete(
+                    db.get_user_portfolio(user["username"])
+                ),
+            ),
+            "detail_chat_history": (
+                len(chat_history),
+                lambda: transform_raw_chat_history_for_detail_action_chat(
+                    detail_chat_history
+                ),
+            ),
+            "action_pipeline_check": (
+                len(chat_history),
+                lambda: chat_history_allows_action_pipeline(chat_history),
+            ),
+        }
+
+        for benchmark, (n, function) in benchmarks.items():
+            # timed next to each other, so that both see the same load of the machine
+            calibration_ms = time_per_call(calibration_workload, rounds)["min_ms"]
+            results.setdefault(benchmark, {})[size] = {
+                "n": n,
+                **time_per_call(function, rounds),
+                "calibration_ms": calibration_ms,
+            }
+
+    loop.close()
+    return results
+
+
+def get_relative_time(timing: dict) -> float:
+    return timing["min_ms"] / timing["calibration_ms"]
+
+
+def get_growth_exponent(timings: dict) -> float:
+    """The exponent k of time ~ n^k between the smallest and the largest size."""
+    by_n = sorted(timings.values(), key=lambda timing: timing["n"])
+    smallest, largest = by_n[0], by_n[-1]
+
+    return math.log(largest["min_ms"] / smallest["min_ms"]) / math.log(
+        largest["n"] / smallest["n"]
+    )
+
+
+def get_baseline_time(baseline: dict | None, benchmark: str, size: str) -> float | None:
+    """The time of a benchmark at a size in the baseline, in units of its calibration."""
+    timing = ((baseline or {}).get(benchmark) or {}).get(size)
+    if not timing:
+        return None
+
+    return get_relative_time(timing)
+
+
+def find_regressions(
+    results: dict, baseline: dict | None, tolerance: float, max_growth_exponent: float
+) -> list:
+    regressions = []
+
+    for benchmark, timings in results.items():
+        growth_exponent = get_growth_exponent(timings)
+        if growth_exponent > max_growth_exponent:
+            regressions.append(
+                f"{benchmark}: grows as n^{growth_exponent:.2f}, more than n^{max_growth_exponent}"
+            )
+
+        for size, timing in timings.items():
+            baseline_time = get_baseline_time(baseline, benchmark, size)
+            relative_time = get_relative_time(timing)
+
+            if baseline_time and relative_time > baseline_time * (1 + tolerance):
+                regressions.append(
+                    f"{benchmark} ({size}): {timing['min_ms']:.4f}ms, "
+                    f"{(relative_time / baseline_time - 1) * 100:+.0f}% over the baseline"
+                )
+
+    return regressions
+
+
+def print_results(results: dict, baseline: dict | None):
+    print(f"{'benchmark':<24} {'size':<8} {'n':>6} {'min ms':>10} {'median ms':>10} {'vs baseline':>12}")
+
+    for benchmark, timings in results.items():
+        for size, timing in timings.items():
+            baseline_time = get_baseline_time(baseline, benchmark, size)
+            change = (
+                f"{(get_relative_time(timing) / baseline_time - 1) * 100:+.0f}%"
+                if baseline_time
+                else ""
+            )
+
+            print(
+                f"{benchmark:<24} {size:<8} {timing['n']:>6} {timing['min_ms']:>10.4f} "
+                f"{timing['median_ms']:>10.4f} {change:>12}"
+            )
+
+        print(f"{'':<24} grows as n^{get_growth_exponent(timings):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--max-growth-exponent", type=float, default=1.5)
+    parser.add_argument("--baseline", default=default_baseline_path)
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results = run_benchmarks(args.rounds, os.path.join(temp_dir, "db.sqlite"))
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    regressions = find_regressions(
+        results, baseline, args.tolerance, args.max_growth_exponent
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
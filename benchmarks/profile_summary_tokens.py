@@ -0,0 +1,127 @@
+"""
+Compares the prompt tokens of a profile summary for synthetic users of growing history
+(see generate_data.py) before and after summaries were built from action digests:
+
+- before: every action, with the relevance text of each of its skills, in the prompt
+- first summary: the aggregates and the digests of the most recent actions
+- update: the aggregates, the previous summary and the digests of the actions that are
+  new or changed since it, here the one action added after the first summary
+
+Counts the user prompt only, the system prompt is the same for every summary. Runs
+offline, without calling the OpenAI API.
+
+    python benchmarks/profile_summary_tokens.py [--actions 10 50 300]
+        [--log-entries-per-action 4] [--seed 0]
+"""
+
+import argparse
+import os
+import random
+import sys
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, "src"))
+sys.path.insert(0, os.path.join(root_dir, "benchmarks"))
+
+from frappe import convert_frappe_profile_to_portfolio  # noqa: E402
+from generate_data import generate_text, generate_user, to_frappe_profile  # noqa: E402
+from summaries import build_profile_summary_prompt, compose_action_digest  # noqa: E402
+from tokens import count_tokens, get_tokenizer_name  # noqa: E402
+
+today = "2026-10-19"
+
+
+def get_portfolio_actions(user: dict) -> tuple:
+    portfolio = convert_frappe_profile_to_portfolio(to_frappe_profile(user))
+    actions = sorted(
+        portfolio["actions"],
+        key=lambda action: action.get("created_at") or "",
+        reverse=True,
+    )
+
+    return portfolio["first_name"], actions
+
+
+def build_full_history_prompt(first_name: str, actions: list) -> str:
+    """The prompt summaries were built from before digests."""
+    all_actions = [
+        {
+            "title": action["title"],
+            "description": action["description"],
+            "hours_invested": action["hours_invested"],
+            "category": action["category"],
+            "type": action["type"],
+            "skills": [
+                {
+                    "name": skill["name"],
+                    "label": skill["label"],
+                    "relevance": skill["relevance"],
+                }
+                for skill in action["skills"]
+            ],
+        }
+        for action in actions
+    ]
+    total_hours_invested = sum(action["hours_invested"] for action in actions)
+
+    return f"user name: {first_name}\ntotal hours invested: {total_hours_invested}\ntotal number of actions: {len(actions)}\ntoday's date: {today}\nall_actions: {all_actions}"
+
+
+def count_summary_tokens(
+    num_actions: int, log_entries_per_action: int, seed: int
+) -> dict:
+    # one more action than the first summary saw, added before the update
+    user = generate_user(
+        random.Random(seed),
+        0,
+        num_actions + 1,
+        (num_actions + 1) * log_entries_per_action,
+        0,
+    )
+    first_name, actions = get_portfolio_actions(user)
+    new_action, previous_actions = actions[0], actions[1:]
+
+    first_summary_prompt = build_profile_summary_prompt(
+        first_name,
+        previous_actions,
+        {action["uuid"]: compose_action_digest(action) for action in previous_actions},
+        today,
+    )
+    # a summary of the length the template asks for
+    previous_summary = generate_text(random.Random(seed), 90)
+    update_prompt = build_profile_summary_prompt(
+        first_name,
+        actions,
+        {new_action["uuid"]: compose_action_digest(new_action)},
+        today,
+        previous_summary,
+    )
+
+    return {
+        "before": count_tokens(build_full_history_prompt(first_name, actions)),
+        "first_summary": count_tokens(first_summary_prompt),
+        "update": count_tokens(update_prompt),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, nargs="+", default=[10, 50, 300])
+    parser.add_argument("--log-entries-per-action", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"prompt tokens per summary ({get_tokenizer_name()}):")
+    print(f"{'actions':>8} {'before':>8} {'first':>8} {'update':>8}")
+
+    for num_actions in args.actions:
+        counts = count_summary_tokens(
+            num_actions, args.log_entries_per_action, args.seed
+        )
+        print(
+            f"{num_actions:>8} {counts['before']:>8} {counts['first_summary']:>8} {counts['update']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Counts the prompt tokens of every llm stage for the fixture histories and fails (exit
+code 1) when a stage grows more than --tolerance over the snapshot, e.g. after adding
+to the action types and categories in models.py, which make up much of the schemas of
+the extraction stages, or after editing a system prompt.
+
+The prompts are built by the same functions as in the service, along with the strict
+JSON schema sent as the text format of the structured stages, and counted like the
+service counts them for routing and rate limiting. The *_sync stages send the same
+prompts as the streaming ones. Runs offline, without calling the OpenAI API.
+
+Counts are snapshotted per tiktoken encoding and need the encoding to load; the chars/4
+estimate count_tokens falls back to is too coarse to compare. tests/test_prompt_tokens.py
+runs the same check. After an intended change, update the snapshot:
+
+    python benchmarks/prompt_tokens.py [--tolerance 0.05] [--update]
+        [--fixtures benchmarks/fixtures/prompt_histories.json]
+        [--snapshot benchmarks/fixtures/prompt_tokens_snapshot.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, "src"))
+
+from ai import (  # noqa: E402
+    AIChatOutput,
+    ActionMetadataOutput,
+    ActionClassification,
+    build_basic_action_chat_input,
+    build_detail_action_chat_input,
+    build_action_metadata_input,
+    build_action_classification_input,
+    build_action_subclassification_input,
+    build_skill_relevance_input,
+    build_profile_summary_input,
+    estimate_structured_prompt_tokens,
+    get_action_subclassification_model,
+    get_chat_history_window,
+    get_skill_relevance_output_model,
+    transform_raw_chat_history_for_detail_action_chat,
+)
+from frappe import convert_frappe_profile_to_portfolio  # noqa: E402
+from llm import count_schema_tokens  # noqa: E402
+from models import ChatMode  # noqa: E402
+from summaries import build_profile_summary_prompt, compose_action_digest  # noqa: E402
+from tokens import count_tokens, get_tokenizer_name  # noqa: E402
+from utils import extract_skill_from_action_type, get_action_type_group  # noqa: E402
+
+
+def get_history_prompts(fixture: dict) -> dict:
+    """The input and the response model (None for plain text) of each stage for a history."""
+    chat_history = fixture["chat_history"]
+
+    detail_chat_history = transform_raw_chat_history_for_detail_action_chat(
+        [{**message, "mode": ChatMode.BASIC} for message in chat_history]
+        + fixture["detail_turns"]
+        + [{"role": "user", "content": fixture["last_detail_message"]}]
+    )
+
+    return {
+        "basic_action_chat": (
+            build_basic_action_chat_input(
+                get_chat_history_window(
+                    chat_history
+                    + [{"role": "user", "content": fixture["last_user_message"]}],
+                    "basic_action_chat",
+                )
+            ),
+            AIChatOutput,
+        ),
+        "detail_action_chat": (
+            build_detail_action_chat_input(
+                get_chat_history_window(
+                    detail_chat_history, "detail_action_chat", num_pinned_messages=1
+                )
+            ),
+            AIChatOutput,
+        ),
+        "action_metadata": (
+            build_action_metadata_input(chat_history),
+            ActionMetadataOutput,
+        ),
+        "action_classification": (
+            build_action_classification_input(chat_history),
+            ActionClassification,
+        ),
+        "action_subclassification": (
+            build_action_subclassification_input(
+                chat_history,
+                get_action_type_group(fixture["action_type"]),
+                fixture["action_category"],
+            ),
+            get_action_subclassification_model(
+                fixture["action_category"],
+                get_action_type_group(fixture["action_type"]),
+            ),
+        ),
+        "skill_relevance": (
+            build_skill_relevance_input(chat_history, fixture["action_type"]),
+            get_skill_relevance_output_model(
+                tuple(sorted(extract_skill_from_action_type(fixture["action_type"])))
+            ),
+        ),
+    }
+
+
+def get_profile_prompts(fixture: dict) -> dict:
+    portfolio = convert_frappe_profile_to_portfolio(fixture["frappe_profile"])
+    actions = sorted(
+        portfolio["actions"],
+        key=lambda action: action.get("created_at") or "",
+        reverse=True,
+    )
+
+    return {
+        "profile_summary": (
+            build_profile_summary_input(
+                build_profile_summary_prompt(
+                    portfolio["first_name"],
+                    actions,
+                    {
+                        action["uuid"]: compose_action_digest(action)
+                        for action in actions
+                    },
+                    fixture["today"],
+                )
+            ),
+            None,
+        )
+    }
+
+
+def count_prompt_tokens(input: list, text_format) -> dict:
+    if text_format is None:
+        return {"total": count_tokens(json.dumps(input)), "schema": 0}
+
+    return {
+        "total": estimate_structured_prompt_tokens(input, text_format),
+        "schema": count_schema_tokens(text_format),
+    }
+
+
+def count_stage_tokens(fixtures: dict) -> dict:
+    """Tokens per stage and fixture."""
+    counts = {}
+
+    prompts = [
+        (fixture["name"], get_history_prompts(fixture))
+        for fixture in fixtures["histories"]
+    ] + [
+        (fixture["name"], get_profile_prompts(fixture))
+        for fixture in fixtures["profiles"]
+    ]
+
+    for name, stage_prompts in prompts:
+        for stage, (input, text_format) in stage_prompts.items():
+            counts.setdefault(stage, {})[name] = count_prompt_tokens(input, text_format)
+
+    return counts
+
+
+def find_regressions(counts: dict, snapshot: dict, tolerance: float) -> list:
+    regressions = []
+
+    for stage, fixture_counts in counts.items():
+        for name, count in fixture_counts.items():
+            snapshot_count = snapshot.get(stage, {}).get(name)
+            if snapshot_count is None:
+                continue
+
+            if count["total"] > snapshot_count["total"] * (1 + tolerance):
+                regressions.append(
+                    f"{stage} ({name}): {count['total']} tokens, "
+                    f"{(count['total'] / snapshot_count['total'] - 1) * 100:+.1f}% over the snapshot of {snapshot_count['total']}"
+                )
+
+    return regressions
+
+
+def print_counts(counts: dict, snapshot: dict):
+    print(f"{'stage':<26} {'fixture':<10} {'tokens':>8} {'schema':>8} {'snapshot':>9} {'change':>8}")
+
+    for stage, fixture_counts in counts.items():
+        for name, count in fixture_counts.items():
+            snapshot_count = snapshot.get(stage, {}).get(name)
+            if snapshot_count is None:
+                previous, change = "new", ""
+            else:
+                previous = str(snapshot_count["total"])
+                change = f"{(count['total'] / snapshot_count['total'] - 1) * 100:+.1f}%"
+
+            print(
+                f"{stage:<26} {name:<10} {count['total']:>8} {count['schema']:>8} "
+                f"{previous:>9} {change:>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--fixtures",
+        default=os.path.join(root_dir, "benchmarks", "fixtures", "prompt_histories.json"),
+    )
+    parser.add_argument(
+        "--snapshot",
+        default=os.path.join(
+            root_dir, "benchmarks", "fixtures", "prompt_tokens_snapshot.json"
+        ),
+    )
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--update", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.fixtures) as f:
+        fixtures = json.load(f)
+
+    snapshots = {}
+    if os.path.exists(args.snapshot):
+        with open(args.snapshot) as f:
+            snapshots = json.load(f)
+
+    tokenizer = get_tokenizer_name()
+    if tokenizer == "estimate":
+        print("The tiktoken encoding could not be loaded, prompt tokens cannot be counted")
+        sys.exit(1)
+
+    counts = count_stage_tokens(fixtures)
+    snapshot = snapshots.get(tokenizer, {})
+
+    print(f"Tokenizer: {tokenizer}")
+    print_counts(counts, snapshot)
+
+    if args.update:
+        snapshots[tokenizer] = counts
+        with open(args.snapshot, "w") as f:
+            json.dump(snapshots, f, indent=4)
+        print(f"Snapshot written to {args.snapshot}")
+        return
+
+    if not snapshot:
+        print(f"No snapshot for the {tokenizer} tokenizer, create it with --update")
+        sys.exit(1)
+
+    regressions = find_regressions(counts, snapshot, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Measures the CPU time spent per call on the response models of the structured LLM
+stages: building each model and its JSON schema on every call, as when the models
+were defined inside the functions, against the cached models and schemas.
+
+Runs offline, without calling the OpenAI API.
+
+    python benchmarks/structured_output_models.py [--iterations 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, "src"))
+
+from pydantic import create_model  # noqa: E402
+from openai.lib._pydantic import to_strict_json_schema  # noqa: E402
+from ai import (  # noqa: E402
+    ActionMetadataOutput,
+    ActionClassification,
+    get_action_subclassification_model,
+    get_skill_relevance_output_model,
+)
+from llm import get_strict_json_schema, count_schema_tokens  # noqa: E402
+from models import ActionType, ActionCategory  # noqa: E402
+from utils import extract_skill_from_action_type, get_action_type_group  # noqa: E402
+
+
+def rebuild_model(model):
+    """A fresh copy of the model, the way a class defined inside a function is rebuilt on every call."""
+    return create_model(
+        model.__name__,
+        **{name: (field.annotation, field) for name, field in model.model_fields.items()},
+    )
+
+
+def get_stages():
+    action_type = ActionType.ATTENDED_AN_OFFLINE_EVENT.value
+    action_category = list(ActionCategory)[0].value
+    action_type_group = get_action_type_group(action_type)
+    skill_names = tuple(sorted(extract_skill_from_action_type(action_type)))
+
+    return {
+        "action_metadata": (
+            lambda: rebuild_model(ActionMetadataOutput),
+            lambda: ActionMetadataOutput,
+        ),
+        "action_classification": (
+            lambda: rebuild_model(ActionClassification),
+            lambda: ActionClassification,
+        ),
+        "action_subclassification": (
+            lambda: get_action_subclassification_model.__wrapped__(
+                action_category, action_type_group
+            ),
+            lambda: get_action_subclassification_model(
+                action_category, action_type_group
+            ),
+        ),
+        "skill_relevance": (
+            lambda: get_skill_relevance_output_model.__wrapped__(skill_names),
+            lambda: get_skill_relevance_output_model(skill_names),
+        ),
+    }
+
+
+def time_per_call(run, num_iterations: int) -> float:
+    started_at = time.perf_counter()
+    for _ in range(num_iterations):
+        run()
+
+    return (time.perf_counter() - started_at) / num_iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    results = {}
+
+    for stage, (build_model, get_model) in get_stages().items():
+
+        def rebuilt():
+            # the schema for the llm cache key and the strict schema for the request
+            model = build_model()
+            model.model_json_schema()
+            to_strict_json_schema(model)
+
+        def cached():
+            model = get_model()
+            get_strict_json_schema(model)
+            count_schema_tokens(model)
+
+        rebuilt_seconds = time_per_call(rebuilt, args.iterations)
+        cached_seconds = time_per_call(cached, args.iterations)
+
+        results[stage] = {
+            "rebuilt_per_call_ms": rebuilt_seconds * 1000,
+            "cached_per_call_ms": cached_seconds * 1000,
+            "saved_per_call_ms": (rebuilt_seconds - cached_seconds) * 1000,
+        }
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
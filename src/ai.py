@@ -1,14 +1,18 @@
 import json
+import hashlib
 import logging
 import asyncio
-from typing import Dict, List
-from fastapi import APIRouter, HTTPException
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field
-from langchain_core.output_parsers import PydanticOutputParser
+from pydantic import BaseModel, Field, create_model
 from llm import (
-    stream_llm_responses_with_instructor,
-    run_llm_responses_with_instructor,
+    stream_llm_responses,
+    run_llm_responses,
+    parse_llm_responses,
+    count_schema_tokens,
+    get_strict_json_schema,
 )
 from models import (
     ChatHistoryMessage,
@@ -22,11 +26,19 @@ from models import (
     DetailActionChatRequest,
     AIUpdateActionMetadataResponse,
     AddChatMessageRequest,
+    Job,
 )
 from typing import Literal
 from datetime import datetime
 from settings import settings
-from utils import extract_skill_from_action_type
+from utils import (
+    action_category_to_subcategories,
+    extract_skill_from_action_type,
+    get_skills_prompt_for_action_type,
+    get_subcategories_for_category,
+    get_action_type_group_names,
+    get_types_for_type_group,
+)
 from frappe import (
     create_or_update_action_on_frappe,
     event_exists,
@@ -37,47 +49,192 @@ from db import (
     get_action_from_uuid,
     update_action_for_user,
     get_action_chat_history,
-    add_messages_to_action_history,
+    insert_messages_into_action_history,
+    get_job,
+    get_job_events,
+    get_profile_summary,
+    upsert_profile_summary,
+    get_action_digests,
+    upsert_action_digests,
+    mark_action_digests_summarized,
+)
+from summaries import (
+    build_profile_summary_prompt,
+    compose_action_digest,
+    get_action_content_hash,
+    profile_summary_max_action_digests,
 )
+from scheduler import LLMPriority
+from jobs import job_handler, enqueue_job
+from pipeline import Stage, run_stage_graph
+from metrics import increment, observe, get_mean
+from chat_streams import start_chat_stream, get_chat_stream, relay_chat_stream
+from tokens import count_tokens
+from history import build_chat_history_window
+from speculation import SpeculativeResults, hash_chat_history
+from llm_cache import run_cached_llm_stage
 from openinference.instrumentation import using_attributes
-from openai import AsyncOpenAI
 from frappe import get_user_portfolio
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+job_events_poll_interval_seconds = 0.5
 
-@router.post("/ai/profile_summary/{username}", response_model=str)
-async def get_user_profile_summary(username: str) -> str:
-    user_portfolio = get_user_portfolio(username)
+# bump when the prompt or the handling of the response of a cached stage changes
+action_metadata_prompt_version = 2
+action_classification_prompt_version = 3
+action_subclassification_prompt_version = 3
+skill_relevance_prompt_version = 2
+
+speculative_action_metadata = SpeculativeResults(
+    "action_metadata",
+    settings.speculative_action_metadata_ttl_seconds,
+    settings.speculative_action_metadata_max_entries,
+)
+
+
+profile_summary_system_prompt = "You are a very sharp, meticulous, diligent and obedient summariser.\n\nYou will be given the totals of the actions a user has taken, the problem areas they acted on most, the skills they showed most along with examples of how they showed them, and a short digest of each of their most recent actions. When you are also given a previous summary of the user, the digests are of the actions that are new or changed since it instead: update the previous summary to fit them and the totals, keeping what still holds.\n\nYou need to generate a short, plain-language summary for the user that is grounded, consistent, and auditable from their action and skill history.\n\nThis is the template to be followed:\n- Mention 2–3 top problem areas the user has acted on.\n- Use plain, everyday phrasing: “worked on issues like [X, Y, Z].\n- State clearly how many actions and hours they’ve invested in the past year.\n- Call out 1–2 top skills, with a simple line on how they showed it.\n\nTone\n- Conversational, easy to read.\n- Neutral but warm, like introducing a peer\n- Short sentences. No jargon\n"
+
+
+def build_profile_summary_input(summary_prompt: str) -> List[Dict]:
+    return [
+        {
+            "role": "system",
+            "content": [
+                {
+                    "type": "input_text",
+                    "text": profile_summary_system_prompt,
+                }
+            ],
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "input_text",
+                    "text": summary_prompt,
+                }
+            ],
+        },
+    ]
+
+
+async def get_digests_for_actions(actions: List[Dict]) -> Dict[str, Dict]:
+    """Digests are stored when an action is extracted; only actions that are new or changed since then get a new one."""
+    stored_digests = await get_action_digests([action["uuid"] for action in actions])
+
+    action_digests = {}
+    new_digests = []
+
+    for action in actions:
+        content_hash = get_action_content_hash(action)
+        stored_digest = stored_digests.get(action["uuid"])
+
+        if stored_digest and stored_digest["content_hash"] == content_hash:
+            action_digests[action["uuid"]] = stored_digest
+            continue
+
+        action_digests[action["uuid"]] = {
+            "content_hash": content_hash,
+            "digest": compose_action_digest(action),
+            "summarized_hash": (
+                stored_digest["summarized_hash"] if stored_digest else None
+            ),
+        }
+        new_digests.append(
+            {"action_uuid": action["uuid"], **action_digests[action["uuid"]]}
+        )
+
+    await upsert_action_digests(new_digests)
+    increment("action_digests_composed", len(new_digests))
 
-    actions = []
+    return action_digests
 
-    total_hours_invested = 0
 
-    for action in user_portfolio["actions"]:
-        action_skills = [
+async def store_action_digest(action: Dict):
+    await upsert_action_digests(
+        [
             {
-                "name": skill["name"],
-                "label": skill["label"],
-                "relevance": skill["relevance"],
+                "action_uuid": action["uuid"],
+                "content_hash": get_action_content_hash(action),
+                "digest": compose_action_digest(action),
             }
-            for skill in action["skills"]
         ]
-        actions.append(
+    )
+
+
+@router.post("/ai/profile_summary/{username}", response_model=str)
+async def get_user_profile_summary(username: str) -> str:
+    # the frappe client is blocking, keep it off the event loop serving chat streams
+    user_portfolio = await asyncio.to_thread(get_user_portfolio, username)
+
+    # most recent first, so that the digests that make it into the prompt are the latest ones
+    actions = sorted(
+        user_portfolio["actions"],
+        key=lambda action: action.get("created_at") or "",
+        reverse=True,
+    )
+
+    action_digests = await get_digests_for_actions(actions)
+
+    # nothing the summary is based on has changed since it was last generated
+    input_hash = hashlib.sha256(
+        json.dumps(
             {
-                "title": action["title"],
-                "description": action["description"],
-                "hours_invested": action["hours_invested"],
-                "category": action["category"],
-                "type": action["type"],
-                "skills": action_skills,
-            }
-        )
-        total_hours_invested += action["hours_invested"]
+                "first_name": user_portfolio["first_name"],
+                "actions": [
+                    [
+                        action["uuid"],
+                        action_digests[action["uuid"]]["digest"],
+                        action["hours_invested"],
+                    ]
+                    + [skill.get("relevance") for skill in action["skills"]]
+                    for action in actions
+                ],
+            },
+            default=str,
+        ).encode()
+    ).hexdigest()
+    profile_summary = await get_profile_summary(username)
+    if profile_summary and profile_summary["input_hash"] == input_hash:
+        increment("profile_summary_skipped")
+        return profile_summary["summary"]
+
+    changed_action_uuids = [
+        action_uuid
+        for action_uuid, action_digest in action_digests.items()
+        if action_digest["summarized_hash"] != action_digest["content_hash"]
+    ]
 
-    client = AsyncOpenAI(api_key=settings.openai_api_key)
+    # the previous summary is updated with the actions that are new or changed since it,
+    # the aggregates cover the rest; otherwise it is written again from the most recent ones
+    if (
+        profile_summary
+        and len(changed_action_uuids) <= profile_summary_max_action_digests
+    ):
+        digests = {
+            action_uuid: action_digests[action_uuid]["digest"]
+            for action_uuid in changed_action_uuids
+        }
+        previous_summary = profile_summary["summary"]
+        increment("profile_summary_updated")
+    else:
+        digests = {
+            action_uuid: action_digest["digest"]
+            for action_uuid, action_digest in action_digests.items()
+        }
+        previous_summary = None
+
+    summary_prompt = build_profile_summary_prompt(
+        user_portfolio["first_name"],
+        actions,
+        digests,
+        datetime.now().strftime("%Y-%m-%d"),
+        previous_summary,
+    )
+    observe("profile_summary_prompt_tokens", count_tokens(summary_prompt))
 
     with using_attributes(
         metadata={
@@ -85,40 +242,45 @@ async def get_user_profile_summary(username: str) -> str:
             "username": username,
         },
     ):
-        response = await client.responses.create(
-            model="gpt-4.1-2025-04-14",
-            input=[
-                {
-                    "role": "system",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": "You are a very sharp, meticulous, diligent and obedient summariser.\n\nYou will be given the list of actions a user has taken along with the skills that have been extracted for each action along with the reasoning for why each skill was extracted for the corresponding action.\n\nYou need to generate a short, plain-language summary for the user that is grounded, consistent, and auditable from their action and skill history.\n\nThis is the template to be followed:\n- Mention 2–3 top problem areas the user has acted on.\n- Use plain, everyday phrasing: “worked on issues like [X, Y, Z].\n- State clearly how many actions and hours they’ve invested in the past year.\n- Call out 1–2 top skills, with a simple line on how they showed it.\n\nTone\n- Conversational, easy to read.\n- Neutral but warm, like introducing a peer\n- Short sentences. No jargon\n",
-                        }
-                    ],
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": f"user name: {user_portfolio["first_name"]}\ntotal hours invested: {total_hours_invested}\ntotal number of actions: {len(actions)}\ntoday's date: {datetime.now().strftime("%Y-%m-%d")}\nall_actions: {actions}",
-                        }
-                    ],
-                },
-            ],
+        response = await run_llm_responses(
+            api_key=settings.openai_api_key,
+            model=None,
+            input=build_profile_summary_input(summary_prompt),
             temperature=0.1,
             max_output_tokens=2048,
-            store=True,
+            priority=LLMPriority.BACKGROUND,
+            stage="profile_summary",
         )
 
     summary = response.output_text
 
-    update_user_summary(username, summary)
+    await asyncio.to_thread(update_user_summary, username, summary)
+    await upsert_profile_summary(username, input_hash, summary)
+    await mark_action_digests_summarized(
+        [
+            {"action_uuid": action_uuid, "content_hash": action_digest["content_hash"]}
+            for action_uuid, action_digest in action_digests.items()
+        ]
+    )
 
     return summary
 
 
+@job_handler("profile_summary")
+async def profile_summary_job(payload: Dict, report_stage: Callable) -> Dict:
+    return {"summary": await get_user_profile_summary(payload["username"])}
+
+
+async def schedule_user_profile_summary(username: str):
+    """Regenerates the summary in the background once the user has stopped adding or updating actions for a while."""
+    await enqueue_job(
+        "profile_summary",
+        {"username": username},
+        dedup_key=username,
+        debounce_seconds=settings.profile_summary_debounce_seconds,
+    )
+
+
 class AIChatOutput(BaseModel):
     chain_of_thought: str = Field(
         description="Reflect on the chat so far to clearly identify what questions have been answered already and what should be answered in the next question. Reflect on the language used by the student and hence, which language you should be responding in"
@@ -135,40 +297,9 @@ class AIChatOutput(BaseModel):
     )
 
 
-def chat_history_allows_action_pipeline(chat_history: List[Dict]) -> bool:
-    """Uses the latest structured assistant payload. Missing create_action defaults True (legacy chats)."""
-    for message in reversed(chat_history):
-        if message.get("role") != "assistant":
-            continue
-        try:
-            payload = json.loads(message["content"])
-        except (json.JSONDecodeError, TypeError):
-            continue
-        if (
-            isinstance(payload, dict)
-            and "response" in payload
-            and "is_done" in payload
-        ):
-            return bool(payload.get("create_action", True))
-    return True
-
-
-async def get_basic_action_response_from_chat_history(
-    chat_history: List[ChatHistoryMessage], model: str = "gpt-4.1-2025-04-14"
-):
-    with using_attributes(
-        metadata={"stage": "basic_action_chat"},
-    ):
-        return await stream_llm_responses_with_instructor(
-            api_key=settings.openai_api_key,
-            model=model,
-            response_model=AIChatOutput,
-            max_output_tokens=8096,
-            temperature=0.1,
-            input=[
-                {
-                    "role": "system",
-                    "content": """You are a very sharp and thoughtful coach. 
+# the system prompts are kept byte-stable so that the provider can cache them as the
+# prefix of every request of a stage
+basic_action_chat_system_prompt = """You are a very sharp and thoughtful coach. 
 
 A student has submitted an action that they have taken to solve a local problem.
 
@@ -208,153 +339,9 @@ Once you have marked the conversation as done, the accompanying feedback should
 
 ### Style Tip
 - Do not use em-dashes (--) in your replies. Use commas or short phrases instead, as humans naturally do in conversation.
-- It is critical to ask only one question at a time and not include multiple questions in a single response even if those questions are related to each other as the user is from a background where asking more than 1 question can overwhelm them.""",
-                }
-            ]
-            + chat_history,
-        )
-
-
-@router.post("/ai/basic_action_chat_stream", response_model=AIChatResponse)
-async def basic_action_chat_stream(
-    request: BasicActionChatRequest, model: str = "gpt-4.1-2025-04-14"
-):
-    chat_history = await get_action_chat_history(request.action_uuid)
-
-    chat_history = [
-        {
-            "role": message["role"],
-            "content": message["content"],
-        }
-        for message in chat_history
-    ]
-
-    chat_history += [
-        {
-            "role": "user",
-            "content": request.last_user_message,
-        }
-    ]
-
-    async def stream_response():
-        stream = await get_basic_action_response_from_chat_history(chat_history, model)
-        async for chunk in stream:
-            content = json.dumps(chunk.model_dump()) + "\n"
-            yield content
-
-    return StreamingResponse(
-        stream_response(),
-        media_type="application/x-ndjson",
-    )
-
-
-@router.post("/ai/basic_action_chat", response_model=AIChatResponse)
-async def basic_action_chat(request: BasicActionChatRequest):
-    stream = await basic_action_chat_stream(request, model="gpt-4.1-mini-2025-04-14")
-    final_chunk = None
-    async for chunk in stream.body_iterator:
-        final_chunk = chunk
-    response = json.loads(final_chunk)
-
-    await add_messages_to_action_history(
-        request.action_uuid,
-        [
-            AddChatMessageRequest(
-                role="user",
-                content=request.last_user_message,
-                response_type="text",
-            ),
-            AddChatMessageRequest(
-                role="assistant",
-                content=json.dumps(response),
-                response_type="text",
-            ),
-        ],
-    )
+- It is critical to ask only one question at a time and not include multiple questions in a single response even if those questions are related to each other as the user is from a background where asking more than 1 question can overwhelm them."""
 
-    return response
-
-
-def transform_raw_chat_history_for_detail_action_chat(
-    chat_history: Dict,
-) -> Dict:
-    # Find the index where the last message with mode == 'basic' ends
-    last_basic_idx = -1
-    for idx, msg in enumerate(chat_history):
-        if "mode" not in msg or msg["mode"] != ChatMode.BASIC:
-            break
-
-        last_basic_idx = idx
-
-    # Collect all messages with mode == 'basic'
-    basic_msgs = chat_history[: last_basic_idx + 1]
-    reflection_msgs = chat_history[last_basic_idx + 1 :]
-
-    basic_user_response = []
-    prev_ai_message = None
-    for msg in basic_msgs:
-        if msg["role"] == "user":
-            if prev_ai_message is not None:
-                basic_user_response.append(
-                    f'{msg["content"]} (response to "{prev_ai_message}")'
-                )
-            else:
-                basic_user_response.append(msg["content"])
-        else:
-            prev_ai_message = msg["content"]
-
-    basic_user_response = "\n".join(basic_user_response)
-
-    return [
-        {"role": "user", "content": basic_user_response},
-    ] + [{"role": msg["role"], "content": msg["content"]} for msg in reflection_msgs]
-
-
-@router.post("/ai/detail_action_chat_stream", response_model=AIChatResponse)
-async def detail_action_chat_stream(
-    request: DetailActionChatRequest, model: str = "gpt-4.1-2025-04-14"
-):
-    chat_history = await get_action_chat_history(request.action_uuid)
-
-    for message in chat_history:
-        if message["role"] == "analysis":
-            break
-
-        message["mode"] = ChatMode.BASIC
-
-    chat_history = [
-        message for message in chat_history if message["role"] != "analysis"
-    ]
-
-    if not chat_history_allows_action_pipeline(chat_history):
-        raise HTTPException(
-            status_code=400,
-            detail="Detailed reflection requires create_action to be true on the latest coach turn.",
-        )
-
-    chat_history += [
-        {
-            "role": "user",
-            "content": request.last_user_message,
-        }
-    ]
-
-    chat_history = transform_raw_chat_history_for_detail_action_chat(chat_history)
-
-    async def stream_response():
-        with using_attributes(
-            metadata={"stage": "detail_action_chat"},
-        ):
-            stream = await stream_llm_responses_with_instructor(
-                api_key=settings.openai_api_key,
-                model=model,
-                response_model=AIChatOutput,
-                max_output_tokens=8096,
-                temperature=0.1,
-                input=[
-                    {
-                        "role": "system",
-                        "content": """You are a very sharp and thoughtful coach. 
+detail_action_chat_system_prompt = """You are a very sharp and thoughtful coach. 
 
 A student has submitted an action that they have taken to solve a local problem along with some basic details around the action they have taken.
 
@@ -433,35 +420,19 @@ After all questions (default 7–10), end with a motivational summary (e.g. “T
 - Do not ask “Anything else?” or leave the conversation open-ended.
 
 ### Style Tip
-* Do not use em-dashes (--) in your replies. Use commas or short phrases instead, as humans naturally do in conversation.""",
-                    }
-                ]
-                + chat_history,
-            )
-            async for chunk in stream:
-                content = json.dumps(chunk.model_dump()) + "\n"
-                yield content
-
-    return StreamingResponse(
-        stream_response(),
-        media_type="application/x-ndjson",
-    )
+* Do not use em-dashes (--) in your replies. Use commas or short phrases instead, as humans naturally do in conversation."""
 
 
-@router.post("/ai/detail_action_chat", response_model=AIChatResponse)
-async def detail_action_chat(request: DetailActionChatRequest):
-    stream = await detail_action_chat_stream(request, model="gpt-4.1-mini-2025-04-14")
-    final_chunk = None
-    async for chunk in stream.body_iterator:
-        final_chunk = chunk
-    response = json.loads(final_chunk)
-
-    await add_messages_to_action_history(
-        request.action_uuid,
+async def persist_chat_turn(
+    action_uuid: str, last_user_message: str, response: Dict
+) -> Dict:
+    """Stores a completed chat turn and returns the response along with the ids of the stored messages."""
+    user_message_id, assistant_message_id = await insert_messages_into_action_history(
+        action_uuid,
         [
             AddChatMessageRequest(
                 role="user",
-                content=request.last_user_message,
+                content=last_user_message,
                 response_type="text",
             ),
             AddChatMessageRequest(
@@ -472,178 +443,839 @@ async def detail_action_chat(request: DetailActionChatRequest):
         ],
     )
 
-    return response
+    return {
+        **response,
+        "message_ids": {
+            "user": user_message_id,
+            "assistant": assistant_message_id,
+        },
+    }
 
 
-def transform_chat_history_to_prompt(chat_history: List[Dict]) -> str:
-    return "\n".join(
-        [
-            f"{chat_response['role'].capitalize()}: {chat_response['content']}"
-            for chat_response in chat_history
-        ]
-    )
+def record_chat_stream_outcome(stage: str, final_chunk: Dict | None, completed: bool):
+    output_tokens = count_tokens(json.dumps(final_chunk)) if final_chunk else 0
 
+    if completed:
+        observe("chat_stream_output_tokens", output_tokens, stage=stage)
+        return
 
-async def get_action_metadata_from_chat_history(chat_history: List[Dict]):
-    class Output(BaseModel):
-        action_title: str = Field(
-            description="A short title for the action (less than 5 words)"
-        )
-        action_description: str = Field(
-            description="A concise description of the action that the young person took (less than 50 words)"
-        )
-        action_type: ActionType = Field(description="The type of the action")
-        action_subtype: ActionType = Field(description="The subtype of the action")
-        action_category: ActionCategory = Field(
-            description="The category of the action"
-        )
-        action_subcategory: ActionSubCategory = Field(
-            description="The subcategory of the action"
+    increment("chat_stream_cancelled_turns", stage=stage)
+
+    # we can't know how long the answer would have been, so use the
+    # average length of the answers that did complete for this stage
+    expected_output_tokens = get_mean("chat_stream_output_tokens", stage=stage)
+    if expected_output_tokens is not None:
+        increment(
+            "chat_stream_tokens_saved",
+            max(expected_output_tokens - output_tokens, 0),
+            stage=stage,
         )
 
-    parser = PydanticOutputParser(pydantic_object=Output)
-    format_instructions = parser.get_format_instructions()
 
-    system_prompt = f"""Extract the action type, action category, action title and action description from the given conversation history of a young person describing their actions to solve a local civic problem. Use the provided lists to identify the correct action type and category.\n\n# Steps\n\n1. **Review the Conversation:** Thoroughly read the conversation history to understand the actions the young person has described.\n2. **Identify Action Type:** Determine the action type from the conversation, ensuring it aligns with one of the listed action types. Focus on specific verbs or phrases that indicate the nature of the activity.\n3. **Identify Action Category:** Determine the action category based on the topic or area addressed in the conversation. Use the given list to find the most suitable category.\n4. **Ensure Uniqueness:** Each task should conclude with one unique action type and one unique action category.\n\n### Output format\n\n{format_instructions}"""
+async def stream_chat_turn(
+    request: BasicActionChatRequest | DetailActionChatRequest,
+    stream,
+    stage: str,
+    on_complete: Callable[[Dict], None] | None = None,
+):
+    """Turns the upstream chat stream into NDJSON lines, closing the upstream stream if the turn gets cancelled."""
+    final_chunk = None
+    completed = False
 
-    chat_history_prompt = transform_chat_history_to_prompt(chat_history)
+    try:
+        async for chunk in stream:
+            final_chunk = chunk.model_dump()
+            yield json.dumps(final_chunk) + "\n"
 
-    with using_attributes(
-        metadata={"stage": "action_metadata"},
-    ):
-        response = await run_llm_responses_with_instructor(
-            api_key=settings.openai_api_key,
-            # model="gpt-4o-audio-preview-2025-06-03",
-            model="gpt-4.1-2025-04-14",
-            input=[
-                {
-                    "role": "system",
-                    "content": system_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": chat_history_prompt,
-                },
-            ],
-            response_model=Output,
-            max_output_tokens=8096,
-        )
+        completed = True
+    finally:
+        # runs when the chat stream is cancelled after its clients went away;
+        # closing the upstream stream stops pulling tokens from openai
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
 
-    return {
-        "action_title": response.action_title,
-        "action_description": response.action_description,
-        "action_type": response.action_type,
-        "action_category": response.action_category,
-        "action_subcategory": response.action_subcategory,
-        "action_subtype": response.action_subtype,
-    }
+        record_chat_stream_outcome(stage, final_chunk, completed)
 
+    if on_complete and completed and final_chunk is not None:
+        on_complete(final_chunk)
 
-async def get_skills_from_action(
-    chat_history: List[Dict],
-    action_type: ActionType,
-    action_category: ActionCategory | None = None,
-    action_subcategory: ActionSubCategory | None = None,
-    action_subtype: ActionType | None = None,
-    action_title: str | None = None,
-    action_description: str | None = None,
-):
-    skills = extract_skill_from_action_type(action_type)
-    skills = await get_skills_data_from_names(skills)
+    # the last line repeats the final response along with the ids of the stored messages
+    if request.persist and completed and final_chunk is not None:
+        persisted = await persist_chat_turn(
+            request.action_uuid, request.last_user_message, final_chunk
+        )
+        yield json.dumps(persisted) + "\n"
 
-    skills_as_prompt = [
-        {"name": skill["name"], "microskills": skill["microskills"]} for skill in skills
+
+def get_chat_history_window(
+    chat_history: List[Dict], stage: str, num_pinned_messages: int = 0
+) -> List[Dict]:
+    window, token_counts = build_chat_history_window(
+        chat_history,
+        settings.chat_history_token_budget,
+        settings.chat_history_recent_messages,
+        num_pinned_messages,
+    )
+
+    observe("chat_history_input_tokens", token_counts["input_tokens"], stage=stage)
+    observe("chat_history_window_tokens", token_counts["window_tokens"], stage=stage)
+    increment(
+        "chat_history_tokens_saved",
+        token_counts["input_tokens"] - token_counts["window_tokens"],
+        stage=stage,
+    )
+
+    return window
+
+
+def chat_history_allows_action_pipeline(chat_history: List[Dict]) -> bool:
+    """Uses the latest structured assistant turn. Missing create_action defaults True (legacy chats)."""
+    for message in reversed(chat_history):
+        if message.get("role") != "assistant" or message.get("is_done") is None:
+            continue
+
+        if message.get("create_action") is None:
+            return True
+
+        return message["create_action"]
+    return True
+
+
+def get_model_chat_history(chat_history: List[Dict]) -> List[Dict]:
+    """Only the response of a past assistant turn is sent back to the model, not its chain of thought or flags."""
+    return [
+        {
+            "role": message["role"],
+            "content": message["text"],
+        }
+        for message in chat_history
     ]
 
-    class SkillRelevance(BaseModel):
-        skill: str = Field(
-            description="The skill whose relevance to the action needs to be described"
-        )
-        microskill_level: Literal["L1", "L2", "L3", "L4", "L5"] = Field(
-            description="the level of the microskill in this skill that is suitable for the action (L1/L2/L3/L4/L5)"
+
+def build_basic_action_chat_input(chat_history: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "role": "system",
+            "content": basic_action_chat_system_prompt,
+        }
+    ] + chat_history
+
+
+async def get_basic_action_response_from_chat_history(
+    chat_history: List[ChatHistoryMessage],
+    model: str | None = None,
+    stage: str = "basic_action_chat",
+):
+    """Streams from `model` or, when it is None, from the model routed to for the stage."""
+    with using_attributes(
+        metadata={"stage": stage},
+    ):
+        return await stream_llm_responses(
+            api_key=settings.openai_api_key,
+            model=model,
+            text_format=AIChatOutput,
+            max_output_tokens=8096,
+            temperature=0.1,
+            priority=LLMPriority.INTERACTIVE,
+            stage=stage,
+            input=build_basic_action_chat_input(chat_history),
         )
-        relevance: str = Field(
-            description="Concise description of how the skill is relevant to the action based on the chat history; no need to begin with 'The student' or 'The action'; directly describe the skill relevance"
+
+
+@router.post("/ai/basic_action_chat_stream", response_model=AIChatResponse)
+async def basic_action_chat_stream(
+    request: BasicActionChatRequest,
+    http_request: Request,
+    model: str | None = None,
+):
+    return await start_basic_action_chat_stream(
+        request, http_request, model, "basic_action_chat"
+    )
+
+
+async def start_basic_action_chat_stream(
+    request: BasicActionChatRequest,
+    http_request: Request,
+    model: str | None,
+    stage: str,
+):
+    chat_history = get_model_chat_history(
+        await get_action_chat_history(request.action_uuid)
+    )
+
+    chat_history += [
+        {
+            "role": "user",
+            "content": request.last_user_message,
+        }
+    ]
+
+    def speculate_action_metadata(final_chunk: Dict):
+        if not final_chunk.get("is_done") or not final_chunk.get("create_action", True):
+            return
+
+        # the history as it will be once this turn is stored
+        completed_chat_history = chat_history + [
+            {"role": "assistant", "content": final_chunk["response"]}
+        ]
+        speculative_action_metadata.start(
+            hash_chat_history(completed_chat_history),
+            lambda: extract_action_metadata_and_skills(completed_chat_history),
         )
-        response: str = Field(
-            description="Description of the skill relevance, addressed to the student; Always keep this in the same language as the student's last response. This is super important to keep the student engaged and for your response to be understandable by them."
+
+    async def stream_response():
+        stream = await get_basic_action_response_from_chat_history(
+            get_chat_history_window(chat_history, stage), model, stage
         )
+        async for line in stream_chat_turn(
+            request,
+            stream,
+            stage,
+            on_complete=(
+                speculate_action_metadata
+                if settings.speculative_action_metadata
+                else None
+            ),
+        ):
+            yield line
+
+    chat_stream = start_chat_stream(stream_response())
+
+    return StreamingResponse(
+        relay_chat_stream(http_request, chat_stream),
+        media_type="application/x-ndjson",
+        headers={"X-Stream-Id": chat_stream.id},
+    )
+
+
+@router.post("/ai/basic_action_chat", response_model=AIChatResponse)
+async def basic_action_chat(request: BasicActionChatRequest, http_request: Request):
+    stream = await start_basic_action_chat_stream(
+        request.model_copy(update={"persist": False}),
+        http_request,
+        None,
+        "basic_action_chat_sync",
+    )
+    final_chunk = None
+    async for chunk in stream.body_iterator:
+        final_chunk = chunk
+    response = json.loads(final_chunk)
+
+    await persist_chat_turn(request.action_uuid, request.last_user_message, response)
+
+    return response
+
+
+def transform_raw_chat_history_for_detail_action_chat(
+    chat_history: Dict,
+) -> Dict:
+    # Find the index where the last message with mode == 'basic' ends
+    last_basic_idx = -1
+    for idx, msg in enumerate(chat_history):
+        if "mode" not in msg or msg["mode"] != ChatMode.BASIC:
+            break
+
+        last_basic_idx = idx
+
+    # Collect all messages with mode == 'basic'
+    basic_msgs = chat_history[: last_basic_idx + 1]
+    reflection_msgs = chat_history[last_basic_idx + 1 :]
+
+    basic_user_response = []
+    prev_ai_message = None
+    for msg in basic_msgs:
+        if msg["role"] == "user":
+            if prev_ai_message is not None:
+                basic_user_response.append(
+                    f'{msg["content"]} (response to "{prev_ai_message}")'
+                )
+            else:
+                basic_user_response.append(msg["content"])
+        else:
+            prev_ai_message = msg["content"]
+
+    basic_user_response = "\n".join(basic_user_response)
+
+    return [
+        {"role": "user", "content": basic_user_response},
+    ] + [{"role": msg["role"], "content": msg["content"]} for msg in reflection_msgs]
+
+
+def build_detail_action_chat_input(chat_history: List[Dict]) -> List[Dict]:
+    """`chat_history` as transformed by transform_raw_chat_history_for_detail_action_chat."""
+    return [
+        {
+            "role": "system",
+            "content": detail_action_chat_system_prompt,
+        }
+    ] + chat_history
+
 
-    class SkillRelevanceOutput(BaseModel):
-        skill_relevances: List[SkillRelevance] = Field(
-            description="The relevance of the skills to the action"
+@router.post("/ai/detail_action_chat_stream", response_model=AIChatResponse)
+async def detail_action_chat_stream(
+    request: DetailActionChatRequest,
+    http_request: Request,
+    model: str | None = None,
+):
+    return await start_detail_action_chat_stream(
+        request, http_request, model, "detail_action_chat"
+    )
+
+
+async def start_detail_action_chat_stream(
+    request: DetailActionChatRequest,
+    http_request: Request,
+    model: str | None,
+    stage: str,
+):
+    chat_history = await get_action_chat_history(request.action_uuid)
+
+    for message in chat_history:
+        if message["role"] == "analysis":
+            break
+
+        message["mode"] = ChatMode.BASIC
+
+    chat_history = [
+        message for message in chat_history if message["role"] != "analysis"
+    ]
+
+    if not chat_history_allows_action_pipeline(chat_history):
+        raise HTTPException(
+            status_code=400,
+            detail="Detailed reflection requires create_action to be true on the latest coach turn.",
         )
 
-    chat_history_prompt = transform_chat_history_to_prompt(chat_history)
+    chat_history = [
+        {**message, "content": message["text"]} for message in chat_history
+    ]
 
-    client = AsyncOpenAI(api_key=settings.openai_api_key)
+    chat_history += [
+        {
+            "role": "user",
+            "content": request.last_user_message,
+        }
+    ]
 
-    with using_attributes(
-        metadata={
-            "stage": "skill_relevance",
-            "action_type": action_type,
-            "action_category": action_category,
-            "action_subcategory": action_subcategory,
-            "action_subtype": action_subtype,
-            "action_title": action_title,
-            "action_description": action_description,
+    chat_history = transform_raw_chat_history_for_detail_action_chat(chat_history)
+
+    # the first message has everything the student shared in the basic chat
+    chat_history = get_chat_history_window(
+        chat_history, stage, num_pinned_messages=1
+    )
+
+    async def stream_response():
+        with using_attributes(
+            metadata={"stage": stage},
+        ):
+            stream = await stream_llm_responses(
+                api_key=settings.openai_api_key,
+                model=model,
+                text_format=AIChatOutput,
+                max_output_tokens=8096,
+                temperature=0.1,
+                priority=LLMPriority.INTERACTIVE,
+                stage=stage,
+                input=build_detail_action_chat_input(chat_history),
+            )
+            async for line in stream_chat_turn(request, stream, stage):
+                yield line
+
+    chat_stream = start_chat_stream(stream_response())
+
+    return StreamingResponse(
+        relay_chat_stream(http_request, chat_stream),
+        media_type="application/x-ndjson",
+        headers={"X-Stream-Id": chat_stream.id},
+    )
+
+
+@router.get("/ai/chat_stream/{stream_id}")
+async def resume_chat_stream(stream_id: str, http_request: Request, offset: int = 0):
+    """Resumes a basic or detail chat stream from the given line offset, replaying the latest line if the client missed any."""
+    chat_stream = get_chat_stream(stream_id)
+
+    if chat_stream is None:
+        raise HTTPException(status_code=404, detail="Chat stream not found or expired")
+
+    increment("chat_stream_resumes")
+
+    return StreamingResponse(
+        relay_chat_stream(http_request, chat_stream, offset),
+        media_type="application/x-ndjson",
+        headers={"X-Stream-Id": chat_stream.id},
+    )
+
+
+@router.post("/ai/detail_action_chat", response_model=AIChatResponse)
+async def detail_action_chat(request: DetailActionChatRequest, http_request: Request):
+    stream = await start_detail_action_chat_stream(
+        request.model_copy(update={"persist": False}),
+        http_request,
+        None,
+        "detail_action_chat_sync",
+    )
+    final_chunk = None
+    async for chunk in stream.body_iterator:
+        final_chunk = chunk
+    response = json.loads(final_chunk)
+
+    await persist_chat_turn(request.action_uuid, request.last_user_message, response)
+
+    return response
+
+
+def transform_chat_history_to_prompt(chat_history: List[Dict]) -> str:
+    return "\n".join(
+        [
+            f"{chat_response['role'].capitalize()}: {chat_response['content']}"
+            for chat_response in chat_history
+        ]
+    )
+
+
+class ActionMetadataOutput(BaseModel):
+    action_title: str = Field(
+        description="A short title for the action (less than 5 words)"
+    )
+    action_description: str = Field(
+        description="A concise description of the action that the young person took (less than 50 words)"
+    )
+    action_type: ActionType = Field(description="The type of the action")
+    action_subtype: ActionType = Field(description="The subtype of the action")
+    action_category: ActionCategory = Field(description="The category of the action")
+    action_subcategory: ActionSubCategory = Field(
+        description="The subcategory of the action"
+    )
+
+
+class ActionClassification(BaseModel):
+    action_title: str = Field(
+        description="A short title for the action (less than 5 words)"
+    )
+    action_description: str = Field(
+        description="A concise description of the action that the young person took (less than 50 words)"
+    )
+    # the kinds of action and the category names, the type is only picked out of the
+    # types of the kind once it is known
+    action_type_group: Literal[tuple(get_action_type_group_names())] = Field(
+        description="The kind of action"
+    )
+    action_category: Literal[tuple(action_category_to_subcategories)] = Field(
+        description="The category of the action"
+    )
+
+
+action_metadata_system_prompt = """Extract the action type, action category, action title and action description from the given conversation history of a young person describing their actions to solve a local civic problem. Use the provided lists to identify the correct action type and category.\n\n# Steps\n\n1. **Review the Conversation:** Thoroughly read the conversation history to understand the actions the young person has described.\n2. **Identify Action Type:** Determine the action type from the conversation, ensuring it aligns with one of the listed action types. Focus on specific verbs or phrases that indicate the nature of the activity.\n3. **Identify Action Category:** Determine the action category based on the topic or area addressed in the conversation. Use the given list to find the most suitable category.\n4. **Ensure Uniqueness:** Each task should conclude with one unique action type and one unique action category."""
+
+action_classification_system_prompt = """Extract the kind of action, action category, action title and action description from the given conversation history of a young person describing their actions to solve a local civic problem.\n\n# Steps\n\n1. **Review the Conversation:** Thoroughly read the conversation history to understand the actions the young person has described.\n2. **Identify the Kind of Action:** Determine the kind of action from the conversation, ensuring it aligns with one of the allowed kinds. Focus on specific verbs or phrases that indicate the nature of the activity.\n3. **Identify Action Category:** Determine the action category based on the topic or area addressed in the conversation, picking the most suitable of the allowed categories.\n4. **Ensure Uniqueness:** Each task should conclude with one unique kind of action and one unique action category."""
+
+action_subclassification_system_prompt = "Given the conversation history of a young person describing their actions to solve a local civic problem, along with the kind of action and the category already identified for it, pick the type, the subtype and the subcategory that describe the action most specifically out of the allowed ones."
+
+skill_relevance_system_prompt = "Analyze a student's action and the corresponding conversation history to provide a personalized, one-line description of how each listed skill is demonstrated in that context as 2 fields for each skill: `relevance`, for a person viewing the student's action; `response`, for the student.\n\nAlong with that, you will be given a list of different levels of the skill (called microskills). Based on the action conversation history, identify the highest level of microskill in each skill demonstrated by the user which is grounded in the conversation history.\n\nReview the conversation thoroughly and connect specific elements of it to the skills listed. Each description should clearly link an aspect of the conversation to the demonstration of a particular skill.\n\n# Examples\n\n**Example** (shortened for illustration purposes; real examples should detail specific parts of the conversation):\n- **Problem-Solving**: The student's question about alternative solutions shows proactive engagement.\n\n- **Communication**: The clear explanation of their thought process demonstrates effective communication.\n\n- **Critical Thinking**: The student’s questioning of assumptions indicates critical evaluation of information.\n\n# Notes\n\nConsider nuances such as tone, clarity, and depth of the conversation that might subtly demonstrate skills. Each description should be crafted to reflect both the conversation content and the student’s unique expression of the skill."
+
+
+@lru_cache(maxsize=256)
+def get_action_subclassification_model(
+    action_category: str, action_type_group: str
+) -> type[BaseModel]:
+    """Only allows the subcategories that go with the category and the types of the kind of action."""
+    action_types = Literal[tuple(get_types_for_type_group(action_type_group))]
+
+    return create_model(
+        "ActionSubclassification",
+        action_type=(action_types, Field(description="The type of the action")),
+        action_subtype=(action_types, Field(description="The subtype of the action")),
+        action_subcategory=(
+            Literal[tuple(get_subcategories_for_category(action_category))],
+            Field(description="The subcategory of the action"),
+        ),
+    )
+
+
+@lru_cache(maxsize=256)
+def get_skill_relevance_output_model(skill_names: Tuple[str, ...]) -> type[BaseModel]:
+    """The output for the skills of an action type, which only allows the names of those skills."""
+    SkillRelevance = create_model(
+        "SkillRelevance",
+        skill=(
+            Literal[skill_names] if skill_names else str,
+            Field(
+                description="The skill whose relevance to the action needs to be described"
+            ),
+        ),
+        microskill_level=(
+            Literal["L1", "L2", "L3", "L4", "L5"],
+            Field(
+                description="the level of the microskill in this skill that is suitable for the action (L1/L2/L3/L4/L5)"
+            ),
+        ),
+        relevance=(
+            str,
+            Field(
+                description="Concise description of how the skill is relevant to the action based on the chat history; no need to begin with 'The student' or 'The action'; directly describe the skill relevance"
+            ),
+        ),
+        response=(
+            str,
+            Field(
+                description="Description of the skill relevance, addressed to the student; Always keep this in the same language as the student's last response. This is super important to keep the student engaged and for your response to be understandable by them."
+            ),
+        ),
+    )
+
+    return create_model(
+        "SkillRelevanceOutput",
+        skill_relevances=(
+            List[SkillRelevance],
+            Field(description="The relevance of the skills to the action"),
+        ),
+    )
+
+
+def build_action_metadata_input(chat_history: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "role": "system",
+            "content": action_metadata_system_prompt,
         },
-    ):
-        skill_relevance_response = await client.responses.parse(
-            model="gpt-4.1-2025-04-14",
-            input=[
+        {
+            "role": "user",
+            "content": transform_chat_history_to_prompt(chat_history),
+        },
+    ]
+
+
+def build_action_classification_input(chat_history: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "role": "system",
+            "content": action_classification_system_prompt,
+        },
+        {
+            "role": "user",
+            "content": transform_chat_history_to_prompt(chat_history),
+        },
+    ]
+
+
+def build_action_subclassification_input(
+    chat_history: List[Dict], action_type_group: str, action_category: str
+) -> List[Dict]:
+    return [
+        {
+            "role": "system",
+            "content": action_subclassification_system_prompt,
+        },
+        {
+            "role": "user",
+            "content": f"Kind of action: {action_type_group}\nAction category: {action_category}\nConversation history:\n{transform_chat_history_to_prompt(chat_history)}",
+        },
+    ]
+
+
+def build_skill_relevance_input(
+    chat_history: List[Dict], action_type: ActionType | str
+) -> List[Dict]:
+    return [
+        {
+            "role": "system",
+            "content": [
                 {
-                    "role": "system",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": "Analyze a student's action and the corresponding conversation history to provide a personalized, one-line description of how each listed skill is demonstrated in that context as 2 fields for each skill: `relevance`, for a person viewing the student's action; `response`, for the student.\n\nAlong with that, you will be given a list of different levels of the skill (called microskills). Based on the action conversation history, identify the highest level of microskill in each skill demonstrated by the user which is grounded in the conversation history.\n\nReview the conversation thoroughly and connect specific elements of it to the skills listed. Each description should clearly link an aspect of the conversation to the demonstration of a particular skill.\n\n# Examples\n\n**Example** (shortened for illustration purposes; real examples should detail specific parts of the conversation):\n- **Problem-Solving**: The student's question about alternative solutions shows proactive engagement.\n\n- **Communication**: The clear explanation of their thought process demonstrates effective communication.\n\n- **Critical Thinking**: The student’s questioning of assumptions indicates critical evaluation of information.\n\n# Notes\n\nConsider nuances such as tone, clarity, and depth of the conversation that might subtly demonstrate skills. Each description should be crafted to reflect both the conversation content and the student’s unique expression of the skill.",
-                        }
-                    ],
-                },
+                    "type": "input_text",
+                    "text": skill_relevance_system_prompt,
+                }
+            ],
+        },
+        {
+            "role": "user",
+            "content": [
                 {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "input_text",
-                            "text": f"Conversation history:\n```\n{chat_history_prompt}\n```\nSkills:\n```\n{skills_as_prompt}\n```",
-                        }
-                    ],
-                },
+                    "type": "input_text",
+                    # the skills of an action type come before the conversation, which
+                    # differs for every request, so that they are part of the cached prefix
+                    "text": f"Skills:\n```\n{get_skills_prompt_for_action_type(action_type)}\n```\nConversation history:\n```\n{transform_chat_history_to_prompt(chat_history)}\n```",
+                }
             ],
-            temperature=0,
-            text_format=SkillRelevanceOutput,
-            store=True,
-            max_output_tokens=8096,
+        },
+    ]
+
+
+def estimate_structured_prompt_tokens(input: List[Dict], text_format) -> int:
+    """The input messages plus the strict response schema, which is sent along as the text format."""
+    return count_tokens(json.dumps(input)) + count_schema_tokens(text_format)
+
+
+async def get_action_metadata_from_chat_history(
+    chat_history: List[Dict], use_cache: bool = True, mode: str | None = None
+) -> Dict:
+    mode = mode or settings.action_metadata_extraction_mode
+
+    if mode == "two_stage":
+        return await get_action_metadata_in_two_stages(chat_history, use_cache)
+
+    return await get_action_metadata_in_single_stage(chat_history, use_cache)
+
+
+async def get_action_metadata_in_single_stage(
+    chat_history: List[Dict], use_cache: bool = True
+) -> Dict:
+    input = build_action_metadata_input(chat_history)
+
+    input_tokens = estimate_structured_prompt_tokens(input, ActionMetadataOutput)
+    observe("action_metadata_input_tokens", input_tokens, mode="single")
+
+    async def extract_action_metadata() -> Tuple[Dict, str]:
+        with using_attributes(
+            metadata={"stage": "action_metadata"},
+        ):
+            response, model = await parse_llm_responses(
+                api_key=settings.openai_api_key,
+                model=None,
+                input=input,
+                text_format=ActionMetadataOutput,
+                max_output_tokens=8096,
+                temperature=0,
+                priority=LLMPriority.BACKGROUND,
+                stage="action_metadata",
+                with_model=True,
+            )
+
+        return (
+            {
+                "action_title": response.action_title,
+                "action_description": response.action_description,
+                "action_type": response.action_type.value,
+                "action_category": response.action_category.value,
+                "action_subcategory": response.action_subcategory.value,
+                "action_subtype": response.action_subtype.value,
+            },
+            model,
         )
 
+    return await run_cached_llm_stage(
+        "action_metadata",
+        input_tokens,
+        action_metadata_prompt_version,
+        {
+            "input": input,
+            "response_schema": get_strict_json_schema(ActionMetadataOutput),
+        },
+        extract_action_metadata,
+        use_cache,
+    )
+
+
+async def get_action_metadata_in_two_stages(
+    chat_history: List[Dict], use_cache: bool = True
+) -> Dict:
+    """
+    Picks the kind of action and the category first and then the type, subtype and
+    subcategory out of the few that go with them, instead of sending every type and
+    subcategory with one call.
+    """
+
+    classification_input = build_action_classification_input(chat_history)
+
+    classification_input_tokens = estimate_structured_prompt_tokens(
+        classification_input, ActionClassification
+    )
+
+    async def classify_action() -> Tuple[Dict, str]:
+        with using_attributes(
+            metadata={"stage": "action_classification"},
+        ):
+            response, model = await parse_llm_responses(
+                api_key=settings.openai_api_key,
+                model=None,
+                input=classification_input,
+                text_format=ActionClassification,
+                max_output_tokens=1024,
+                temperature=0,
+                priority=LLMPriority.BACKGROUND,
+                stage="action_classification",
+                with_model=True,
+            )
+
+        return (
+            {
+                "action_title": response.action_title,
+                "action_description": response.action_description,
+                "action_type_group": response.action_type_group,
+                "action_category": response.action_category,
+            },
+            model,
+        )
+
+    classification = await run_cached_llm_stage(
+        "action_classification",
+        classification_input_tokens,
+        action_classification_prompt_version,
+        {
+            "input": classification_input,
+            "response_schema": get_strict_json_schema(ActionClassification),
+        },
+        classify_action,
+        use_cache,
+    )
+
+    ActionSubclassification = get_action_subclassification_model(
+        classification["action_category"], classification["action_type_group"]
+    )
+
+    subclassification_input = build_action_subclassification_input(
+        chat_history,
+        classification["action_type_group"],
+        classification["action_category"],
+    )
+
+    subclassification_input_tokens = estimate_structured_prompt_tokens(
+        subclassification_input, ActionSubclassification
+    )
+
+    async def subclassify_action() -> Tuple[Dict, str]:
+        with using_attributes(
+            metadata={"stage": "action_subclassification"},
+        ):
+            response, model = await parse_llm_responses(
+                api_key=settings.openai_api_key,
+                model=None,
+                input=subclassification_input,
+                text_format=ActionSubclassification,
+                max_output_tokens=256,
+                temperature=0,
+                priority=LLMPriority.BACKGROUND,
+                stage="action_subclassification",
+                with_model=True,
+            )
+
+        return (
+            {
+                "action_type": response.action_type,
+                "action_subtype": response.action_subtype,
+                "action_subcategory": response.action_subcategory,
+            },
+            model,
+        )
+
+    observe(
+        "action_metadata_input_tokens",
+        classification_input_tokens + subclassification_input_tokens,
+        mode="two_stage",
+    )
+
+    subclassification = await run_cached_llm_stage(
+        "action_subclassification",
+        subclassification_input_tokens,
+        action_subclassification_prompt_version,
+        {
+            "input": subclassification_input,
+            "response_schema": get_strict_json_schema(ActionSubclassification),
+        },
+        subclassify_action,
+        use_cache,
+    )
+
+    return {
+        "action_title": classification["action_title"],
+        "action_description": classification["action_description"],
+        "action_category": classification["action_category"],
+        **subclassification,
+    }
+
+
+async def get_skills_from_action(
+    chat_history: List[Dict],
+    action_type: ActionType,
+    action_category: ActionCategory | None = None,
+    action_subcategory: ActionSubCategory | None = None,
+    action_subtype: ActionType | None = None,
+    action_title: str | None = None,
+    action_description: str | None = None,
+    use_cache: bool = True,
+):
+    skills = extract_skill_from_action_type(action_type)
+    skills = await get_skills_data_from_names(skills)
+
+    SkillRelevanceOutput = get_skill_relevance_output_model(
+        tuple(sorted(skill["name"] for skill in skills))
+    )
+
+    input = build_skill_relevance_input(chat_history, action_type)
+
+    input_tokens = estimate_structured_prompt_tokens(input, SkillRelevanceOutput)
+
+    async def get_skill_relevances() -> Tuple[List[Dict], str]:
+        with using_attributes(
+            metadata={
+                "stage": "skill_relevance",
+                "action_type": action_type,
+                "action_category": action_category,
+                "action_subcategory": action_subcategory,
+                "action_subtype": action_subtype,
+                "action_title": action_title,
+                "action_description": action_description,
+            },
+        ):
+            response, model = await parse_llm_responses(
+                api_key=settings.openai_api_key,
+                model=None,
+                input=input,
+                temperature=0,
+                text_format=SkillRelevanceOutput,
+                max_output_tokens=8096,
+                priority=LLMPriority.BACKGROUND,
+                stage="skill_relevance",
+                with_model=True,
+            )
+
+        return response.model_dump()["skill_relevances"], model
+
+    skill_relevances = await run_cached_llm_stage(
+        "skill_relevance",
+        input_tokens,
+        skill_relevance_prompt_version,
+        {
+            "input": input,
+            "response_schema": get_strict_json_schema(SkillRelevanceOutput),
+        },
+        get_skill_relevances,
+        use_cache,
+    )
+
     skill_to_index = {skill["name"]: index for index, skill in enumerate(skills)}
 
-    for skill_relevance in skill_relevance_response.output_parsed.skill_relevances:
-        skills[skill_to_index[skill_relevance.skill]][
+    for skill_relevance in skill_relevances:
+        skills[skill_to_index[skill_relevance["skill"]]][
             "relevance"
-        ] = skill_relevance.relevance
-        skills[skill_to_index[skill_relevance.skill]][
+        ] = skill_relevance["relevance"]
+        skills[skill_to_index[skill_relevance["skill"]]][
             "response"
-        ] = skill_relevance.response
-        skills[skill_to_index[skill_relevance.skill]][
+        ] = skill_relevance["response"]
+        skills[skill_to_index[skill_relevance["skill"]]][
             "microskill_level"
-        ] = skill_relevance.microskill_level
+        ] = skill_relevance["microskill_level"]
 
     return skills
 
 
-@router.post("/ai/extract_action_metadata", response_model=AIActionMetadataResponse)
-async def extract_action_metadata(action_uuid: str):
-    chat_history = await get_action_chat_history(action_uuid)
-    if not chat_history_allows_action_pipeline(chat_history):
-        raise HTTPException(
-            status_code=400,
-            detail="Metadata extraction requires create_action to be true on the latest coach turn.",
-        )
-    action_metadata = await get_action_metadata_from_chat_history(chat_history)
+# seconds after which a stage of the action metadata pipelines is abandoned
+action_pipeline_stage_timeouts = {
+    "load_chat_history": 10,
+    "get_action": 10,
+    "event_exists": 10,
+    "action_metadata": 90,
+    "skill_relevance": 90,
+    "update_action": 10,
+    "frappe_sync": 30,
+    "profile_summary": 10,
+}
+
 
-    skills = await get_skills_from_action(
+async def get_skills_for_action_metadata(
+    chat_history: List[Dict], action_metadata: Dict, use_cache: bool = True
+) -> List[Dict]:
+    return await get_skills_from_action(
         chat_history,
         action_metadata["action_type"],
         action_metadata["action_category"],
@@ -651,102 +1283,379 @@ async def extract_action_metadata(action_uuid: str):
         action_metadata["action_subtype"],
         action_metadata["action_title"],
         action_metadata["action_description"],
+        use_cache=use_cache,
     )
 
-    action_metadata["skills"] = skills
 
-    action = await update_action_for_user(
-        action_uuid,
-        action_metadata["action_title"],
-        action_metadata["action_description"],
-        "published",
-        action_metadata["action_category"],
-        action_metadata["action_type"],
-        action_metadata["skills"],
-    )
+async def extract_action_metadata_and_skills(chat_history: List[Dict]) -> Dict:
+    action_metadata = await get_action_metadata_from_chat_history(chat_history)
+
+    return {
+        "action_metadata": action_metadata,
+        "skills": await get_skills_for_action_metadata(chat_history, action_metadata),
+    }
+
+
+async def get_speculative_action_metadata(chat_history: List[Dict]) -> Dict | None:
+    if not settings.speculative_action_metadata:
+        return None
+
+    task = speculative_action_metadata.get(hash_chat_history(chat_history))
+    if task is None:
+        return None
+
+    try:
+        # shielded so that a timed out request does not cancel the work for the next one
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # already logged, extract it again as part of this request
+        return None
+
 
-    # to handle the case where the first api call from the frontend got interrupted, the backend processed and
-    # created the event but never got stored on chat history and so, this get retried again but if it tries
-    # to recreate the event on frappe, it will throw an error
-    mode = "create" if not await event_exists(action_uuid) else "update"
+def get_action_metadata_stages(
+    chat_history_stage: Stage, use_cache: bool = True
+) -> List[Stage]:
+    """Stages shared by the extract and update pipelines: metadata extraction followed by skill relevance."""
 
-    await create_or_update_action_on_frappe(
+    async def get_speculative_result(results: Dict) -> Dict | None:
+        if not use_cache:
+            return None
+
+        return await get_speculative_action_metadata(results["load_chat_history"])
+
+    async def get_action_metadata(results: Dict) -> Dict:
+        if results["speculative_action_metadata"]:
+            return results["speculative_action_metadata"]["action_metadata"]
+
+        return await get_action_metadata_from_chat_history(
+            results["load_chat_history"], use_cache
+        )
+
+    async def get_skill_relevance(results: Dict) -> List[Dict]:
+        if results["speculative_action_metadata"]:
+            return results["speculative_action_metadata"]["skills"]
+
+        return await get_skills_for_action_metadata(
+            results["load_chat_history"], results["action_metadata"], use_cache
+        )
+
+    return [
+        chat_history_stage,
+        # waits on the extraction started when the basic chat ended, if there is one
+        Stage(
+            "speculative_action_metadata",
+            get_speculative_result,
+            depends_on=["load_chat_history"],
+            timeout=action_pipeline_stage_timeouts["action_metadata"]
+            + action_pipeline_stage_timeouts["skill_relevance"],
+        ),
+        Stage(
+            "action_metadata",
+            get_action_metadata,
+            depends_on=["speculative_action_metadata"],
+            timeout=action_pipeline_stage_timeouts["action_metadata"],
+        ),
+        Stage(
+            "skill_relevance",
+            get_skill_relevance,
+            depends_on=["action_metadata"],
+            timeout=action_pipeline_stage_timeouts["skill_relevance"],
+        ),
+    ]
+
+
+async def run_extract_action_metadata(
+    action_uuid: str, report_stage: Callable | None = None, use_cache: bool = True
+) -> Dict:
+    async def load_chat_history(results: Dict) -> List[Dict]:
+        chat_history = await get_action_chat_history(action_uuid)
+        if not chat_history_allows_action_pipeline(chat_history):
+            raise HTTPException(
+                status_code=400,
+                detail="Metadata extraction requires create_action to be true on the latest coach turn.",
+            )
+
+        return get_model_chat_history(chat_history)
+
+    async def check_event_exists(results: Dict) -> bool:
+        # to handle the case where the first api call from the frontend got interrupted, the backend processed and
+        # created the event but never got stored on chat history and so, this get retried again but if it tries
+        # to recreate the event on frappe, it will throw an error
+        return await event_exists(action_uuid)
+
+    async def update_action(results: Dict) -> Dict:
+        action_metadata = results["action_metadata"]
+
+        action = await update_action_for_user(
+            action_uuid,
+            action_metadata["action_title"],
+            action_metadata["action_description"],
+            "published",
+            action_metadata["action_category"],
+            action_metadata["action_type"],
+            results["skill_relevance"],
+        )
+        await store_action_digest(action)
+
+        return action
+
+    async def sync_action_to_frappe(results: Dict):
+        action = results["update_action"]
+
+        await create_or_update_action_on_frappe(
             action["id"],
             action_uuid,
-            action_metadata["action_subcategory"],
-            action_metadata["action_subtype"],
-            action_metadata["skills"],
-            mode=mode,
+            results["action_metadata"]["action_subcategory"],
+            results["action_metadata"]["action_subtype"],
+            results["skill_relevance"],
+            mode="update" if results["event_exists"] else "create",
+            action_details=action,
         )
-    
-    logger.info(action["user"]["username"])
-     # Update user profile summary after action metadata is processed
-    await get_user_profile_summary(action["user"]["username"])
 
-    return action_metadata
+    async def update_profile_summary(results: Dict):
+        username = results["update_action"]["user"]["username"]
+        logger.info(username)
+        await schedule_user_profile_summary(username)
+
+    stages = get_action_metadata_stages(
+        Stage(
+            "load_chat_history",
+            load_chat_history,
+            timeout=action_pipeline_stage_timeouts["load_chat_history"],
+        ),
+        use_cache,
+    ) + [
+        Stage(
+            "event_exists",
+            check_event_exists,
+            timeout=action_pipeline_stage_timeouts["event_exists"],
+        ),
+        Stage(
+            "update_action",
+            update_action,
+            depends_on=["skill_relevance"],
+            timeout=action_pipeline_stage_timeouts["update_action"],
+        ),
+        Stage(
+            "frappe_sync",
+            sync_action_to_frappe,
+            depends_on=["update_action", "event_exists"],
+            timeout=action_pipeline_stage_timeouts["frappe_sync"],
+        ),
+        # the summary is generated from the portfolio on frappe, so it can only be
+        # scheduled once the action is there
+        Stage(
+            "profile_summary",
+            update_profile_summary,
+            depends_on=["frappe_sync"],
+            timeout=action_pipeline_stage_timeouts["profile_summary"],
+        ),
+    ]
+
+    results = await run_stage_graph("extract_action_metadata", stages, report_stage)
+
+    return {
+        **results["action_metadata"],
+        "skills": results["skill_relevance"],
+    }
+
+
+@job_handler("extract_action_metadata")
+async def extract_action_metadata_job(payload: Dict, report_stage: Callable) -> Dict:
+    return await run_extract_action_metadata(
+        payload["action_uuid"], report_stage, payload.get("use_cache", True)
+    )
 
 
 @router.post(
-    "/ai/update_action_metadata", response_model=AIUpdateActionMetadataResponse
+    "/ai/extract_action_metadata", response_model=AIActionMetadataResponse | Job
 )
-async def update_action_metadata(action_uuid: str):
+async def extract_action_metadata(
+    action_uuid: str, run_as_job: bool = False, use_cache: bool = True
+):
+    if not run_as_job:
+        return await run_extract_action_metadata(action_uuid, use_cache=use_cache)
+
+    # fail fast instead of queueing a job that is bound to fail
     chat_history = await get_action_chat_history(action_uuid)
+    if not chat_history_allows_action_pipeline(chat_history):
+        raise HTTPException(
+            status_code=400,
+            detail="Metadata extraction requires create_action to be true on the latest coach turn.",
+        )
 
-    chat_history = [
-        message for message in chat_history if message["role"] != "analysis"
-    ]
+    job = await enqueue_job(
+        "extract_action_metadata",
+        {"action_uuid": action_uuid, "use_cache": use_cache},
+        dedup_key=action_uuid,
+    )
+    return convert_job_to_response(job)
 
-    logger.info(f"Extracting action metadata")
-    action_metadata = await get_action_metadata_from_chat_history(chat_history)
 
-    action = await get_action_from_uuid(action_uuid)
+async def run_update_action_metadata(
+    action_uuid: str, report_stage: Callable | None = None, use_cache: bool = True
+) -> Dict:
+    async def load_chat_history(results: Dict) -> List[Dict]:
+        chat_history = await get_action_chat_history(action_uuid)
 
-    has_changed = action["type"] != action_metadata["action_type"]
+        return get_model_chat_history(
+            [message for message in chat_history if message["role"] != "analysis"]
+        )
 
-    # get updated skill relevance
-    logger.info(f"Updating skill relevance")
-    skills = await get_skills_from_action(
-        chat_history,
-        action_metadata["action_type"],
-        action_metadata["action_category"],
-        action_metadata["action_subcategory"],
-        action_metadata["action_subtype"],
-        action_metadata["action_title"],
-        action_metadata["action_description"],
-    )
+    async def get_action(results: Dict) -> Dict:
+        return await get_action_from_uuid(action_uuid)
 
-    action_metadata["skills"] = skills
+    async def update_action(results: Dict) -> Dict:
+        action_metadata = results["action_metadata"]
 
-    action = await update_action_for_user(
-        action_uuid,
-        action_metadata["action_title"],
-        action_metadata["action_description"],
-        action["status"],  # keep the same status
-        action_metadata["action_category"],
-        action_metadata["action_type"],
-        action_metadata["skills"],
-    )
+        action = await update_action_for_user(
+            action_uuid,
+            action_metadata["action_title"],
+            action_metadata["action_description"],
+            results["get_action"]["status"],  # keep the same status
+            action_metadata["action_category"],
+            action_metadata["action_type"],
+            results["skill_relevance"],
+        )
+        await store_action_digest(action)
 
-    coroutines = []
+        return action
 
-    logger.info(f"Updating user profile summary for user {action['user']['username']}")
-    # Update user profile summary after action metadata is processed
-    coroutines.append(get_user_profile_summary(action["user"]["username"]))
+    async def sync_action_to_frappe(results: Dict):
+        action = results["update_action"]
 
-    coroutines.append(
-        create_or_update_action_on_frappe(
+        await create_or_update_action_on_frappe(
             action["id"],
             action_uuid,
-            action_metadata["action_subcategory"],
-            action_metadata["action_subtype"],
-            action_metadata["skills"],
+            results["action_metadata"]["action_subcategory"],
+            results["action_metadata"]["action_subtype"],
+            results["skill_relevance"],
             mode="update",
+            action_details=action,
         )
+
+    async def update_profile_summary(results: Dict):
+        username = results["update_action"]["user"]["username"]
+        logger.info(f"Scheduling user profile summary update for user {username}")
+        await schedule_user_profile_summary(username)
+
+    stages = get_action_metadata_stages(
+        Stage(
+            "load_chat_history",
+            load_chat_history,
+            timeout=action_pipeline_stage_timeouts["load_chat_history"],
+        ),
+        use_cache,
+    ) + [
+        Stage(
+            "get_action",
+            get_action,
+            timeout=action_pipeline_stage_timeouts["get_action"],
+        ),
+        Stage(
+            "update_action",
+            update_action,
+            depends_on=["skill_relevance", "get_action"],
+            timeout=action_pipeline_stage_timeouts["update_action"],
+        ),
+        Stage(
+            "frappe_sync",
+            sync_action_to_frappe,
+            depends_on=["update_action"],
+            timeout=action_pipeline_stage_timeouts["frappe_sync"],
+        ),
+        # the summary is generated from the portfolio on frappe, so it can only be
+        # scheduled once the updated action is there
+        Stage(
+            "profile_summary",
+            update_profile_summary,
+            depends_on=["frappe_sync"],
+            timeout=action_pipeline_stage_timeouts["profile_summary"],
+        ),
+    ]
+
+    results = await run_stage_graph("update_action_metadata", stages, report_stage)
+
+    return {
+        "has_changed": results["get_action"]["type"]
+        != results["action_metadata"]["action_type"],
+        **results["action_metadata"],
+        "skills": results["skill_relevance"],
+    }
+
+
+@job_handler("update_action_metadata")
+async def update_action_metadata_job(payload: Dict, report_stage: Callable) -> Dict:
+    return await run_update_action_metadata(
+        payload["action_uuid"], report_stage, payload.get("use_cache", True)
     )
 
-    await asyncio.gather(*coroutines)
 
+@router.post(
+    "/ai/update_action_metadata",
+    response_model=AIUpdateActionMetadataResponse | Job,
+)
+async def update_action_metadata(
+    action_uuid: str, run_as_job: bool = False, use_cache: bool = True
+):
+    if not run_as_job:
+        return await run_update_action_metadata(action_uuid, use_cache=use_cache)
+
+    job = await enqueue_job(
+        "update_action_metadata",
+        {"action_uuid": action_uuid, "use_cache": use_cache},
+        dedup_key=action_uuid,
+    )
+    return convert_job_to_response(job)
+
+
+def convert_job_to_response(job: Dict, events: List[Dict] | None = None) -> Dict:
     return {
-        "has_changed": has_changed,
-        **action_metadata,
+        "job_id": job["uuid"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "events": events,
     }
+
+
+@router.get("/ai/jobs/{job_id}", response_model=Job)
+async def get_job_status(job_id: str):
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return convert_job_to_response(job, await get_job_events(job["id"]))
+
+
+@router.get("/ai/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events for each stage of the job, ending with a completed/failed event carrying the job."""
+    job = await get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream_events():
+        last_event_id = 0
+
+        while True:
+            # read the job before its events so that no event is missed when it finishes in between
+            job = await get_job(job_id)
+
+            for event in await get_job_events(job["id"], last_event_id):
+                last_event_id = event["id"]
+                yield f"event: stage\ndata: {json.dumps(event)}\n\n"
+
+            if job["status"] in ["completed", "failed"]:
+                yield f"event: {job['status']}\ndata: {json.dumps(convert_job_to_response(job))}\n\n"
+                return
+
+            await asyncio.sleep(job_events_poll_interval_seconds)
+
+    return StreamingResponse(stream_events(), media_type="text/event-stream")
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import uuid
+from typing import AsyncIterator, Dict
+from fastapi import Request
+from settings import settings
+from metrics import increment, set_gauge
+
+logger = logging.getLogger(__name__)
+
+
+class ChatStream:
+    """
+    Runs a chat stream independently of the client connection and keeps its latest line
+    so that a client whose connection dropped can resume it.
+
+    Every line is a full snapshot of the response so far, so a client resuming from any
+    earlier offset only needs the latest line, and the lines after it.
+    """
+
+    def __init__(self, lines: AsyncIterator[str]):
+        self.id = str(uuid.uuid4())
+        self.latest_line: str | None = None
+        # offset of the next line, i.e. the number of lines so far
+        self.next_offset = 0
+        self.is_done = False
+        self.error: Exception | None = None
+        self.num_subscribers = 0
+        self._new_line = asyncio.Condition()
+        self._cancel_handle: asyncio.TimerHandle | None = None
+        self._task = asyncio.create_task(self._produce(lines))
+
+    async def _produce(self, lines: AsyncIterator[str]):
+        try:
+            async for line in lines:
+                async with self._new_line:
+                    self.latest_line = line
+                    self.next_offset += 1
+                    self._new_line.notify_all()
+        except asyncio.CancelledError:
+            logger.info(f"Chat stream {self.id} cancelled")
+        except Exception as exception:
+            logger.exception(f"Chat stream {self.id} failed")
+            self.error = exception
+        finally:
+            async with self._new_line:
+                self.is_done = True
+                self._new_line.notify_all()
+
+            asyncio.get_running_loop().call_later(
+                settings.chat_stream_retention_seconds, _remove_chat_stream, self.id
+            )
+
+    async def subscribe(self, offset: int = 0):
+        while True:
+            async with self._new_line:
+                await self._new_line.wait_for(
+                    lambda: self.next_offset > offset or self.is_done
+                )
+                # the lines the subscriber missed are covered by the latest one
+                line = self.latest_line if self.next_offset > offset else None
+                offset = self.next_offset
+                is_done = self.is_done
+
+            if line is not None:
+                yield line
+
+            if is_done:
+                if self.error:
+                    raise self.error
+
+                return
+
+    def attach(self):
+        self.num_subscribers += 1
+
+        if self._cancel_handle:
+            self._cancel_handle.cancel()
+            self._cancel_handle = None
+
+    def detach(self):
+        self.num_subscribers -= 1
+
+        if self.num_subscribers > 0 or self.is_done:
+            return
+
+        # give a client whose connection dropped some time to come back
+        # before we stop paying for the generation
+        if settings.chat_stream_detach_grace_seconds <= 0:
+            self.cancel()
+        else:
+            self._cancel_handle = asyncio.get_running_loop().call_later(
+                settings.chat_stream_detach_grace_seconds, self.cancel
+            )
+
+    def cancel(self):
+        self._cancel_handle = None
+
+        if not self.is_done:
+            self._task.cancel()
+
+
+_chat_streams: Dict[str, ChatStream] = {}
+
+
+def _remove_chat_stream(stream_id: str):
+    _chat_streams.pop(stream_id, None)
+    set_gauge("chat_streams_active", len(_chat_streams))
+
+
+def start_chat_stream(lines: AsyncIterator[str]) -> ChatStream:
+    chat_stream = ChatStream(lines)
+    _chat_streams[chat_stream.id] = chat_stream
+    set_gauge("chat_streams_active", len(_chat_streams))
+    return chat_stream
+
+
+def get_chat_stream(stream_id: str) -> ChatStream | None:
+    return _chat_streams.get(stream_id)
+
+
+async def wait_for_disconnect(http_request: Request):
+    while not await http_request.is_disconnected():
+        await asyncio.sleep(settings.chat_stream_disconnect_poll_seconds)
+
+
+async def relay_chat_stream(
+    http_request: Request, chat_stream: ChatStream, offset: int = 0
+):
+    """
+    Sends the lines of the chat stream from the given offset to the client until it
+    disconnects. The wait for the next line is raced against the disconnect, so that the
+    stream is detached, and its grace period starts, even while the model is not sending.
+    """
+    chat_stream.attach()
+
+    lines = chat_stream.subscribe(offset)
+    disconnect = asyncio.create_task(wait_for_disconnect(http_request))
+    next_line = None
+
+    try:
+        while True:
+            next_line = asyncio.ensure_future(anext(lines))
+            await asyncio.wait(
+                [next_line, disconnect], return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if not next_line.done():
+                logger.info(f"Client disconnected from chat stream {chat_stream.id}")
+                increment("chat_stream_client_disconnects")
+                break
+
+            try:
+                line = next_line.result()
+            except StopAsyncIteration:
+                break
+
+            yield line
+    finally:
+        disconnect.cancel()
+        if next_line is not None and not next_line.done():
+            next_line.cancel()
+            await asyncio.gather(next_line, return_exceptions=True)
+
+        await lines.aclose()
+        chat_stream.detach()
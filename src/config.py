@@ -23,3 +23,8 @@ action_categories_table_name = "action_categories"
 action_types_table_name = "action_types"
 skills_table_name = "skills"
 action_skills_table_name = "action_skills"
+jobs_table_name = "jobs"
+job_events_table_name = "job_events"
+llm_cache_table_name = "llm_cache"
+profile_summaries_table_name = "profile_summaries"
+action_digests_table_name = "action_digests"
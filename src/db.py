@@ -1,6 +1,7 @@
 from collections import defaultdict
 from contextlib import asynccontextmanager
 from typing import List, Dict
+import json
 import os
 from os.path import exists
 import sqlite3
@@ -17,6 +18,11 @@ from config import (
     action_types_table_name,
     skills_table_name,
     action_skills_table_name,
+    jobs_table_name,
+    job_events_table_name,
+    llm_cache_table_name,
+    profile_summaries_table_name,
+    action_digests_table_name,
 )
 from models import (
     SignupUserRequest,
@@ -115,6 +121,10 @@ async def create_tables(cursor):
             role TEXT NOT NULL,
             content TEXT NOT NULL,
             response_type TEXT,
+            chain_of_thought TEXT,
+            is_done BOOLEAN,
+            create_action BOOLEAN,
+            language TEXT,
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (action_id) REFERENCES actions (id)
         )
@@ -183,6 +193,109 @@ async def create_tables(cursor):
     """
     )
 
+    # Create jobs table
+    await cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {jobs_table_name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uuid TEXT UNIQUE NOT NULL,
+            kind TEXT NOT NULL,
+            dedup_key TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            run_after DATETIME,
+            started_at DATETIME,
+            finished_at DATETIME
+        )
+    """
+    )
+
+    # Create index on status column for jobs table
+    await cursor.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON {jobs_table_name} (status)
+    """
+    )
+
+    # Create index on kind and dedup_key columns for jobs table
+    await cursor.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS idx_jobs_kind_dedup_key ON {jobs_table_name} (kind, dedup_key)
+    """
+    )
+
+    # Create job_events table
+    await cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {job_events_table_name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (job_id) REFERENCES jobs (id)
+        )
+    """
+    )
+
+    # Create index on job_id column for job_events table
+    await cursor.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS idx_job_events_job_id ON {job_events_table_name} (job_id)
+    """
+    )
+
+    # Create llm_cache table
+    await cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {llm_cache_table_name} (
+            key TEXT PRIMARY KEY,
+            stage TEXT NOT NULL,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_accessed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+
+    # Create index on last_accessed_at column for llm_cache table
+    await cursor.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_last_accessed_at ON {llm_cache_table_name} (last_accessed_at)
+    """
+    )
+
+    # Create profile_summaries table
+    await cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {profile_summaries_table_name} (
+            username TEXT PRIMARY KEY,
+            input_hash TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+
+    # Create action_digests table
+    await cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {action_digests_table_name} (
+            action_uuid TEXT PRIMARY KEY,
+            content_hash TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            summarized_hash TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+
 
 async def init_db():
     # Ensure the database folder exists
@@ -399,19 +512,13 @@ async def get_user_portfolio(username: str):
                 )
 
             chat_history_result = await cursor.execute(
-                f"SELECT id, role, content, response_type, created_at FROM {chat_history_table_name} WHERE action_id = ?",
+                f"SELECT {chat_history_columns} FROM {chat_history_table_name} WHERE action_id = ?",
                 (action_id,),
             )
             chat_history_data = await chat_history_result.fetchall()
 
             chat_history = [
-                {
-                    "id": chat[0],
-                    "role": chat[1],
-                    "content": chat[2],
-                    "response_type": chat[3],
-                    "created_at": chat[4],
-                }
+                convert_chat_message_db_to_dict(chat)
                 for chat in chat_history_data
                 if chat[1] in ["user", "assistant"]
             ]
@@ -605,15 +712,11 @@ async def create_action_for_user(
 
         action_id = cursor.lastrowid
 
-        await cursor.execute(
-            f"INSERT INTO {chat_history_table_name} (action_id, role, content, response_type) VALUES (?, ?, ?, ?)",
-            (action_id, "user", user_message, "text"),
-        )
+        await insert_chat_message(cursor, action_id, "user", user_message, "text")
 
         if ai_message:
-            await cursor.execute(
-                f"INSERT INTO {chat_history_table_name} (action_id, role, content, response_type) VALUES (?, ?, ?, ?)",
-                (action_id, "assistant", ai_message, "text"),
+            await insert_chat_message(
+                cursor, action_id, "assistant", ai_message, "text"
             )
 
         await conn.commit()
@@ -629,27 +732,109 @@ async def create_action_for_user(
         return await get_action_for_user(action_id)
 
 
+chat_history_columns = "id, role, content, response_type, created_at, chain_of_thought, is_done, create_action, language"
+
+
+def split_chat_message_content(role: str, content: str) -> Dict:
+    """
+    Assistant turns arrive as the JSON output of the coach. Its fields are stored in their own columns, with
+    `content` holding only the response shown to the student.
+    """
+    columns = {
+        "content": content,
+        "chain_of_thought": None,
+        "is_done": None,
+        "create_action": None,
+        "language": None,
+    }
+
+    if role != "assistant":
+        return columns
+
+    try:
+        payload = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return columns
+
+    if (
+        not isinstance(payload, dict)
+        or not isinstance(payload.get("response"), str)
+        or "is_done" not in payload
+    ):
+        return columns
+
+    return {
+        "content": payload["response"],
+        "chain_of_thought": payload.get("chain_of_thought"),
+        "is_done": bool(payload["is_done"]),
+        "create_action": (
+            bool(payload["create_action"]) if "create_action" in payload else None
+        ),
+        "language": payload.get("language"),
+    }
+
+
+def convert_chat_message_db_to_dict(chat) -> Dict:
+    message = {
+        "id": chat[0],
+        "role": chat[1],
+        # the text of the message as shown to the student
+        "text": chat[2],
+        "content": chat[2],
+        "response_type": chat[3],
+        "created_at": chat[4],
+        "is_done": bool(chat[6]) if chat[6] is not None else None,
+        "create_action": bool(chat[7]) if chat[7] is not None else None,
+        "language": chat[8],
+    }
+
+    if message["is_done"] is not None:
+        # clients still read the flags of an assistant turn from its content
+        content = {"response": chat[2], "is_done": message["is_done"]}
+        if message["create_action"] is not None:
+            content["create_action"] = message["create_action"]
+        if message["language"] is not None:
+            content["language"] = message["language"]
+
+        message["content"] = json.dumps(content)
+
+    return message
+
+
+async def insert_chat_message(
+    cursor, action_id: int, role: str, content: str, response_type: str
+) -> int:
+    columns = split_chat_message_content(role, content)
+
+    await cursor.execute(
+        f"INSERT INTO {chat_history_table_name} (action_id, role, content, response_type, chain_of_thought, is_done, create_action, language) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            action_id,
+            role,
+            columns["content"],
+            response_type,
+            columns["chain_of_thought"],
+            columns["is_done"],
+            columns["create_action"],
+            columns["language"],
+        ),
+    )
+
+    return cursor.lastrowid
+
+
 async def get_action_chat_history(action_uuid: str):
     async with get_new_db_connection() as conn:
         cursor = await conn.cursor()
 
         result = await cursor.execute(
-            f"SELECT id, role, content, response_type, created_at FROM {chat_history_table_name} WHERE action_id = (SELECT id FROM {actions_table_name} WHERE uuid = ?) ORDER BY created_at ASC",
+            f"SELECT {chat_history_columns} FROM {chat_history_table_name} WHERE action_id = (SELECT id FROM {actions_table_name} WHERE uuid = ?) ORDER BY created_at ASC",
             (action_uuid,),
         )
 
         chat_history = await result.fetchall()
 
-        return [
-            {
-                "id": chat[0],
-                "role": chat[1],
-                "content": chat[2],
-                "response_type": chat[3],
-                "created_at": chat[4],
-            }
-            for chat in chat_history
-        ]
+        return [convert_chat_message_db_to_dict(chat) for chat in chat_history]
 
 
 async def get_all_chat_sessions_for_user(user_id: int):
@@ -680,22 +865,30 @@ async def get_all_chat_sessions_for_user(user_id: int):
         ]
 
 
-async def add_messages_to_action_history(
+async def insert_messages_into_action_history(
     action_uuid: str, messages: List[AddChatMessageRequest]
-):
+) -> List[int]:
+    """Store the messages for the action (mirroring them to frappe) and return their ids."""
     async with get_new_db_connection() as conn:
         cursor = await conn.cursor()
 
         await cursor.execute(
-            f"SELECT u.email FROM {actions_table_name} a INNER JOIN {users_table_name} u ON a.user_id = u.id WHERE a.uuid = ?",
+            f"SELECT a.id, u.email FROM {actions_table_name} a INNER JOIN {users_table_name} u ON a.user_id = u.id WHERE a.uuid = ?",
             (action_uuid,),
         )
-        user_email = (await cursor.fetchone())[0]
+        action_id, user_email = await cursor.fetchone()
+
+        message_ids = []
 
         for message in messages:
-            await cursor.execute(
-                f"INSERT INTO {chat_history_table_name} (action_id, role, content, response_type) VALUES ((SELECT id FROM {actions_table_name} WHERE uuid = ?), ?, ?, ?)",
-                (action_uuid, message.role, message.content, message.response_type),
+            message_ids.append(
+                await insert_chat_message(
+                    cursor,
+                    action_id,
+                    message.role,
+                    message.content,
+                    message.response_type,
+                )
             )
 
             await add_message_to_chat_history(
@@ -708,29 +901,42 @@ async def add_messages_to_action_history(
 
         await conn.commit()
 
-        return await get_action_chat_history(action_uuid)
+        return message_ids
 
 
-async def get_skills_data_from_names(skill_names: List[str]) -> List[Skill]:
-    async with get_new_db_connection() as conn:
-        cursor = await conn.cursor()
+async def add_messages_to_action_history(
+    action_uuid: str, messages: List[AddChatMessageRequest]
+):
+    await insert_messages_into_action_history(action_uuid, messages)
 
-        result = await cursor.execute(
-            f"SELECT id, name, label FROM {skills_table_name} WHERE name IN ({', '.join([f'?' for _ in skill_names])})",
-            skill_names,
-        )
+    return await get_action_chat_history(action_uuid)
 
-        skills = await result.fetchall()
 
-        return [
-            {
-                "id": skill[0],
-                "name": skill[1],
-                "label": skill[2],
-                "microskills": skill_to_microskills[skill[1]],
-            }
-            for skill in skills
-        ]
+# the skills are only seeded once, so their ids are loaded once per process
+_skill_ids_by_name: Dict[str, int] = {}
+
+
+async def get_skill_ids_by_name() -> Dict[str, int]:
+    if not _skill_ids_by_name:
+        for skill in await get_all_skills():
+            _skill_ids_by_name[skill["name"]] = skill["id"]
+
+    return _skill_ids_by_name
+
+
+async def get_skills_data_from_names(skill_names: List[str]) -> List[Skill]:
+    skill_ids = await get_skill_ids_by_name()
+
+    return [
+        {
+            "id": skill_ids[skill_name],
+            "name": skill_name,
+            "label": skill_to_name[skill_name],
+            "microskills": skill_to_microskills[skill_name],
+        }
+        for skill_name in skill_names
+        if skill_name in skill_ids
+    ]
 
 
 async def update_action_for_user(
@@ -889,3 +1095,374 @@ async def delete_last_non_user_messages_from_chat_history(action_id: int):
                         break
 
         await conn.commit()
+
+
+job_columns = "id, uuid, kind, dedup_key, payload, status, result, error, attempts, created_at, started_at, finished_at, run_after"
+
+
+def convert_job_db_to_dict(job) -> Dict:
+    return {
+        "id": job[0],
+        "uuid": job[1],
+        "kind": job[2],
+        "dedup_key": job[3],
+        "payload": json.loads(job[4]),
+        "status": job[5],
+        "result": json.loads(job[6]) if job[6] else None,
+        "error": job[7],
+        "attempts": job[8],
+        "created_at": job[9],
+        "started_at": job[10],
+        "finished_at": job[11],
+        "run_after": job[12],
+    }
+
+
+async def create_job(
+    kind: str,
+    payload: Dict,
+    dedup_key: str | None = None,
+    debounce_seconds: float | None = None,
+) -> Dict:
+    """
+    Queues a job unless a job of the same kind and dedup key is already queued or running, which is returned instead.
+
+    A debounced job only runs once no job of the same kind and dedup key has been queued for `debounce_seconds`:
+    queueing it again while it waits pushes it back instead. If the previous one is already running, a new job is
+    queued to run after it.
+    """
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        # takes the write lock before looking for an existing job, so that concurrent requests
+        # cannot both find none and queue the same job twice
+        await cursor.execute("BEGIN IMMEDIATE")
+
+        job = None
+
+        if dedup_key is not None and debounce_seconds is not None:
+            result = await cursor.execute(
+                f"""
+                UPDATE {jobs_table_name}
+                SET payload = ?, run_after = datetime('now', ?)
+                WHERE id = (SELECT id FROM {jobs_table_name} WHERE kind = ? AND dedup_key = ? AND status = 'queued' ORDER BY id DESC LIMIT 1)
+                RETURNING {job_columns}
+                """,
+                (json.dumps(payload), f"+{debounce_seconds} seconds", kind, dedup_key),
+            )
+            job = await result.fetchone()
+
+        elif dedup_key is not None:
+            result = await cursor.execute(
+                f"SELECT {job_columns} FROM {jobs_table_name} WHERE kind = ? AND dedup_key = ? AND status IN ('queued', 'running') ORDER BY id DESC LIMIT 1",
+                (kind, dedup_key),
+            )
+            job = await result.fetchone()
+
+        if job is None:
+            result = await cursor.execute(
+                f"INSERT INTO {jobs_table_name} (uuid, kind, dedup_key, payload, status, run_after) VALUES (?, ?, ?, ?, ?, datetime('now', ?)) RETURNING {job_columns}",
+                (
+                    str(uuid.uuid4()),
+                    kind,
+                    dedup_key,
+                    json.dumps(payload),
+                    "queued",
+                    f"+{debounce_seconds or 0} seconds",
+                ),
+            )
+            job = await result.fetchone()
+
+        await conn.commit()
+
+        return convert_job_db_to_dict(job)
+
+
+async def get_job(job_uuid: str) -> Dict | None:
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        result = await cursor.execute(
+            f"SELECT {job_columns} FROM {jobs_table_name} WHERE uuid = ?",
+            (job_uuid,),
+        )
+        job = await result.fetchone()
+
+        if not job:
+            return None
+
+        return convert_job_db_to_dict(job)
+
+
+async def claim_next_job() -> Dict | None:
+    """
+    Marks the oldest queued job that is due as running and returns it. Jobs with the same kind and dedup key as a
+    running job wait for it to finish.
+    """
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        result = await cursor.execute(
+            f"""
+            UPDATE {jobs_table_name}
+            SET status = 'running', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM {jobs_table_name} AS queued_job
+                WHERE status = 'queued'
+                AND (run_after IS NULL OR run_after <= datetime('now'))
+                AND NOT EXISTS (
+                    SELECT 1 FROM {jobs_table_name} AS running_job
+                    WHERE running_job.status = 'running'
+                    AND running_job.kind = queued_job.kind
+                    AND running_job.dedup_key = queued_job.dedup_key
+                )
+                ORDER BY id ASC LIMIT 1
+            )
+            RETURNING {job_columns}
+            """
+        )
+        job = await result.fetchone()
+
+        await conn.commit()
+
+        if not job:
+            return None
+
+        return convert_job_db_to_dict(job)
+
+
+async def finish_job(
+    job_id: int, status: str, result: Dict | None = None, error: str | None = None
+):
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"UPDATE {jobs_table_name} SET status = ?, result = ?, error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, job_id),
+        )
+
+        await conn.commit()
+
+
+async def requeue_running_jobs() -> int:
+    """Jobs still marked as running when the app starts were interrupted by a restart."""
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"UPDATE {jobs_table_name} SET status = 'queued' WHERE status = 'running'"
+        )
+
+        await conn.commit()
+
+        return cursor.rowcount
+
+
+async def delete_finished_jobs(retention_seconds: float) -> int:
+    """Deletes the jobs that finished more than `retention_seconds` ago along with their events."""
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        finished_jobs = f"SELECT id FROM {jobs_table_name} WHERE status IN ('completed', 'failed') AND finished_at < datetime('now', ?)"
+        cutoff = f"-{retention_seconds} seconds"
+
+        await cursor.execute(
+            f"DELETE FROM {job_events_table_name} WHERE job_id IN ({finished_jobs})",
+            (cutoff,),
+        )
+        await cursor.execute(
+            f"DELETE FROM {jobs_table_name} WHERE id IN ({finished_jobs})", (cutoff,)
+        )
+
+        await conn.commit()
+
+        return cursor.rowcount
+
+
+async def add_job_event(job_id: int, stage: str, status: str):
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"INSERT INTO {job_events_table_name} (job_id, stage, status) VALUES (?, ?, ?)",
+            (job_id, stage, status),
+        )
+
+        await conn.commit()
+
+
+async def get_job_events(job_id: int, after_event_id: int = 0) -> List[Dict]:
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        result = await cursor.execute(
+            f"SELECT id, stage, status, created_at FROM {job_events_table_name} WHERE job_id = ? AND id > ? ORDER BY id ASC",
+            (job_id, after_event_id),
+        )
+        events = await result.fetchall()
+
+        return [
+            {
+                "id": event[0],
+                "stage": event[1],
+                "status": event[2],
+                "created_at": event[3],
+            }
+            for event in events
+        ]
+
+
+async def get_llm_cache_entry(key: str) -> str | None:
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        result = await cursor.execute(
+            f"UPDATE {llm_cache_table_name} SET last_accessed_at = CURRENT_TIMESTAMP WHERE key = ? RETURNING response",
+            (key,),
+        )
+        entry = await result.fetchone()
+
+        await conn.commit()
+
+        if not entry:
+            return None
+
+        return entry[0]
+
+
+async def set_llm_cache_entry(key: str, stage: str, model: str, response: str):
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"INSERT OR REPLACE INTO {llm_cache_table_name} (key, stage, model, response, size) VALUES (?, ?, ?, ?, ?)",
+            (key, stage, model, response, len(response.encode())),
+        )
+
+        await conn.commit()
+
+
+async def evict_llm_cache_entries(max_bytes: int) -> int:
+    """Deletes the least recently used entries beyond the given total size and returns how many were deleted."""
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"""
+            DELETE FROM {llm_cache_table_name} WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_accessed_at DESC, created_at DESC, key) AS total_size
+                    FROM {llm_cache_table_name}
+                ) WHERE total_size > ?
+            )
+            """,
+            (max_bytes,),
+        )
+
+        await conn.commit()
+
+        return cursor.rowcount
+
+
+async def get_profile_summary(username: str) -> Dict | None:
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        result = await cursor.execute(
+            f"SELECT input_hash, summary, updated_at FROM {profile_summaries_table_name} WHERE username = ?",
+            (username,),
+        )
+        profile_summary = await result.fetchone()
+
+        if not profile_summary:
+            return None
+
+        return {
+            "input_hash": profile_summary[0],
+            "summary": profile_summary[1],
+            "updated_at": profile_summary[2],
+        }
+
+
+async def upsert_profile_summary(username: str, input_hash: str, summary: str):
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.execute(
+            f"""
+            INSERT INTO {profile_summaries_table_name} (username, input_hash, summary) VALUES (?, ?, ?)
+            ON CONFLICT(username) DO UPDATE SET input_hash = excluded.input_hash, summary = excluded.summary, updated_at = CURRENT_TIMESTAMP
+            """,
+            (username, input_hash, summary),
+        )
+
+        await conn.commit()
+
+
+async def get_action_digests(action_uuids: List[str]) -> Dict[str, Dict]:
+    if not action_uuids:
+        return {}
+
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        result = await cursor.execute(
+            f"SELECT action_uuid, content_hash, digest, summarized_hash FROM {action_digests_table_name} WHERE action_uuid IN ({', '.join(['?' for _ in action_uuids])})",
+            action_uuids,
+        )
+        action_digests = await result.fetchall()
+
+        return {
+            action_digest[0]: {
+                "content_hash": action_digest[1],
+                "digest": action_digest[2],
+                "summarized_hash": action_digest[3],
+            }
+            for action_digest in action_digests
+        }
+
+
+async def upsert_action_digests(action_digests: List[Dict]):
+    if not action_digests:
+        return
+
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        # the summarized hash is kept, so that a changed action counts as changed until the next summary
+        await cursor.executemany(
+            f"""
+            INSERT INTO {action_digests_table_name} (action_uuid, content_hash, digest) VALUES (?, ?, ?)
+            ON CONFLICT(action_uuid) DO UPDATE SET content_hash = excluded.content_hash, digest = excluded.digest, updated_at = CURRENT_TIMESTAMP
+            """,
+            [
+                (
+                    action_digest["action_uuid"],
+                    action_digest["content_hash"],
+                    action_digest["digest"],
+                )
+                for action_digest in action_digests
+            ],
+        )
+
+        await conn.commit()
+
+
+async def mark_action_digests_summarized(action_digests: List[Dict]):
+    """Records the content of each action that the latest profile summary of its user is based on."""
+    if not action_digests:
+        return
+
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        await cursor.executemany(
+            f"UPDATE {action_digests_table_name} SET summarized_hash = ? WHERE action_uuid = ?",
+            [
+                (action_digest["content_hash"], action_digest["action_uuid"])
+                for action_digest in action_digests
+            ],
+        )
+
+        await conn.commit()
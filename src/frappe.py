@@ -1,3 +1,4 @@
+import asyncio
 import requests
 import json
 from fastapi import HTTPException
@@ -37,7 +38,9 @@ async def add_message_to_chat_history(
         "Content-Type": "application/json",
     }
 
-    response = requests.request("POST", url, headers=headers, data=payload)
+    response = await asyncio.to_thread(
+        requests.request, "POST", url, headers=headers, data=payload
+    )
 
     if response.status_code != 200:
         raise Exception(
@@ -105,8 +108,10 @@ def get_user_profile_from_username(username: str):
 
 def get_user_portfolio(username: str):
     """Get the portfolio of a user from Frappe backend in the same format as the database version."""
-    frappe_data = get_user_profile_from_username(username)
+    return convert_frappe_profile_to_portfolio(get_user_profile_from_username(username))
+
 
+def convert_frappe_profile_to_portfolio(frappe_data: dict):
     current_user = frappe_data.get("current_user", {})
     actions_data = frappe_data.get("actions", [])
     skills_data = frappe_data.get("skills", [])
@@ -316,12 +321,15 @@ async def create_or_update_action_on_frappe(
     subtype: str,
     skills: list[dict],
     mode: Literal["create", "update"] = "create",
+    action_details: dict | None = None,
 ):
     from db import get_action_for_user
 
     url = f"{settings.frappe_backend_base_url}/method/solve_ninja.api.events.create_events"
 
-    action_details = await get_action_for_user(action_id)
+    # callers that just updated the action already have its details
+    if action_details is None:
+        action_details = await get_action_for_user(action_id)
 
     payload = json.dumps(
         {
@@ -349,8 +357,12 @@ async def create_or_update_action_on_frappe(
         "Content-Type": "application/json",
     }
 
-    response = requests.request(
-        "POST" if mode == "create" else "PUT", url, headers=headers, data=payload
+    response = await asyncio.to_thread(
+        requests.request,
+        "POST" if mode == "create" else "PUT",
+        url,
+        headers=headers,
+        data=payload,
     )
 
     if response.status_code != 200:
@@ -407,9 +419,32 @@ def update_action_hours_invested_on_frappe(
 
 
 async def event_exists(action_uuid: str):
+    if settings.frappe_event_lookup == "api":
+        return await event_exists_on_api(action_uuid)
+
     async with get_db_connection() as conn:
         row = await conn.fetchrow(
             'SELECT name FROM "tabEvents" WHERE name = $1',
             action_uuid,
         )
         return row is not None
+
+
+async def event_exists_on_api(action_uuid: str):
+    url = f"{settings.frappe_backend_base_url}/resource/Events/{action_uuid}"
+
+    headers = {
+        "Authorization": f"token {settings.frappe_backend_client_id}:{settings.frappe_backend_client_secret}",
+    }
+
+    response = await asyncio.to_thread(requests.request, "GET", url, headers=headers)
+
+    if response.status_code == 404:
+        return False
+
+    if response.status_code != 200:
+        raise Exception(
+            f"Failed to look up event on frappe: {response.text} for action {action_uuid}"
+        )
+
+    return True
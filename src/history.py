@@ -0,0 +1,101 @@
+from typing import Dict, List, Tuple
+from tokens import count_tokens
+
+# tokens the chat format adds around every message
+message_overhead_tokens = 4
+# older turns beyond the budget are condensed to this many words each
+condensed_message_max_words = 30
+
+# the condensed turns are sent as a system note, so that the model neither takes them as
+# something the student just said nor as a reply of its own to continue from
+condensed_history_header = "Summary of the earlier part of the conversation, for context only (each turn cut to its first words, not messages of this turn):"
+
+
+def count_message_tokens(message: Dict) -> int:
+    return message_overhead_tokens + count_tokens(message["content"])
+
+
+def count_messages_tokens(messages: List[Dict]) -> int:
+    return sum(count_message_tokens(message) for message in messages)
+
+
+def condense_message(message: Dict) -> str:
+    words = message["content"].split()
+    text = " ".join(words[:condensed_message_max_words])
+    if len(words) > condensed_message_max_words:
+        text += "..."
+
+    speaker = "Coach" if message["role"] == "assistant" else "Student"
+    return f"- {speaker}: {text}"
+
+
+def build_chat_history_window(
+    chat_history: List[Dict],
+    token_budget: int,
+    num_recent_messages: int,
+    num_pinned_messages: int = 0,
+) -> Tuple[List[Dict], Dict]:
+    """
+    Fits the chat history (without the system prompt) into the token budget:
+    - the first `num_pinned_messages` and the last `num_recent_messages` are always kept
+    - older messages are kept while they fit, the ones before are condensed into a single
+      system note marked as a summary, dropping the oldest ones that do not fit even then
+
+    Returns the messages to send along with their token counts before and after.
+    """
+    input_tokens = count_messages_tokens(chat_history)
+
+    num_pinned_messages = min(num_pinned_messages, len(chat_history))
+    num_recent_messages = min(
+        num_recent_messages, len(chat_history) - num_pinned_messages
+    )
+
+    pinned = chat_history[:num_pinned_messages]
+    recent = chat_history[len(chat_history) - num_recent_messages :]
+    older = chat_history[num_pinned_messages : len(chat_history) - num_recent_messages]
+
+    if input_tokens <= token_budget:
+        window = chat_history
+    else:
+        remaining_tokens = token_budget - count_messages_tokens(pinned + recent)
+
+        # walk back from the most recent of the older messages: keep them while
+        # they fit, then condense them into a single message while that fits
+        kept = []
+        condensed_lines = []
+        condensed_tokens = message_overhead_tokens + count_tokens(
+            condensed_history_header
+        )
+
+        for message in reversed(older):
+            if not condensed_lines:
+                message_tokens = count_message_tokens(message)
+                if message_tokens <= remaining_tokens - condensed_tokens:
+                    kept.insert(0, message)
+                    remaining_tokens -= message_tokens
+                    continue
+
+            line = condense_message(message)
+            line_tokens = count_tokens(line) + 1
+            if condensed_tokens + line_tokens > remaining_tokens:
+                break
+
+            condensed_lines.insert(0, line)
+            condensed_tokens += line_tokens
+
+        condensed = (
+            [
+                {
+                    "role": "system",
+                    "content": "\n".join([condensed_history_header] + condensed_lines),
+                }
+            ]
+            if condensed_lines
+            else []
+        )
+        window = pinned + condensed + kept + recent
+
+    return window, {
+        "input_tokens": input_tokens,
+        "window_tokens": count_messages_tokens(window),
+    }
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import traceback
+from typing import Awaitable, Callable, Dict
+from fastapi import HTTPException
+from settings import settings
+from metrics import increment, observe
+from db import (
+    create_job,
+    claim_next_job,
+    finish_job,
+    requeue_running_jobs,
+    add_job_event,
+    delete_finished_jobs,
+)
+
+logger = logging.getLogger(__name__)
+
+# a handler gets the payload of the job and a callback to report the progress of its stages
+JobHandler = Callable[[Dict, Callable[[str, str], Awaitable]], Awaitable[Dict]]
+
+job_handlers: Dict[str, JobHandler] = {}
+
+_new_job = asyncio.Event()
+_workers = []
+
+# attempts at storing the outcome of a job, e.g. while the database is locked by other writers
+finish_job_max_attempts = 5
+finish_job_retry_wait_seconds = 0.5
+
+
+def job_handler(kind: str):
+    def register(handler: JobHandler) -> JobHandler:
+        job_handlers[kind] = handler
+        return handler
+
+    return register
+
+
+async def enqueue_job(
+    kind: str,
+    payload: Dict,
+    dedup_key: str | None = None,
+    debounce_seconds: float | None = None,
+) -> Dict:
+    if kind not in job_handlers:
+        raise ValueError(f"No handler registered for job kind {kind}")
+
+    job = await create_job(kind, payload, dedup_key, debounce_seconds)
+    _new_job.set()
+    return job
+
+
+async def finish_job_with_retries(
+    job: Dict, status: str, result: Dict | None = None, error: str | None = None
+):
+    """
+    Stores the outcome of the job, retrying on database errors. When a result cannot be stored, the job is marked
+    failed instead, so that it does not stay running (and returned to new requests by the dedup) until a restart.
+    """
+    for attempt in range(finish_job_max_attempts):
+        try:
+            await finish_job(job["id"], status, result=result, error=error)
+            return
+        except Exception:
+            logger.exception(
+                f"Could not finish {job['kind']} job {job['uuid']} (attempt {attempt + 1})"
+            )
+            increment("jobs_finish_errors", kind=job["kind"])
+
+            if attempt < finish_job_max_attempts - 1:
+                await asyncio.sleep(finish_job_retry_wait_seconds * 2**attempt)
+
+    if status != "failed":
+        await finish_job(job["id"], "failed", error="Could not store the result of the job")
+
+
+async def run_job(job: Dict):
+    async def report_stage(stage: str, status: str):
+        await add_job_event(job["id"], stage, status)
+
+    logger.info(f"Running {job['kind']} job {job['uuid']}")
+    increment("jobs_started", kind=job["kind"])
+    started_at = asyncio.get_running_loop().time()
+
+    try:
+        result = await job_handlers[job["kind"]](job["payload"], report_stage)
+    except Exception as exception:
+        traceback.print_exc()
+        error = (
+            exception.detail if isinstance(exception, HTTPException) else str(exception)
+        )
+        await finish_job_with_retries(job, "failed", error=error)
+        increment("jobs_failed", kind=job["kind"])
+        return
+
+    await finish_job_with_retries(job, "completed", result=result)
+    increment("jobs_completed", kind=job["kind"])
+    observe(
+        "job_duration_seconds",
+        asyncio.get_running_loop().time() - started_at,
+        kind=job["kind"],
+    )
+
+
+async def run_job_worker():
+    while True:
+        try:
+            job = await claim_next_job()
+        except Exception:
+            logger.exception("Could not claim the next job")
+            job = None
+
+        if job is None:
+            _new_job.clear()
+            try:
+                # also poll in case a job was queued by another process
+                await asyncio.wait_for(
+                    _new_job.wait(), timeout=settings.job_poll_interval_seconds
+                )
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await run_job(job)
+        except Exception:
+            # the worker keeps going, the job is requeued on the next restart
+            logger.exception(f"Could not run {job['kind']} job {job['uuid']}")
+
+
+async def run_jobs_cleanup():
+    while True:
+        try:
+            num_deleted = await delete_finished_jobs(settings.job_retention_seconds)
+            increment("jobs_deleted", num_deleted)
+        except Exception:
+            logger.exception("Could not delete finished jobs")
+
+        await asyncio.sleep(settings.job_cleanup_interval_seconds)
+
+
+async def start_job_workers():
+    num_requeued = await requeue_running_jobs()
+    if num_requeued:
+        logger.info(f"Requeued {num_requeued} jobs interrupted by a restart")
+
+    for _ in range(settings.num_job_workers):
+        _workers.append(asyncio.create_task(run_job_worker()))
+
+    _workers.append(asyncio.create_task(run_jobs_cleanup()))
+
+
+async def stop_job_workers():
+    for worker in _workers:
+        worker.cancel()
+
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
@@ -1,137 +1,758 @@
-from typing import List
-import os
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import asyncio
+import json
+import logging
+import random
+import time
 import backoff
-import instructor
+import openai
 from openai import AsyncOpenAI
-from pydantic import BaseModel
+from openai.lib._pydantic import to_strict_json_schema
+from pydantic import BaseModel, ValidationError, create_model
+from pydantic_core import from_json
+from settings import settings
+from metrics import increment, observe, set_gauge
+from tokens import count_tokens
+from scheduler import LLMPriority, llm_scheduler
+from routing import (
+    route_model,
+    get_hedge_model,
+    record_model_call,
+    record_model_rate_limited,
+)
+
+logger = logging.getLogger(__name__)
+
+max_retry_wait_seconds = 30
+
+prompt_cache_key_prefix = "cmp_backend"
+
+# how often background calls check again for quota while interactive calls wait for it
+rate_limiter_poll_interval_seconds = 0.1
+
+
+# o-series and gpt-5 models, which reason before answering and reject sampling parameters;
+# matched by prefix so that dated snapshots (e.g. o4-mini-2025-04-16) are covered too
+reasoning_model_prefixes = ("o1", "o3", "o4", "gpt-5")
+# gpt-5 chat models do not reason
+non_reasoning_model_prefixes = ("gpt-5-chat",)
+
+sampling_parameters = ("temperature", "top_p")
 
 
 def is_reasoning_model(model: str) -> bool:
-    return model in [
-        "o3-mini-2025-01-31",
-        "o3-mini",
-        "o1-preview-2024-09-12",
-        "o1-preview",
-        "o1-mini",
-        "o1-mini-2024-09-12",
-        "o1",
-        "o1-2024-12-17",
-    ]
-
-
-@backoff.on_exception(backoff.expo, Exception, max_tries=5, factor=2)
-async def run_llm_with_instructor(
-    api_key: str,
+    return model.startswith(reasoning_model_prefixes) and not model.startswith(
+        non_reasoning_model_prefixes
+    )
+
+
+def get_model_kwargs(model: str, kwargs: Dict) -> Dict:
+    """The request parameters the model accepts, for the model routing actually picked."""
+    if not is_reasoning_model(model):
+        return kwargs
+
+    return {
+        name: value for name, value in kwargs.items() if name not in sampling_parameters
+    }
+
+
+def get_api_error(exception: BaseException) -> openai.APIError | None:
+    """Finds the openai error behind an exception, which may have been wrapped in other exceptions."""
+    while exception is not None:
+        if isinstance(exception, openai.APIError):
+            return exception
+
+        exception = exception.__cause__ or exception.__context__
+
+    return None
+
+
+def is_retryable_error(exception: BaseException) -> bool:
+    """Rate limits, server errors and timeouts are worth retrying; validation or auth errors will fail again."""
+    if isinstance(exception, asyncio.TimeoutError):
+        return True
+
+    api_error = get_api_error(exception)
+
+    if isinstance(api_error, openai.APIConnectionError):
+        # includes timeouts
+        return True
+
+    if isinstance(api_error, openai.APIStatusError):
+        return api_error.status_code in [408, 409, 429] or api_error.status_code >= 500
+
+    return False
+
+
+def get_retry_after_seconds(exception: BaseException) -> float | None:
+    api_error = get_api_error(exception)
+    if not isinstance(api_error, openai.APIStatusError):
+        return None
+
+    headers = api_error.response.headers
+
+    if retry_after_ms := headers.get("retry-after-ms"):
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_wait_gen(base: float = 1, max_value: float = max_retry_wait_seconds):
+    """
+    Wait generator for backoff: honours the Retry-After header of the error when present
+    and otherwise uses exponential backoff with full jitter.
+
+    backoff sends the exception that triggered the retry into the generator.
+    """
+    attempt = 0
+    exception = yield
+
+    while True:
+        retry_after = get_retry_after_seconds(exception)
+
+        if retry_after is not None:
+            wait = min(retry_after, max_value)
+        else:
+            wait = random.uniform(0, min(max_value, base * 2**attempt))
+
+        attempt += 1
+        exception = yield wait
+
+
+def _on_backoff(details):
+    exception = details["exception"]
+    api_error = get_api_error(exception)
+
+    increment(
+        "llm_retries",
+        error=type(api_error or exception).__name__,
+    )
+    logger.warning(
+        f"Retrying {details['target'].__name__} in {details['wait']:.1f}s after {type(exception).__name__}: {exception}"
+    )
+
+
+def _on_giveup(details):
+    increment("llm_failures", error=type(details["exception"]).__name__)
+
+
+retry_on_transient_errors = backoff.on_exception(
+    retry_wait_gen,
+    Exception,
+    max_tries=5,
+    giveup=lambda exception: not is_retryable_error(exception),
+    jitter=None,
+    on_backoff=_on_backoff,
+    on_giveup=_on_giveup,
+)
+
+
+class TokenBucketRateLimiter:
+    """
+    Process-wide limiter for the openai requests/minute and tokens/minute quotas.
+
+    Callers wait until both buckets have enough capacity instead of sending requests that
+    would come back with a 429. Background calls only take capacity while no interactive
+    call is waiting for it. A call reserves its input and max output tokens, the part of
+    the output it did not use is given back once its usage is known.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._available_requests = float(requests_per_minute)
+        self._available_tokens = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._num_waiting = {priority: 0 for priority in LLMPriority}
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.requests_per_minute > 0 and self.tokens_per_minute > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self._updated_at) / 60
+        self._updated_at = now
+
+        self._available_requests = min(
+            self.requests_per_minute,
+            self._available_requests + elapsed_minutes * self.requests_per_minute,
+        )
+        self._available_tokens = min(
+            self.tokens_per_minute,
+            self._available_tokens + elapsed_minutes * self.tokens_per_minute,
+        )
+
+    def _get_wait_seconds(self, num_tokens: int) -> float:
+        missing_requests = max(1 - self._available_requests, 0)
+        missing_tokens = max(num_tokens - self._available_tokens, 0)
+
+        return max(
+            missing_requests * 60 / self.requests_per_minute,
+            missing_tokens * 60 / self.tokens_per_minute,
+        )
+
+    def _update_gauges(self):
+        for priority in LLMPriority:
+            set_gauge(
+                "llm_rate_limiter_waiting",
+                self._num_waiting[priority],
+                priority=priority.value,
+            )
+
+    async def acquire(self, num_tokens: int, priority: LLMPriority):
+        if not self.is_enabled:
+            return
+
+        # a single request bigger than the whole quota would otherwise wait forever
+        num_tokens = min(num_tokens, self.tokens_per_minute)
+
+        self._num_waiting[priority] += 1
+        self._update_gauges()
+        started_at = time.monotonic()
+
+        try:
+            while True:
+                # checked and taken without awaiting in between, so no lock is needed and
+                # waiting callers do not hold up each other while they sleep
+                self._refill()
+                wait_seconds = self._get_wait_seconds(num_tokens)
+
+                if priority == LLMPriority.BACKGROUND and (
+                    self._num_waiting[LLMPriority.INTERACTIVE]
+                ):
+                    wait_seconds = max(wait_seconds, rate_limiter_poll_interval_seconds)
+
+                if wait_seconds <= 0:
+                    self._available_requests -= 1
+                    self._available_tokens -= num_tokens
+                    break
+
+                await asyncio.sleep(wait_seconds)
+        finally:
+            self._num_waiting[priority] -= 1
+            self._update_gauges()
+            increment(
+                "llm_rate_limiter_wait_seconds",
+                time.monotonic() - started_at,
+                priority=priority.value,
+            )
+
+    def reconcile(self, num_reserved_tokens: int, num_used_tokens: int | None):
+        """Gives back the tokens a call reserved but did not use."""
+        if not self.is_enabled or num_used_tokens is None:
+            return
+
+        self._refill()
+        self._available_tokens = min(
+            self.tokens_per_minute,
+            self._available_tokens
+            + max(min(num_reserved_tokens, self.tokens_per_minute) - num_used_tokens, 0),
+        )
+
+
+rate_limiter = TokenBucketRateLimiter(
+    settings.openai_requests_per_minute, settings.openai_tokens_per_minute
+)
+
+# environments that may run without the openai quotas, e.g. locally or against the stand-ins
+rate_limiter_optional_envs = ["development", "test"]
+
+
+def check_rate_limiter_configured():
+    """Fails the startup when the quotas are missing, instead of sending requests unthrottled into 429s."""
+    if rate_limiter.is_enabled:
+        return
+
+    env = settings.env or "development"
+    if env in rate_limiter_optional_envs:
+        logger.warning("The openai quotas are not set, the rate limiter is disabled")
+        return
+
+    raise RuntimeError(
+        f"OPENAI_REQUESTS_PER_MINUTE and OPENAI_TOKENS_PER_MINUTE must be set from the limits of the account's usage tier when ENV is {env}"
+    )
+
+
+def estimate_request_tokens(messages: List, max_output_tokens: int) -> int:
+    # openai counts the max output tokens against the quota along with the input
+    return count_tokens(json.dumps(messages, ensure_ascii=False)) + max_output_tokens
+
+
+@lru_cache(maxsize=None)
+def get_openai_client(api_key: str) -> AsyncOpenAI:
+    # retries are handled by retry_on_transient_errors
+    return AsyncOpenAI(
+        api_key=api_key, base_url=settings.openai_base_url, max_retries=0
+    )
+
+
+@asynccontextmanager
+async def llm_call_slot(priority: LLMPriority, num_tokens: int):
+    """Waits for the scheduler to let a call of this priority through and for the quota to have room for it."""
+    await llm_scheduler.acquire(priority)
+
+    try:
+        await rate_limiter.acquire(num_tokens, priority)
+        yield
+    finally:
+        llm_scheduler.release(priority)
+
+
+async def _open_stream(stream):
+    """Waits for the first chunk so that errors from opening the stream can be retried."""
+    try:
+        first_chunk = await anext(stream)
+    except StopAsyncIteration:
+        return stream, None
+    except BaseException:
+        await stream.aclose()
+        raise
+
+    return stream, first_chunk
+
+
+async def _open_recorded_stream(create_stream, stage: str, model: str):
+    started_at = time.perf_counter()
+
+    try:
+        stream, first_chunk = await _open_stream(create_stream(model))
+    except Exception as exception:
+        record_failed_call(stage, model, exception, time.perf_counter() - started_at)
+        raise
+
+    # the time to the first chunk is what a stream is routed on
+    record_model_call(stage, model, time.perf_counter() - started_at, failed=False)
+
+    return stream, first_chunk
+
+
+async def _race_streams(attempts: Dict[asyncio.Task, str]) -> Tuple[str, Tuple]:
+    """Waits for the first attempt to open its stream and cancels the others."""
+    pending = set(attempts)
+    winner = None
+    exception = None
+
+    try:
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            for task in done:
+                if task.exception() is not None:
+                    exception = task.exception()
+                elif winner is None:
+                    winner = task
+                else:
+                    # both came back at once
+                    await task.result()[0].aclose()
+    finally:
+        for task in pending:
+            task.cancel()
+
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, tuple):
+                await result[0].aclose()
+
+    if winner is None:
+        raise exception
+
+    return attempts[winner], winner.result()
+
+
+async def _open_hedged_stream(
+    create_stream,
+    priority: LLMPriority,
+    num_tokens: int,
+    stage: str,
     model: str,
-    messages: List,
-    response_model: BaseModel,
-    max_completion_tokens: int,
+    hedge_model: str,
+    hedge_after_seconds: float,
 ):
-    client = instructor.from_openai(AsyncOpenAI(api_key=api_key))
+    """
+    Sends a second identical request to `hedge_model` when the first chunk of `model` takes
+    longer than `hedge_after_seconds` and keeps whichever stream starts first.
+    """
+    started_at = time.perf_counter()
+    increment("llm_hedgeable_streams", stage=stage)
+    primary = asyncio.create_task(_open_recorded_stream(create_stream, stage, model))
 
-    model_kwargs = {}
+    try:
+        done, _ = await asyncio.wait([primary], timeout=hedge_after_seconds)
+        if done:
+            return await primary
 
-    if not is_reasoning_model(model):
-        model_kwargs["temperature"] = 0
-
-    return await client.chat.completions.create(
-        model=model,
-        messages=messages,
-        response_model=response_model,
-        max_completion_tokens=max_completion_tokens,
-        store=True,
-        **model_kwargs,
+        # hedges never queue for a slot, under load they would only add to the queue
+        if not llm_scheduler.try_acquire(priority):
+            increment("llm_hedges_skipped", stage=stage)
+            return await primary
+
+        try:
+
+            async def open_hedge():
+                await rate_limiter.acquire(num_tokens, priority)
+                return await _open_recorded_stream(create_stream, stage, hedge_model)
+
+            increment("llm_hedges", stage=stage, model=hedge_model)
+            winner, opened = await _race_streams(
+                {primary: "primary", asyncio.create_task(open_hedge()): "hedge"}
+            )
+        finally:
+            # the winner goes on with the slot of the original request
+            llm_scheduler.release(priority)
+    except BaseException:
+        primary.cancel()
+        raise
+
+    increment("llm_hedge_wins", stage=stage, winner=winner)
+
+    if winner == "hedge":
+        # the cancelled request never reports its latency, it was at least this slow
+        record_model_call(stage, model, time.perf_counter() - started_at, failed=False)
+
+    return opened
+
+
+async def _open_scheduled_stream(
+    create_stream,
+    priority: LLMPriority,
+    num_tokens: int,
+    stage: str,
+    model: str,
+    hedge_model: str | None = None,
+):
+    """`create_stream` is called with the model to stream from."""
+    # unlike other calls, a stream holds on to its scheduler slot until it is closed
+    await llm_scheduler.acquire(priority)
+
+    try:
+        await rate_limiter.acquire(num_tokens, priority)
+
+        hedge_after_seconds = settings.llm_hedge_after_seconds.get(stage)
+        if hedge_model is None or hedge_after_seconds is None:
+            stream, first_chunk = await _open_recorded_stream(
+                create_stream, stage, model
+            )
+        else:
+            stream, first_chunk = await _open_hedged_stream(
+                create_stream,
+                priority,
+                num_tokens,
+                stage,
+                model,
+                hedge_model,
+                hedge_after_seconds,
+            )
+    except BaseException:
+        llm_scheduler.release(priority)
+        raise
+
+    return _resume_stream(stream, first_chunk, priority)
+
+
+async def _resume_stream(stream, first_chunk, priority: LLMPriority):
+    try:
+        if first_chunk is not None:
+            yield first_chunk
+
+        async for chunk in stream:
+            yield chunk
+    finally:
+        llm_scheduler.release(priority)
+        await stream.aclose()
+
+
+def record_failed_call(
+    stage: str, model: str, exception: Exception, latency_seconds: float
+):
+    # rate limits apply to the model, so calls go to its fallbacks instead of holding
+    # back every call of the process
+    if isinstance(get_api_error(exception), openai.RateLimitError):
+        record_model_rate_limited(model, get_retry_after_seconds(exception))
+
+    record_model_call(stage, model, latency_seconds, failed=True)
+
+
+def get_prompt_cache_key(stage: str) -> str:
+    """
+    The requests of a stage share the prefix of their prompt (the system prompt and the
+    schema), so they are routed to the same prompt cache.
+    """
+    return f"{prompt_cache_key_prefix}:{stage}"
+
+
+def record_usage(response, stage: str) -> int | None:
+    """Returns the tokens the call counted against the quota, when openai reported them."""
+    usage = response.usage
+    if usage is None:
+        return None
+
+    cached_tokens = (
+        usage.input_tokens_details.cached_tokens if usage.input_tokens_details else 0
     )
 
+    increment("llm_input_tokens", usage.input_tokens, stage=stage)
+    increment("llm_cached_input_tokens", cached_tokens, stage=stage)
+    increment("llm_output_tokens", usage.output_tokens, stage=stage)
 
-@backoff.on_exception(backoff.expo, Exception, max_tries=5, factor=2)
-async def stream_llm_with_instructor(
+    if usage.input_tokens:
+        observe(
+            "llm_prompt_cache_hit_ratio",
+            cached_tokens / usage.input_tokens,
+            stage=stage,
+        )
+
+    return usage.input_tokens + usage.output_tokens
+
+
+@retry_on_transient_errors
+async def run_llm_responses(
     api_key: str,
-    model: str,
-    messages: List,
-    response_model: BaseModel,
-    max_completion_tokens: int,
+    model: str | None,
+    input: List,
+    max_output_tokens: int,
+    priority: LLMPriority = LLMPriority.INTERACTIVE,
+    stage: str = "unknown",
     **kwargs,
 ):
-    client = instructor.from_openai(AsyncOpenAI(api_key=api_key))
+    """Routes the call to a model of the stage when `model` is None, again on every retry."""
+    client = get_openai_client(api_key)
+    model = model or route_model(stage, estimate_request_tokens(input, 0))
+    num_tokens = estimate_request_tokens(input, max_output_tokens)
 
-    model_kwargs = {}
+    async with llm_call_slot(priority, num_tokens):
+        started_at = time.perf_counter()
+        try:
+            response = await client.responses.create(
+                model=model,
+                input=input,
+                max_output_tokens=max_output_tokens,
+                store=True,
+                prompt_cache_key=get_prompt_cache_key(stage),
+                **get_model_kwargs(model, kwargs),
+            )
+        except Exception as exception:
+            record_failed_call(stage, model, exception, time.perf_counter() - started_at)
+            raise
 
-    if not is_reasoning_model(model):
-        model_kwargs["temperature"] = 0
-
-    model_kwargs.update(kwargs)
-
-    return client.chat.completions.create_partial(
-        model=model,
-        messages=messages,
-        response_model=response_model,
-        stream=True,
-        max_completion_tokens=max_completion_tokens,
-        store=True,
-        **model_kwargs,
+    record_model_call(stage, model, time.perf_counter() - started_at, failed=False)
+    rate_limiter.reconcile(num_tokens, record_usage(response, stage))
+    return response
+
+
+class StructuredOutputError(Exception):
+    pass
+
+
+@lru_cache(maxsize=256)
+def get_strict_json_schema(text_format: type[BaseModel]) -> Dict:
+    """The JSON schema that is sent once with the request as its text format; not to be modified."""
+    return to_strict_json_schema(text_format)
+
+
+@lru_cache(maxsize=256)
+def count_schema_tokens(text_format: type[BaseModel]) -> int:
+    return count_tokens(json.dumps(get_strict_json_schema(text_format)))
+
+
+@lru_cache(maxsize=256)
+def get_partial_model(text_format: type[BaseModel]) -> type[BaseModel]:
+    """The same fields as `text_format`, all optional, to validate the output while it streams in."""
+    return create_model(
+        f"Partial{text_format.__name__}",
+        **{
+            name: (field.annotation | None, None)
+            for name, field in text_format.model_fields.items()
+        },
+    )
+
+
+def get_structured_output(response, text_format: type[BaseModel], stage: str):
+    """
+    Strict outputs always match the schema, so instead of re-asking, a response without
+    a parsed output (a refusal or an output cut off by the token limit) fails the call.
+    """
+    if response.output_parsed is not None:
+        return response.output_parsed
+
+    reason = (
+        response.incomplete_details.reason
+        if response.incomplete_details
+        else "refusal"
+    )
+    increment("llm_structured_output_failures", stage=stage, reason=reason)
+    raise StructuredOutputError(
+        f"No {text_format.__name__} in the response for {stage} ({reason})"
     )
 
 
-@backoff.on_exception(backoff.expo, Exception, max_tries=5, factor=2)
-async def stream_llm_responses_with_instructor(
+def record_structured_output_request(
+    text_format: type[BaseModel], input: List, max_output_tokens: int, stage: str
+) -> int:
+    """Records the tokens the schema adds and returns the tokens to reserve for the request."""
+    schema_tokens = count_schema_tokens(text_format)
+    observe("llm_schema_tokens", schema_tokens, stage=stage)
+    increment("llm_structured_output_requests", stage=stage)
+
+    return estimate_request_tokens(input, max_output_tokens) + schema_tokens
+
+
+@retry_on_transient_errors
+async def parse_llm_responses(
     api_key: str,
-    model: str,
+    model: str | None,
     input: List,
-    response_model: BaseModel,
+    text_format: type[BaseModel],
     max_output_tokens: int,
+    priority: LLMPriority = LLMPriority.INTERACTIVE,
+    stage: str = "unknown",
+    with_model: bool = False,
     **kwargs,
 ):
-    os.environ["OPENAI_API_KEY"] = api_key
+    """
+    Returns the output parsed into `text_format`, along with the model that answered if
+    `with_model`. Routes the call to a model of the stage when `model` is None, again on
+    every retry.
+    """
+    client = get_openai_client(api_key)
 
-    client = instructor.from_provider(
-        model=f"openai/{model}",
-        mode=instructor.Mode.RESPONSES_TOOLS,
-        async_client=True,
+    num_tokens = record_structured_output_request(
+        text_format, input, max_output_tokens, stage
     )
+    model = model or route_model(stage, num_tokens - max_output_tokens)
 
-    model_kwargs = {}
+    async with llm_call_slot(priority, num_tokens):
+        started_at = time.perf_counter()
+        try:
+            response = await client.responses.parse(
+                model=model,
+                input=input,
+                text_format=text_format,
+                max_output_tokens=max_output_tokens,
+                store=True,
+                prompt_cache_key=get_prompt_cache_key(stage),
+                **get_model_kwargs(model, kwargs),
+            )
+        except Exception as exception:
+            record_failed_call(stage, model, exception, time.perf_counter() - started_at)
 
-    if not is_reasoning_model(model):
-        model_kwargs["temperature"] = 0
+            if isinstance(exception, ValidationError):
+                increment(
+                    "llm_structured_output_failures", stage=stage, reason="invalid"
+                )
+            raise
 
-    model_kwargs.update(kwargs)
+    record_model_call(stage, model, time.perf_counter() - started_at, failed=False)
+    rate_limiter.reconcile(num_tokens, record_usage(response, stage))
+    output = get_structured_output(response, text_format, stage)
 
-    return client.responses.create_partial(
-        input=input,
-        response_model=response_model,
-        stream=True,
-        max_output_tokens=max_output_tokens,
-        store=True,
-        **model_kwargs,
-    )
+    return (output, model) if with_model else output
+
+
+async def _stream_structured_output(
+    client: AsyncOpenAI,
+    text_format: type[BaseModel],
+    stage: str,
+    num_reserved_tokens: int,
+    **kwargs,
+):
+    """
+    Yields the output validated into the partial model as it streams in and the complete
+    output parsed into `text_format` at the end.
+    """
+    partial_model = get_partial_model(text_format)
+    last_output = None
 
+    async with client.responses.stream(text_format=text_format, **kwargs) as stream:
+        async for event in stream:
+            if event.type != "response.output_text.delta":
+                continue
 
-@backoff.on_exception(backoff.expo, Exception, max_tries=5, factor=2)
-async def run_llm_responses_with_instructor(
+            try:
+                output = from_json(event.snapshot, allow_partial="trailing-strings")
+                partial = partial_model.model_validate(output)
+            except ValueError:
+                # e.g. a literal that has only partly streamed in yet
+                continue
+
+            # deltas that only open a key or a value do not change the output
+            if output != last_output:
+                last_output = output
+                yield partial
+
+        try:
+            response = await stream.get_final_response()
+        except ValidationError:
+            increment("llm_structured_output_failures", stage=stage, reason="invalid")
+            raise
+
+    rate_limiter.reconcile(num_reserved_tokens, record_usage(response, stage))
+    yield get_structured_output(response, text_format, stage)
+
+
+@retry_on_transient_errors
+async def stream_llm_responses(
     api_key: str,
-    model: str,
+    model: str | None,
     input: List,
-    response_model: BaseModel,
+    text_format: type[BaseModel],
     max_output_tokens: int,
+    priority: LLMPriority = LLMPriority.INTERACTIVE,
+    stage: str = "unknown",
+    **kwargs,
 ):
-    os.environ["OPENAI_API_KEY"] = api_key
+    """
+    Routes the stream to a model of the stage when `model` is None, again on every retry.
+    Streams of the stages in `settings.llm_hedge_after_seconds` are hedged.
+    """
+    client = get_openai_client(api_key)
 
-    client = instructor.from_provider(
-        model=f"openai/{model}",
-        mode=instructor.Mode.RESPONSES_TOOLS,
-        async_client=True,
+    num_tokens = record_structured_output_request(
+        text_format, input, max_output_tokens, stage
+    )
+    model = model or route_model(stage, num_tokens - max_output_tokens)
+    hedge_model = (
+        get_hedge_model(stage, model, num_tokens - max_output_tokens)
+        if stage in settings.llm_hedge_after_seconds
+        else None
     )
 
-    model_kwargs = {}
-
-    if not is_reasoning_model(model):
-        model_kwargs["temperature"] = 0
-
-    return await client.responses.create(
-        input=input,
-        response_model=response_model,
-        max_output_tokens=max_output_tokens,
-        store=True,
-        **model_kwargs,
+    return await _open_scheduled_stream(
+        lambda model: _stream_structured_output(
+            client,
+            text_format,
+            stage,
+            num_tokens,
+            model=model,
+            input=input,
+            max_output_tokens=max_output_tokens,
+            store=True,
+            prompt_cache_key=get_prompt_cache_key(stage),
+            # the model of the attempt, which differs for hedges
+            **get_model_kwargs(model, kwargs),
+        ),
+        priority,
+        num_tokens,
+        stage,
+        model,
+        hedge_model,
     )
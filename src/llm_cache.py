@@ -0,0 +1,77 @@
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Tuple
+from settings import settings
+from metrics import increment
+from routing import get_primary_model
+from db import get_llm_cache_entry, set_llm_cache_entry, evict_llm_cache_entries
+
+logger = logging.getLogger(__name__)
+
+
+def get_llm_cache_key(stage: str, model: str, prompt_version: int, inputs: Any) -> str:
+    normalised_inputs = json.dumps(
+        inputs, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(
+        f"{stage}\n{model}\n{prompt_version}\n{normalised_inputs}".encode()
+    ).hexdigest()
+
+
+async def run_cached_llm_stage(
+    stage: str,
+    num_input_tokens: int,
+    prompt_version: int,
+    inputs: Any,
+    run: Callable[[], Awaitable[Tuple[Any, str]]],
+    use_cache: bool = True,
+) -> Any:
+    """
+    Returns the stored response of an earlier call of the primary model of the stage (see
+    routing.py) with the same prompt version and inputs, calling `run` otherwise. `run`
+    routes the call itself, so that cache hits are not counted as routed calls and retries
+    can fall back, and returns the response along with the model that answered. Responses
+    of fallback models are not stored, so that they are never served in place of the
+    primary model. Only meant for stages that are deterministic (temperature 0) and whose
+    response is JSON serialisable.
+
+    Bump the prompt version of a stage whenever its prompt or the handling of its response
+    changes so that stale responses are not served.
+    """
+    primary_model = get_primary_model(stage, num_input_tokens)
+
+    if not settings.llm_cache_enabled or not use_cache or primary_model is None:
+        response, _ = await run()
+        return response
+
+    key = get_llm_cache_key(stage, primary_model, prompt_version, inputs)
+
+    try:
+        cached_response = await get_llm_cache_entry(key)
+    except Exception:
+        logger.exception(f"Could not read the llm cache for {stage}")
+        cached_response = None
+
+    if cached_response is not None:
+        increment("llm_cache_hits", stage=stage)
+        return json.loads(cached_response)
+
+    increment("llm_cache_misses", stage=stage)
+
+    response, model = await run()
+
+    if model != primary_model:
+        increment("llm_cache_fallback_responses_skipped", stage=stage, model=model)
+        return response
+
+    # a failing cache must never fail the request
+    try:
+        await set_llm_cache_entry(key, stage, model, json.dumps(response))
+        num_evicted = await evict_llm_cache_entries(settings.llm_cache_max_bytes)
+        if num_evicted:
+            increment("llm_cache_evictions", num_evicted)
+    except Exception:
+        logger.exception(f"Could not write to the llm cache for {stage}")
+
+    return response
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from typing import List
 import json
 import numpy as np
@@ -25,7 +27,6 @@ from models import (
 import traceback
 from settings import settings
 from pydantic import BaseModel, Field
-from langchain_core.output_parsers import PydanticOutputParser
 from ai import router, get_basic_action_response_from_chat_history
 from db import (
     create_user,
@@ -38,6 +39,10 @@ from db import (
     get_user_id_by_email,
     update_action_hours_invested,
 )
+from metrics import get_metrics
+from jobs import start_job_workers, stop_job_workers
+from tokens import load_encoding
+from llm import check_rate_limiter_configured
 from frappe import (
     login_user,
     login_user_with_sso,
@@ -54,7 +59,17 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)]
 )
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    check_rate_limiter_configured()
+    # the first load may fetch the encoding files, keep it out of the first request
+    await asyncio.to_thread(load_encoding)
+    await start_job_workers()
+    yield
+    await stop_job_workers()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(router)
 
@@ -66,6 +81,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # lets clients read the id needed to resume a dropped chat stream
+    expose_headers=["X-Stream-Id"],
 )
 
 
@@ -290,3 +307,8 @@ async def get_username(token: str) -> str:
 @app.api_route("/health", methods=["GET", "HEAD"])
 async def health_check():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return get_metrics()
@@ -0,0 +1,80 @@
+from collections import defaultdict, deque
+from typing import Dict
+import numpy as np
+
+# number of recent observations kept per series for the percentiles
+max_observations_per_series = 1000
+
+_counters: Dict[str, float] = defaultdict(float)
+_gauges: Dict[str, float] = {}
+_observations: Dict[str, deque] = defaultdict(
+    lambda: deque(maxlen=max_observations_per_series)
+)
+
+
+def _series_key(name: str, labels: Dict) -> str:
+    if not labels:
+        return name
+
+    labels_as_str = ",".join(f"{key}={value}" for key, value in sorted(labels.items()))
+    return f"{name}{{{labels_as_str}}}"
+
+
+def increment(name: str, value: float = 1, **labels):
+    _counters[_series_key(name, labels)] += value
+
+
+def set_gauge(name: str, value: float, **labels):
+    _gauges[_series_key(name, labels)] = value
+
+
+def observe(name: str, value: float, **labels):
+    _observations[_series_key(name, labels)].append(value)
+
+
+def get_counter(name: str, **labels) -> float:
+    return _counters.get(_series_key(name, labels), 0)
+
+
+def get_mean(name: str, **labels) -> float | None:
+    values = _observations.get(_series_key(name, labels))
+    if not values:
+        return None
+
+    return float(np.mean(values))
+
+
+def get_percentile(name: str, percentile: float, **labels) -> float | None:
+    values = _observations.get(_series_key(name, labels))
+    if not values:
+        return None
+
+    return float(np.percentile(values, percentile))
+
+
+def get_metrics() -> Dict:
+    histograms = {}
+    for key, values in _observations.items():
+        if not values:
+            continue
+
+        histograms[key] = {
+            "count": len(values),
+            "mean": float(np.mean(values)),
+            "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(np.max(values)),
+        }
+
+    return {
+        "counters": dict(_counters),
+        "gauges": dict(_gauges),
+        "histograms": histograms,
+    }
+
+
+def reset_metrics():
+    _counters.clear()
+    _gauges.clear()
+    _observations.clear()
@@ -1,5 +1,5 @@
-from db import get_new_db_connection
-from config import users_table_name
+from db import get_new_db_connection, split_chat_message_content
+from config import users_table_name, chat_history_table_name
 
 
 async def migrate_users_table():
@@ -16,8 +16,61 @@ async def migrate_users_table():
         await conn.commit()
 
 
+async def migrate_chat_history_table():
+    async with get_new_db_connection() as conn:
+        cursor = await conn.cursor()
+
+        # assistant turns used to be stored as the JSON output of the coach in the content column
+        result = await cursor.execute(f"PRAGMA table_info({chat_history_table_name})")
+        columns = await result.fetchall()
+        column_names = [col[1] for col in columns]
+        for column_name, column_type in [
+            ("chain_of_thought", "TEXT"),
+            ("is_done", "BOOLEAN"),
+            ("create_action", "BOOLEAN"),
+            ("language", "TEXT"),
+        ]:
+            if column_name not in column_names:
+                await cursor.execute(
+                    f"ALTER TABLE {chat_history_table_name} ADD COLUMN {column_name} {column_type}"
+                )
+
+        result = await cursor.execute(
+            f"SELECT id, content FROM {chat_history_table_name} WHERE role = 'assistant' AND is_done IS NULL"
+        )
+        messages = await result.fetchall()
+
+        values = []
+        for message_id, content in messages:
+            split_columns = split_chat_message_content("assistant", content)
+            if split_columns["is_done"] is None:
+                continue
+
+            values.append(
+                (
+                    split_columns["content"],
+                    split_columns["chain_of_thought"],
+                    split_columns["is_done"],
+                    split_columns["create_action"],
+                    split_columns["language"],
+                    message_id,
+                )
+            )
+
+        await cursor.executemany(
+            f"UPDATE {chat_history_table_name} SET content = ?, chain_of_thought = ?, is_done = ?, create_action = ?, language = ? WHERE id = ?",
+            values,
+        )
+
+        await conn.commit()
+
+        if values:
+            print(f"Backfilled {len(values)} assistant messages into separate columns.")
+
+
 async def run_migrations():
     await migrate_users_table()
+    await migrate_chat_history_table()
 
 
 if __name__ == "__main__":
@@ -2,7 +2,7 @@ from calendar import c
 from datetime import datetime
 from enum import Enum
 from pydantic import BaseModel
-from typing import List, Optional, Literal
+from typing import Dict, List, Optional, Literal
 
 
 class ChatRole(str, Enum):
@@ -391,11 +391,15 @@ class AIUpdateActionMetadataResponse(AIActionMetadataResponse):
 class BasicActionChatRequest(BaseModel):
     action_uuid: str
     last_user_message: str
+    # store the user message and the final response once the stream completes
+    persist: bool = False
 
 
 class DetailActionChatRequest(BaseModel):
     action_uuid: str
     last_user_message: str
+    # store the user message and the final response once the stream completes
+    persist: bool = False
 
 
 class AIChatResponse(BaseModel):
@@ -414,3 +418,22 @@ class CreateActionResponse(BaseModel):
 class UpdateActionHoursInvestedRequest(BaseModel):
     time_invested_value: float
     time_invested_unit: Literal["minutes", "hours"]
+
+
+class JobEvent(BaseModel):
+    id: int
+    stage: str
+    status: Literal["started", "completed", "failed"]
+    created_at: datetime
+
+
+class Job(BaseModel):
+    job_id: str
+    kind: str
+    status: Literal["queued", "running", "completed", "failed"]
+    result: Dict | None = None
+    error: str | None = None
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    events: List[JobEvent] | None = None
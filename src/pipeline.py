@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List
+from metrics import increment, observe
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    name: str
+    # receives the results of the stages run so far, keyed by stage name
+    run: Callable[[Dict[str, Any]], Awaitable[Any]]
+    depends_on: List[str] = field(default_factory=list)
+    timeout: float | None = None
+
+
+async def _run_stage(
+    pipeline: str,
+    stage: Stage,
+    results: Dict[str, Any],
+    report_stage: Callable | None,
+):
+    if report_stage:
+        await report_stage(stage.name, "started")
+
+    started_at = time.perf_counter()
+
+    try:
+        result = await asyncio.wait_for(stage.run(results), timeout=stage.timeout)
+    except Exception as exception:
+        if isinstance(exception, asyncio.TimeoutError):
+            logger.error(f"Stage {stage.name} of {pipeline} timed out after {stage.timeout}s")
+            increment("pipeline_stage_timeouts", pipeline=pipeline, stage=stage.name)
+
+        increment("pipeline_stage_failures", pipeline=pipeline, stage=stage.name)
+
+        if report_stage:
+            await report_stage(stage.name, "failed")
+
+        raise
+
+    observe(
+        "pipeline_stage_seconds",
+        time.perf_counter() - started_at,
+        pipeline=pipeline,
+        stage=stage.name,
+    )
+
+    if report_stage:
+        await report_stage(stage.name, "completed")
+
+    return result
+
+
+async def run_stage_graph(
+    pipeline: str, stages: List[Stage], report_stage: Callable | None = None
+) -> Dict[str, Any]:
+    """
+    Runs every stage as soon as the stages it depends on are done, so that independent
+    stages run concurrently. Returns the result of each stage keyed by its name.
+
+    If a stage fails, the stages still running are cancelled and the error is raised.
+    """
+    pending = {stage.name: stage for stage in stages}
+
+    for stage in stages:
+        for dependency in stage.depends_on:
+            if dependency not in pending:
+                raise ValueError(
+                    f"Stage {stage.name} of {pipeline} depends on unknown stage {dependency}"
+                )
+
+    results = {}
+    running: Dict[asyncio.Task, Stage] = {}
+    started_at = time.perf_counter()
+
+    try:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(dependency in results for dependency in stage.depends_on):
+                    del pending[name]
+                    task = asyncio.create_task(
+                        _run_stage(pipeline, stage, results, report_stage)
+                    )
+                    running[task] = stage
+
+            if not running:
+                raise ValueError(
+                    f"Stages {list(pending)} of {pipeline} have circular dependencies"
+                )
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                stage = running.pop(task)
+                results[stage.name] = task.result()
+    finally:
+        for task in running:
+            task.cancel()
+
+        await asyncio.gather(*running, return_exceptions=True)
+
+    observe("pipeline_seconds", time.perf_counter() - started_at, pipeline=pipeline)
+
+    return results
@@ -0,0 +1,227 @@
+import logging
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Tuple
+import numpy as np
+from settings import settings
+from metrics import increment, set_gauge
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelCandidate:
+    model: str
+    # only picked for requests of up to this many input tokens
+    max_input_tokens: int | None = None
+
+
+# ranked models of each stage: the first one that is enabled, fits the request and is
+# healthy is used, the ones after it are the fallbacks
+stage_routes: Dict[str, List[ModelCandidate]] = {
+    "basic_action_chat": [
+        ModelCandidate("gpt-4.1-2025-04-14"),
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+    ],
+    "detail_action_chat": [
+        ModelCandidate("gpt-4.1-2025-04-14"),
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+    ],
+    # the non-streaming chat endpoints wait for the whole response
+    "basic_action_chat_sync": [
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+        ModelCandidate("gpt-4.1-nano-2025-04-14", max_input_tokens=8000),
+    ],
+    "detail_action_chat_sync": [
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+        ModelCandidate("gpt-4.1-nano-2025-04-14", max_input_tokens=8000),
+    ],
+    "action_metadata": [
+        ModelCandidate("gpt-4.1-2025-04-14"),
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+    ],
+    "action_classification": [
+        ModelCandidate("gpt-4.1-2025-04-14"),
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+    ],
+    "action_subclassification": [
+        ModelCandidate("gpt-4.1-2025-04-14"),
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+    ],
+    "skill_relevance": [
+        ModelCandidate("gpt-4.1-2025-04-14"),
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+    ],
+    "profile_summary": [
+        ModelCandidate("gpt-4.1-2025-04-14"),
+        ModelCandidate("gpt-4.1-mini-2025-04-14"),
+    ],
+}
+
+# p95 latency each stage should stay under: the time to the first chunk for streams and
+# the time of the whole call otherwise
+stage_latency_slo_seconds: Dict[str, float] = {
+    "basic_action_chat": 4,
+    "detail_action_chat": 4,
+    "basic_action_chat_sync": 15,
+    "detail_action_chat_sync": 15,
+    "action_metadata": 30,
+    "action_classification": 20,
+    "action_subclassification": 10,
+    "skill_relevance": 60,
+    "profile_summary": 60,
+}
+
+
+class NoModelAvailableError(Exception):
+    pass
+
+
+# (finished at, latency in seconds, failed) of the recent calls of each stage and model
+_calls: Dict[Tuple[str, str], Deque[Tuple[float, float, bool]]] = defaultdict(deque)
+# rate limits apply to a model across every stage
+_rate_limited_until: Dict[str, float] = {}
+
+
+def get_stage_route(stage: str) -> List[ModelCandidate]:
+    if stage in settings.llm_model_routes:
+        return [ModelCandidate(model) for model in settings.llm_model_routes[stage]]
+
+    if stage not in stage_routes:
+        raise ValueError(f"No models configured for {stage}")
+
+    return stage_routes[stage]
+
+
+def _get_recent_calls(stage: str, model: str) -> Deque[Tuple[float, float, bool]]:
+    calls = _calls[(stage, model)]
+    window_start = time.monotonic() - settings.llm_routing_window_seconds
+
+    while calls and calls[0][0] < window_start:
+        calls.popleft()
+
+    return calls
+
+
+def get_unhealthy_reason(stage: str, model: str) -> str | None:
+    if _rate_limited_until.get(model, 0) > time.monotonic():
+        return "rate_limited"
+
+    calls = _get_recent_calls(stage, model)
+
+    # too few calls to tell, e.g. right after a fallback: the model gets traffic again
+    # until there are enough calls to judge it
+    if len(calls) < settings.llm_routing_min_calls:
+        return None
+
+    error_rate = sum(failed for _, _, failed in calls) / len(calls)
+    if error_rate > settings.llm_routing_max_error_rate:
+        return "error_rate"
+
+    latencies = [latency for _, latency, failed in calls if not failed]
+    slo = settings.llm_stage_latency_slo_seconds.get(
+        stage, stage_latency_slo_seconds.get(stage)
+    )
+    if latencies and slo is not None and np.percentile(latencies, 95) > slo:
+        return "latency"
+
+    return None
+
+
+def get_candidates(stage: str, num_input_tokens: int) -> List[ModelCandidate]:
+    return [
+        candidate
+        for candidate in get_stage_route(stage)
+        if candidate.model not in settings.llm_disabled_models
+        and (
+            candidate.max_input_tokens is None
+            or num_input_tokens <= candidate.max_input_tokens
+        )
+    ]
+
+
+def route_model(stage: str, num_input_tokens: int = 0) -> str:
+    """
+    Picks the model for a call of the stage: the highest ranked model that is not switched
+    off, fits the request and is neither rate limited nor breaching the latency SLO or the
+    error rate of the stage. If every model is unhealthy, the highest ranked one is used.
+    """
+    candidates = get_candidates(stage, num_input_tokens)
+
+    if not candidates:
+        raise NoModelAvailableError(
+            f"Every model of {stage} is switched off or too small for {num_input_tokens} tokens"
+        )
+
+    first_unhealthy_reason = None
+
+    for candidate in candidates:
+        unhealthy_reason = get_unhealthy_reason(stage, candidate.model)
+
+        if unhealthy_reason is None:
+            if first_unhealthy_reason is not None:
+                increment(
+                    "llm_model_fallbacks",
+                    stage=stage,
+                    model=candidate.model,
+                    reason=first_unhealthy_reason,
+                )
+
+            increment("llm_model_routed", stage=stage, model=candidate.model)
+            return candidate.model
+
+        first_unhealthy_reason = first_unhealthy_reason or unhealthy_reason
+
+    logger.warning(f"Every model of {stage} is unhealthy, using {candidates[0].model}")
+    increment("llm_model_all_unhealthy", stage=stage)
+    increment("llm_model_routed", stage=stage, model=candidates[0].model)
+
+    return candidates[0].model
+
+
+def get_primary_model(stage: str, num_input_tokens: int = 0) -> str | None:
+    """The highest ranked model of the stage that fits the request, regardless of its health."""
+    candidates = get_candidates(stage, num_input_tokens)
+    return candidates[0].model if candidates else None
+
+
+def get_hedge_model(stage: str, model: str, num_input_tokens: int = 0) -> str:
+    """
+    The model a hedge of a call to `model` goes to: the next healthy model ranked after it
+    in the stage, usually a faster one, or `model` itself if there is none.
+    """
+    if not settings.llm_hedge_to_fallback:
+        return model
+
+    models = [
+        candidate.model for candidate in get_candidates(stage, num_input_tokens)
+    ]
+    if model not in models:
+        return model
+
+    for fallback in models[models.index(model) + 1 :]:
+        if get_unhealthy_reason(stage, fallback) is None:
+            return fallback
+
+    return model
+
+
+def record_model_call(stage: str, model: str, latency_seconds: float, failed: bool):
+    calls = _get_recent_calls(stage, model)
+    calls.append((time.monotonic(), latency_seconds, failed))
+
+    set_gauge(
+        "llm_model_error_rate",
+        sum(failed for _, _, failed in calls) / len(calls),
+        stage=stage,
+        model=model,
+    )
+
+
+def record_model_rate_limited(model: str, seconds: float | None):
+    """Sends the calls of every stage to the fallbacks of the model for a while."""
+    _rate_limited_until[model] = time.monotonic() + (
+        seconds if seconds is not None else settings.llm_rate_limit_cooldown_seconds
+    )
+    increment("llm_model_rate_limited", model=model)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from collections import deque
+from enum import Enum
+from typing import Dict
+from settings import settings
+from metrics import observe, set_gauge
+
+
+class LLMPriority(str, Enum):
+    # a student is waiting on the response (chat turns)
+    INTERACTIVE = "interactive"
+    # metadata/skill extraction, profile summaries, etc.
+    BACKGROUND = "background"
+
+
+# order in which waiting calls are let through
+priority_order = [LLMPriority.INTERACTIVE, LLMPriority.BACKGROUND]
+
+
+class LLMScheduler:
+    """
+    Limits the number of LLM calls in flight, overall and per priority class.
+
+    When a slot frees up it always goes to the oldest waiting interactive call before any
+    background call, so chat turns never queue behind summaries or extractions.
+    """
+
+    def __init__(self, max_concurrency: int, max_concurrency_per_priority: Dict):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_priority = max_concurrency_per_priority
+        self._num_running = {priority: 0 for priority in LLMPriority}
+        self._waiting = {priority: deque() for priority in LLMPriority}
+
+    def _can_run(self, priority: LLMPriority) -> bool:
+        return (
+            sum(self._num_running.values()) < self.max_concurrency
+            and self._num_running[priority]
+            < self.max_concurrency_per_priority[priority]
+        )
+
+    def _has_waiting_before(self, priority: LLMPriority) -> bool:
+        for waiting_priority in priority_order:
+            if self._waiting[waiting_priority]:
+                return True
+
+            if waiting_priority == priority:
+                return False
+
+        return False
+
+    def _update_gauges(self):
+        for priority in LLMPriority:
+            set_gauge(
+                "llm_scheduler_queue_depth",
+                len(self._waiting[priority]),
+                priority=priority.value,
+            )
+            set_gauge(
+                "llm_scheduler_running",
+                self._num_running[priority],
+                priority=priority.value,
+            )
+
+    def _dispatch(self):
+        for priority in priority_order:
+            waiting = self._waiting[priority]
+
+            while waiting and self._can_run(priority):
+                future = waiting.popleft()
+                if future.done():
+                    continue
+
+                self._num_running[priority] += 1
+                future.set_result(None)
+
+        self._update_gauges()
+
+    async def acquire(self, priority: LLMPriority):
+        started_at = time.monotonic()
+
+        if not self._has_waiting_before(priority) and self._can_run(priority):
+            self._num_running[priority] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiting[priority].append(future)
+            self._update_gauges()
+
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # the slot was handed over right as we got cancelled
+                    self.release(priority)
+                else:
+                    future.cancel()
+                    self._waiting[priority].remove(future)
+                    self._update_gauges()
+                raise
+
+        observe(
+            "llm_scheduler_wait_seconds",
+            time.monotonic() - started_at,
+            priority=priority.value,
+        )
+        self._update_gauges()
+
+    def try_acquire(self, priority: LLMPriority) -> bool:
+        """Takes a slot only if one is free right away, e.g. for optional extra calls."""
+        if self._has_waiting_before(priority) or not self._can_run(priority):
+            return False
+
+        self._num_running[priority] += 1
+        self._update_gauges()
+        return True
+
+    def release(self, priority: LLMPriority):
+        self._num_running[priority] -= 1
+        self._dispatch()
+
+
+llm_scheduler = LLMScheduler(
+    settings.llm_max_concurrency,
+    {
+        LLMPriority.INTERACTIVE: settings.llm_max_concurrency,
+        LLMPriority.BACKGROUND: settings.llm_background_max_concurrency,
+    },
+)
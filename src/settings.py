@@ -1,4 +1,5 @@
 import os
+from typing import Dict, List, Literal
 from pydantic_settings import BaseSettings
 from phoenix.otel import register
 
@@ -17,6 +18,73 @@ class Settings(BaseSettings):
     frappe_sso_redirect_uri: str
     env: str
     database_url: str
+    # e.g. the offline stand-in of standins/openai_server.py, defaults to openai
+    openai_base_url: str | None = None
+    # whether event_exists reads tabEvents from the frappe database or over the frappe api
+    # (e.g. against the stand-in of standins/frappe_server.py)
+    frappe_event_lookup: Literal["database", "api"] = "database"
+    # openai quota shared by every request of this process, to be set from the limits of
+    # the account's usage tier; 0 disables the rate limiter, which fails the startup
+    # outside of development (see llm.check_rate_limiter_configured)
+    openai_requests_per_minute: int = 0
+    openai_tokens_per_minute: int = 0
+    # llm calls in flight at once; background calls (extraction, summaries) get a
+    # smaller share so that chat turns always have room
+    llm_max_concurrency: int = 32
+    llm_background_max_concurrency: int = 8
+    # background jobs (e.g. action metadata extraction in job mode)
+    num_job_workers: int = 2
+    job_poll_interval_seconds: float = 1
+    # finished jobs and their events are deleted once they are this old, checked every
+    # job_cleanup_interval_seconds
+    job_retention_seconds: float = 7 * 24 * 60 * 60
+    job_cleanup_interval_seconds: float = 60 * 60
+    # how long a chat stream keeps generating with no client attached (0 cancels immediately)
+    chat_stream_detach_grace_seconds: float = 15
+    # how long a finished chat stream stays available for clients resuming it
+    chat_stream_retention_seconds: float = 120
+    # how often a relayed chat stream checks whether its client is still connected while
+    # it waits for the next line
+    chat_stream_disconnect_poll_seconds: float = 0.5
+    # start extracting action metadata and skills as soon as a basic chat ends with an
+    # action to create, so that the extract call from the frontend can reuse the result
+    speculative_action_metadata: bool = False
+    speculative_action_metadata_ttl_seconds: float = 600
+    speculative_action_metadata_max_entries: int = 256
+    # responses of deterministic llm stages (metadata and skill extraction) are reused
+    # for identical inputs; the least recently used ones are evicted past the size limit
+    llm_cache_enabled: bool = True
+    llm_cache_max_bytes: int = 50 * 1024 * 1024
+    # profile summaries are regenerated in the background once a user has not
+    # submitted or updated an action for this long
+    profile_summary_debounce_seconds: float = 60
+    # tokens of chat history (excluding the system prompt) sent with every chat turn;
+    # the most recent messages are always sent as they are
+    chat_history_token_budget: int = 4000
+    chat_history_recent_messages: int = 6
+    # "two_stage" picks the type and category first and then the subtype and subcategory
+    # out of the ones that go with them, with much smaller schemas than "single"
+    action_metadata_extraction_mode: Literal["single", "two_stage"] = "single"
+    # model routing (see routing.py): ranked models per stage overriding the defaults,
+    # models switched off for every stage and p95 latency SLOs per stage overriding the
+    # defaults; a model falls back to the next one of its stage while it is rate limited
+    # or its recent calls breach the latency SLO or the error rate
+    llm_model_routes: Dict[str, List[str]] = {}
+    llm_disabled_models: List[str] = []
+    llm_stage_latency_slo_seconds: Dict[str, float] = {}
+    llm_routing_window_seconds: float = 300
+    llm_routing_min_calls: int = 10
+    llm_routing_max_error_rate: float = 0.2
+    # how long a rate limited model is avoided when openai does not say when to retry
+    llm_rate_limit_cooldown_seconds: float = 30
+    # hedged streams: when the first chunk of a stream of one of these stages takes longer
+    # than this, a second identical request is sent (to the next model of the stage, or
+    # to the same model when llm_hedge_to_fallback is off) and the first one to answer wins
+    llm_hedge_after_seconds: Dict[str, float] = {
+        "basic_action_chat": 2.5,
+        "detail_action_chat": 2.5,
+    }
+    llm_hedge_to_fallback: bool = True
 
     class Config:
         env_file = f"{root_dir}/.env"
@@ -0,0 +1,74 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Tuple
+from metrics import increment
+
+logger = logging.getLogger(__name__)
+
+
+def hash_chat_history(chat_history: List[Dict]) -> str:
+    normalised = [[message["role"], message["content"]] for message in chat_history]
+    return hashlib.sha256(
+        json.dumps(normalised, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+class SpeculativeResults:
+    """
+    Keeps the tasks computing results ahead of the request that needs them, keyed by the
+    hash of their inputs. A request arriving while a task is still running waits on it
+    instead of starting the same work again.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._tasks: OrderedDict[str, Tuple[float, asyncio.Task]] = OrderedDict()
+
+    def _evict(self):
+        now = time.monotonic()
+
+        for key, (created_at, _) in list(self._tasks.items()):
+            if now - created_at > self.ttl_seconds:
+                del self._tasks[key]
+
+        while len(self._tasks) > self.max_entries:
+            self._tasks.popitem(last=False)
+
+    def _on_done(self, key: str, task: asyncio.Task):
+        if task.cancelled() or task.exception() is not None:
+            if not task.cancelled():
+                logger.error(
+                    f"Speculative {self.name} failed: {task.exception()!r}"
+                )
+            increment("speculation_failures", kind=self.name)
+
+            # let the request compute it on its own
+            if key in self._tasks and self._tasks[key][1] is task:
+                del self._tasks[key]
+
+    def start(self, key: str, run: Callable[[], Awaitable]):
+        self._evict()
+
+        if key in self._tasks:
+            return
+
+        task = asyncio.create_task(run())
+        task.add_done_callback(lambda task: self._on_done(key, task))
+        self._tasks[key] = (time.monotonic(), task)
+        increment("speculation_started", kind=self.name)
+
+    def get(self, key: str) -> asyncio.Task | None:
+        self._evict()
+
+        if key not in self._tasks:
+            increment("speculation_misses", kind=self.name)
+            return None
+
+        increment("speculation_hits", kind=self.name)
+        return self._tasks[key][1]
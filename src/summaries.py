@@ -0,0 +1,166 @@
+import hashlib
+import json
+from collections import defaultdict
+from typing import Dict, List
+
+# the description of an action is cut to this many words in its digest
+digest_description_max_words = 30
+# the profile summary sees the digests of the most recent actions only, older ones
+# are covered by the aggregates. An update of an earlier summary sees the digests of
+# the actions that are new or changed since, when there are at most this many
+profile_summary_max_action_digests = 25
+profile_summary_num_top_categories = 3
+profile_summary_num_top_skills = 3
+# examples of how the user showed each of the top skills
+profile_summary_num_skill_examples = 2
+skill_example_max_words = 25
+
+
+def truncate_words(text: str, max_words: int) -> str:
+    words = (text or "").split()
+    if len(words) <= max_words:
+        return " ".join(words)
+
+    return " ".join(words[:max_words]) + "..."
+
+
+def get_action_digest_fields(action: Dict) -> Dict:
+    return {
+        "title": action.get("title") or "",
+        "description": action.get("description") or "",
+        "category": action.get("category") or "",
+        "type": action.get("type") or "",
+        "skills": sorted(skill["label"] for skill in action.get("skills", [])),
+    }
+
+
+def get_action_content_hash(action: Dict) -> str:
+    return hashlib.sha256(
+        json.dumps(get_action_digest_fields(action), sort_keys=True).encode()
+    ).hexdigest()
+
+
+def compose_action_digest(action: Dict) -> str:
+    fields = get_action_digest_fields(action)
+
+    digest = f"{fields['title']} [{fields['category']} / {fields['type']}]: {truncate_words(fields['description'], digest_description_max_words)}"
+    if fields["skills"]:
+        digest += f" (skills: {', '.join(fields['skills'])})"
+
+    return digest
+
+
+def compute_profile_aggregates(actions: List[Dict]) -> Dict:
+    category_to_num_actions = defaultdict(int)
+    category_to_hours = defaultdict(float)
+    skill_to_num_actions = defaultdict(int)
+    skill_to_examples = defaultdict(list)
+
+    for action in actions:
+        category = action.get("category") or "Other"
+        category_to_num_actions[category] += 1
+        category_to_hours[category] += action.get("hours_invested") or 0
+
+        for skill in action.get("skills", []):
+            skill_to_num_actions[skill["label"]] += 1
+
+            if skill.get("relevance"):
+                skill_to_examples[skill["label"]].append(
+                    f"{action.get('title') or ''}: {truncate_words(skill['relevance'], skill_example_max_words)}"
+                )
+
+    top_categories = sorted(
+        category_to_num_actions,
+        key=lambda category: (
+            -category_to_num_actions[category],
+            -category_to_hours[category],
+        ),
+    )[:profile_summary_num_top_categories]
+
+    top_skills = sorted(
+        skill_to_num_actions, key=lambda skill: -skill_to_num_actions[skill]
+    )[:profile_summary_num_top_skills]
+
+    return {
+        "num_actions": len(actions),
+        "total_hours_invested": sum(
+            action.get("hours_invested") or 0 for action in actions
+        ),
+        "top_categories": [
+            {
+                "category": category,
+                "num_actions": category_to_num_actions[category],
+                "hours_invested": category_to_hours[category],
+            }
+            for category in top_categories
+        ],
+        "top_skills": [
+            {
+                "skill": skill,
+                "num_actions": skill_to_num_actions[skill],
+                # the most recent examples, actions come most recent first
+                "examples": skill_to_examples[skill][
+                    :profile_summary_num_skill_examples
+                ],
+            }
+            for skill in top_skills
+        ],
+    }
+
+
+def build_profile_summary_prompt(
+    first_name: str,
+    actions: List[Dict],
+    digests: Dict[str, str],
+    today: str,
+    previous_summary: str | None = None,
+) -> str:
+    """
+    `actions` are every action of the user, most recent first, and `digests` the digests
+    to list by action uuid: those of the most recent actions for a new summary, or those
+    of the actions that are new or changed since `previous_summary` for an update of it.
+    """
+    aggregates = compute_profile_aggregates(actions)
+
+    lines = [
+        f"user name: {first_name}",
+        f"total hours invested: {aggregates['total_hours_invested']:g}",
+        f"total number of actions: {aggregates['num_actions']}",
+        "top problem areas:",
+    ]
+
+    for category in aggregates["top_categories"]:
+        lines.append(
+            f"- {category['category']}: {category['num_actions']} actions, {category['hours_invested']:g} hours"
+        )
+
+    lines.append("top skills:")
+
+    for skill in aggregates["top_skills"]:
+        lines.append(f"- {skill['skill']}: shown in {skill['num_actions']} actions")
+        for example in skill["examples"]:
+            lines.append(f"  - {example}")
+
+    listed_actions = [action for action in actions if action["uuid"] in digests][
+        :profile_summary_max_action_digests
+    ]
+
+    if previous_summary is None:
+        lines.append(
+            f"most recent actions ({len(listed_actions)} of {aggregates['num_actions']}):"
+        )
+    else:
+        lines.append(f"previous summary: {previous_summary}")
+        lines.append(
+            f"new or changed actions since the previous summary ({len(listed_actions)}):"
+        )
+
+    for action in listed_actions:
+        lines.append(
+            f"- {digests[action['uuid']]} ({action.get('hours_invested') or 0:g} hours)"
+        )
+
+    # last, so that the rest of the prompt stays the same from one day to the next
+    lines.append(f"today's date: {today}")
+
+    return "\n".join(lines)
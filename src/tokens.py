@@ -0,0 +1,63 @@
+import logging
+import time
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+default_tokenizer_model = "gpt-4.1"
+# how long to count with estimates after the encoding failed to load before trying again
+encoding_retry_seconds = 60
+
+_encodings = {}
+_encoding_failed_at = {}
+
+
+def _load_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def _get_encoding(model: str):
+    if model in _encodings:
+        return _encodings[model]
+
+    # a failed load is not cached for good, e.g. the encoding files could not be
+    # fetched over a flaky network; it is retried after a while
+    failed_at = _encoding_failed_at.get(model)
+    if failed_at is not None and time.monotonic() - failed_at < encoding_retry_seconds:
+        return None
+
+    try:
+        _encodings[model] = _load_encoding(model)
+    except Exception:
+        logger.warning("Could not load a tokenizer, falling back to estimates")
+        _encoding_failed_at[model] = time.monotonic()
+        return None
+
+    _encoding_failed_at.pop(model, None)
+    return _encodings[model]
+
+
+def load_encoding(model: str = default_tokenizer_model) -> bool:
+    """Loads the encoding ahead of the first request, which would otherwise fetch it."""
+    return _get_encoding(model) is not None
+
+
+def count_tokens(text: str, model: str = default_tokenizer_model) -> int:
+    if not text:
+        return 0
+
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # ~4 characters per token for english text
+        return max(len(text) // 4, 1)
+
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_tokenizer_name(model: str = default_tokenizer_model) -> str:
+    """The encoding count_tokens uses, or "estimate" when it falls back to estimates."""
+    encoding = _get_encoding(model)
+    return encoding.name if encoding is not None else "estimate"
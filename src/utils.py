@@ -1,4 +1,6 @@
-from models import ActionType
+from types import MappingProxyType
+from typing import List, Tuple
+from models import ActionType, ActionCategory, ActionSubCategory
 
 skill_to_name = {
     "citizenship": "Citizenship",
@@ -287,196 +289,414 @@ skill_to_microskills = {
 }
 
 
-def extract_skill_from_action_type(action_type: ActionType) -> str:
-    skills = []
-
-    # Attended an offline event
-    if action_type == ActionType.ATTENDED_AN_OFFLINE_EVENT:
-        skills.extend(["communication", "community_collaboration"])
-
-    # Business plan
-    elif action_type == ActionType.BUSINESS_PLAN:
-        skills.extend(
-            [
-                "communication",
-                "critical_thinking",
-                "problem_solving",
-                "entrepreneurial",
-            ]
+# skills that an action of each type shows, in the order they are listed to the model;
+# keyed by the value of the type since ActionType members are not hashable
+action_type_to_skills = MappingProxyType(
+    {
+        ActionType.ATTENDED_AN_OFFLINE_EVENT.value: ("communication", "community_collaboration"),
+        ActionType.BUSINESS_PLAN.value: (
+            "communication",
+            "critical_thinking",
+            "problem_solving",
+            "entrepreneurial",
+        ),
+        ActionType.CARRY_A_CLOTH_BAG.value: ("problem_solving", "citizenship", "hands_on"),
+        ActionType.CREATED_A_CAMPAIGN.value: (
+            "communication",
+            "data_orientation",
+            "community_collaboration",
+        ),
+        ActionType.CREATED_SOLUTION.value: (
+            "critical_thinking",
+            "problem_solving",
+            "grit",
+            "hands_on",
+        ),
+        ActionType.CROWDSOURCED_DATA.value: (
+            "communication",
+            "applied_empathy",
+            "citizenship",
+            "data_orientation",
+            "community_collaboration",
+        ),
+        ActionType.DID_AUDIT_OR_INVESTIGATED.value: (
+            "communication",
+            "critical_thinking",
+            "data_orientation",
+        ),
+        ActionType.ENGAGED_PEOPLE_THROUGH_SESSIONS.value: (
+            "communication",
+            "applied_empathy",
+            "community_collaboration",
+        ),
+        ActionType.FOLLOWED_UP.value: ("communication", "grit"),
+        ActionType.IMPLEMENTED_EXISTING_SOLUTION.value: ("critical_thinking", "hands_on"),
+        ActionType.JOINED_A_CAMPAIGN.value: ("community_collaboration",),
+        ActionType.NON_TECH_PROTOTYPE.value: (
+            "critical_thinking",
+            "entrepreneurial",
+            "hands_on",
+        ),
+        ActionType.NON_TECH_SOLUTION.value: ("critical_thinking", "problem_solving", "hands_on"),
+        ActionType.OLD_REPORT_FOLLOWUP.value: ("communication", "grit"),
+        ActionType.PROJECT_IDEA.value: ("communication", "problem_solving", "applied_empathy"),
+        ActionType.PROTOTYPE.value: (
+            "communication",
+            "critical_thinking",
+            "problem_solving",
+            "grit",
+        ),
+        ActionType.REPORTED_ISSUE.value: ("citizenship", "data_orientation"),
+        ActionType.SEGREGATE_WASTE_AT_SOURCE.value: (
+            "problem_solving",
+            "citizenship",
+            "hands_on",
+        ),
+        ActionType.SHARED_PUBLIC_OPINION.value: ("citizenship",),
+        ActionType.SOLVED_A_REAL_WORLD_PROBLEM.value: (
+            "problem_solving",
+            "applied_empathy",
+            "citizenship",
+        ),
+        ActionType.SUSTAINABLE_LIFESTYLE.value: ("critical_thinking", "problem_solving"),
+        ActionType.SWACHHATA_LEAGUE_PARTICIPATION_2023.value: (
+            "problem_solving",
+            "citizenship",
+            "hands_on",
+        ),
+        ActionType.TECH_PROTOTYPE.value: (
+            "critical_thinking",
+            "entrepreneurial",
+            "grit",
+            "hands_on",
+        ),
+        ActionType.TECH_SOLUTION.value: ("critical_thinking", "problem_solving", "hands_on"),
+        ActionType.MAPPING_ASSET_OR_ISSUE.value: ("problem_solving", "data_orientation"),
+        ActionType.INVESTIGATION_AUDIT.value: ("critical_thinking", "data_orientation"),
+        ActionType.SESSION_TAKEN.value: (
+            "communication",
+            "citizenship",
+            "community_collaboration",
+        ),
+        ActionType.STREET_CLEANLINESS_CHECK.value: ("citizenship", "hands_on"),
+        ActionType.REGULAR_WASTE_PICK_UP.value: ("hands_on", "citizenship"),
+        ActionType.MEET_YOUR_SAFAI_KARAMCHARI.value: ("applied_empathy", "communication"),
+        ActionType.COMMUNITY_ENGAGEMENT.value: (
+            "community_collaboration",
+            "communication",
+            "citizenship",
+        ),
+        ActionType.CONDUCTED_A_SURVEY_ON_WATER_SUPPLY_SCHEME.value: (
+            "data_orientation",
+            "communication",
+            "critical_thinking",
+        ),
+        ActionType.CLOTH_COLLECTION.value: ("hands_on", "applied_empathy"),
+        ActionType.HANDS_ON.value: ("hands_on", "problem_solving"),
+        ActionType.URBAN_FLOODING.value: ("data_orientation", "problem_solving"),
+        ActionType.URBAN_PLANNING.value: ("data_orientation", "problem_solving"),
+        # kept from before Investigation/Audit
+        ActionType.AUDIT.value: ("critical_thinking", "data_orientation"),
+        # general skills for the actions that do not fit any other type
+        ActionType.OTHER_ACTIVITY.value: ("hands_on", "problem_solving"),
+        ActionType.CHANGEMAKER_ADDA.value: ("citizenship",),
+        ActionType.SHARING_ADDA.value: ("citizenship",),
+    }
+)
+
+# action types of older actions that are no longer in ActionType
+legacy_action_type_to_skills = MappingProxyType(
+    {
+        "Campaign": ("communication", "community_collaboration"),
+        "Report": ("citizenship", "data_orientation"),
+    }
+)
+
+
+def _validate_action_type_skills():
+    # fail at import instead of at extraction time if an action type has no skills or
+    # a skill has no label or microskills
+    missing_action_types = {
+        action_type.value for action_type in ActionType
+    } - set(action_type_to_skills)
+    if missing_action_types:
+        raise ValueError(
+            f"Action types missing from action_type_to_skills: {missing_action_types}"
         )
 
-    # Carry a cloth bag
-    elif action_type == ActionType.CARRY_A_CLOTH_BAG:
-        skills.extend(["problem_solving", "citizenship", "hands_on"])
+    for skills in list(action_type_to_skills.values()) + list(
+        legacy_action_type_to_skills.values()
+    ):
+        for skill in skills:
+            if skill not in skill_to_name or skill not in skill_to_microskills:
+                raise ValueError(f"Unknown skill {skill} in action_type_to_skills")
 
-    # Created a Campaign
-    elif action_type == ActionType.CREATED_A_CAMPAIGN:
-        skills.extend(["communication", "data_orientation", "community_collaboration"])
 
-    elif action_type == "Campaign":
-        skills.extend(["communication", "community_collaboration"])
+_validate_action_type_skills()
 
-    # Created solution
-    elif action_type == ActionType.CREATED_SOLUTION:
-        skills.extend(["critical_thinking", "problem_solving", "grit", "hands_on"])
+_action_type_value_to_skills = {
+    **action_type_to_skills,
+    **legacy_action_type_to_skills,
+}
 
-    # Crowdsourced data
-    elif action_type == ActionType.CROWDSOURCED_DATA:
-        skills.extend(
+# the skills of each action type along with their microskills, as listed to the model
+action_type_to_skills_prompt = MappingProxyType(
+    {
+        action_type: str(
             [
-                "communication",
-                "applied_empathy",
-                "citizenship",
-                "data_orientation",
-                "community_collaboration",
+                {"name": skill, "microskills": skill_to_microskills[skill]}
+                for skill in skills
             ]
         )
+        for action_type, skills in _action_type_value_to_skills.items()
+    }
+)
+
+
+def extract_skill_from_action_type(action_type: ActionType | str) -> Tuple[str, ...]:
+    return _action_type_value_to_skills.get(
+        getattr(action_type, "value", action_type), ()
+    )
+
+
+def get_skills_prompt_for_action_type(action_type: ActionType | str) -> str:
+    return action_type_to_skills_prompt.get(
+        getattr(action_type, "value", action_type), "[]"
+    )
+
+
+# subcategories that can go with each action category, so that the subcategory only has
+# to be picked from a handful of values once the category is known
+action_category_to_subcategories = {
+    "Civic": [
+        "Civic",
+        "Public Toilets",
+        "Public asset",
+        "Smart Cities",
+        "Government Schemes",
+        "Public Institutions",
+        "Government Infrastructure",
+        "All in One Service Centre",
+    ],
+    "Relief Centers": ["Relief Centers"],
+    "Health": ["Health", "healthcare", "Dengue Hotspot", "Malaria Hotspot", "COVID"],
+    "Audit": ["Audit", "Sanitation Audit", "Water Supply Scheme Audit", "Street audit"],
+    "Street Lights": ["Street Lights", "Black Spot Fixed and Maintained"],
+    "Water Resources": [
+        "Water Resources",
+        "Water Sources",
+        "Water Quality",
+        "Water Tankers",
+        "Waterbody",
+        "Water efficient zone",
+    ],
+    "Floods": ["Urban Flooding", "Flood map", "Rainfall"],
+    "Tree Tracking": ["Tree Tracking", "Trees", "Urban Greenery"],
+    "Stubble Burning": ["Stubble Burning"],
+    "Rainfall": ["Rainfall"],
+    "Borewell": ["Borewell"],
+    "Public Park": ["Public Park", "Urban Greenery", "Trees"],
+    "Solid Waste Management": [
+        "Solid Waste Management",
+        "Solid Waste Collection",
+        "Solid Waste Disposal",
+        "Pick up by vehicle",
+        "Pick up by karamchari",
+        "Garbage Bin",
+        "Garbage Dumps",
+    ],
+    "Recycling": ["Recycling", "Recycle Centers", "Upcycle"],
+    "Garbage Dumps": ["Garbage Dumps", "Black Spot Fixed and Maintained", "Garbage Bin"],
+    "Hazardous Waste": ["Hazardous Waste", "Fireworks"],
+    "Solid Waste Collection": [
+        "Solid Waste Collection",
+        "Pick up by vehicle",
+        "Pick up by karamchari",
+        "Garbage Bin",
+    ],
+    "Anganwadi centre": ["Anganwadi centre"],
+    "Solid Waste Disposal": ["Solid Waste Disposal", "Garbage Dumps"],
+    "Harassment Zone": ["Harassment Zone"],
+    "Policy": ["Policy", "Cauvery Water Policy", "Government Schemes"],
+    "Public Institutions": [
+        "Public Institutions",
+        "Anganwadi centre",
+        "All in One Service Centre",
+    ],
+    "Government Infrastructure": [
+        "Government Infrastructure",
+        "Public asset",
+        "Public Toilets",
+    ],
+    "Civic-Environmental Data": ["Civic-Environmental Data", "Crowdsourced Data"],
+    "Citizen Initiatives": [
+        "Citizen Initiatives",
+        "Nagarika Sakhi - Rural Women Leaders Initiative",
+    ],
+    "Street audit": ["Street audit"],
+    "Air Quality": ["Air Quality", "Air", "Fireworks", "Stubble Burning"],
+    "Community Building": ["Community Building"],
+    "Schemes": ["Schemes", "Government Schemes"],
+    "Public asset": ["Public asset", "Public Toilets"],
+    "Crowdsourced Data": ["Crowdsourced Data"],
+    "Water": [
+        "Water",
+        "Water Resources",
+        "Water Sources",
+        "Water Quality",
+        "Water Tankers",
+        "Waterbody",
+        "Water efficient zone",
+        "Water Supply Scheme Audit",
+        "Cauvery Water Policy",
+    ],
+    "Waste": [
+        "Waste",
+        "Solid Waste Management",
+        "Solid Waste Collection",
+        "Solid Waste Disposal",
+        "Garbage Bin",
+        "Garbage Dumps",
+        "Recycling",
+        "Upcycle",
+        "Hazardous Waste",
+    ],
+    "Traffic/road": [
+        "Traffic/road",
+        "Traffic & Mobility",
+        "Pothole",
+        "pothole",
+        "Public Transport",
+    ],
+    "Sanitation": ["Sanitation", "Public Toilets", "Sanitation Audit"],
+    "Electricity": ["Electricity", "Street Lights"],
+    "Air": ["Air", "Air Quality"],
+    "Other": ["Other"],
+    "Livelihood": ["Livelihood"],
+}
 
-    # Did audit or investigated
-    elif action_type == ActionType.DID_AUDIT_OR_INVESTIGATED:
-        skills.extend(["communication", "critical_thinking", "data_orientation"])
-
-    # Engaged people through sessions
-    elif action_type == ActionType.ENGAGED_PEOPLE_THROUGH_SESSIONS:
-        skills.extend(["communication", "applied_empathy", "community_collaboration"])
-
-    # Followed up
-    elif action_type == ActionType.FOLLOWED_UP:
-        skills.extend(["communication", "grit"])
-
-    # Implemented existing solution
-    elif action_type == ActionType.IMPLEMENTED_EXISTING_SOLUTION:
-        skills.extend(["critical_thinking", "hands_on"])
-
-    # Joined a Campaign
-    elif action_type == ActionType.JOINED_A_CAMPAIGN:
-        skills.extend(["community_collaboration"])
-
-    # Non tech prototype
-    elif action_type == ActionType.NON_TECH_PROTOTYPE:
-        skills.extend(["critical_thinking", "entrepreneurial", "hands_on"])
-
-    # Non tech solution
-    elif action_type == ActionType.NON_TECH_SOLUTION:
-        skills.extend(["critical_thinking", "problem_solving", "hands_on"])
-
-    # Old report followup
-    elif action_type == ActionType.OLD_REPORT_FOLLOWUP:
-        skills.extend(["communication", "grit"])
-
-    # Project idea
-    elif action_type == ActionType.PROJECT_IDEA:
-        skills.extend(
-            ["communication", "problem_solving", "applied_empathy"]
-        )
+# offered along with the subcategories of every category
+fallback_action_subcategories = ["Other", "Not Applicable"]
+
+# action types that are close enough to be the subtype of one another, by the name of
+# the kind of action they are, which is all the type is first classified as
+action_type_groups = {
+    "Mapped, reported or followed up on an issue": [
+        "Mapping asset or issue",
+        "reported issue",
+        "Old report followup",
+        "followed up",
+        "Crowdsourced data",
+        "Shared Public Opinion",
+        "Street Cleanliness check",
+    ],
+    "Audited or surveyed": [
+        "Audit",
+        "Investigation/Audit",
+        "did audit or investigated",
+        "Conducted a Survey on Water Supply Scheme",
+        "Street Cleanliness check",
+    ],
+    "Campaigned or engaged people": [
+        "Joined a Campaign",
+        "Created a Campaign",
+        "Community engagement",
+        "Session Taken",
+        "engaged people through sessions",
+        "Sharing Adda",
+        "Changemaker Adda",
+        "Attended an offline event",
+        "Meet your Safai Karamchari",
+        "Swachhata League Participation 2023",
+    ],
+    "Built a prototype or a solution": [
+        "Tech prototype",
+        "Non tech prototype",
+        "Prototype",
+        "Tech solution",
+        "Non tech solution",
+        "Project idea",
+        "Business plan",
+        "created solution",
+        "implemented existing solution",
+        "solved a real world problem",
+        "Urban Planning",
+    ],
+    "Did hands-on work": [
+        "Hands on",
+        "Sustainable Lifestyle",
+        "Cloth Collection",
+        "Carry a cloth bag",
+        "Segregate waste at source",
+        "Regular waste pick up",
+        "Urban Flooding",
+    ],
+}
 
-    # Prototype
-    elif action_type == ActionType.PROTOTYPE:
-        skills.extend(
-            [
-                "communication",
-                "critical_thinking",
-                "problem_solving",
-                "grit",
-            ]
+# offered along with the types of every kind of action
+fallback_action_subtypes = ["Other Activity"]
+# the kind of action offered for actions that fit none of the others
+fallback_action_type_group = "Something else"
+
+
+def _validate_action_taxonomy():
+    # fail at import instead of at extraction time if an enum value gets renamed
+    for category, subcategories in action_category_to_subcategories.items():
+        ActionCategory(category)
+        for subcategory in subcategories:
+            ActionSubCategory(subcategory)
+
+    missing_categories = set(action_category_to_subcategories) ^ {
+        category.value for category in ActionCategory
+    }
+    if missing_categories:
+        raise ValueError(
+            f"Categories missing from action_category_to_subcategories: {missing_categories}"
         )
 
-    # Reported issue
-    elif action_type == ActionType.REPORTED_ISSUE:
-        skills.extend(["citizenship", "data_orientation"])
-
-    elif action_type == "Report":
-        skills.extend(["citizenship", "data_orientation"])
-
-    # Segregate waste at source
-    elif action_type == ActionType.SEGREGATE_WASTE_AT_SOURCE:
-        skills.extend(["problem_solving", "citizenship", "hands_on"])
-
-    # Shared Public Opinion
-    elif action_type == ActionType.SHARED_PUBLIC_OPINION:
-        skills.extend(["citizenship"])
-
-    # Solved a real world problem
-    elif action_type == ActionType.SOLVED_A_REAL_WORLD_PROBLEM:
-        skills.extend(["problem_solving", "applied_empathy", "citizenship"])
-
-    # Sustainable Lifestyle
-    elif action_type == ActionType.SUSTAINABLE_LIFESTYLE:
-        skills.extend(["critical_thinking", "problem_solving"])
-
-    # Swachhata League Participation 2023
-    elif action_type == ActionType.SWACHHATA_LEAGUE_PARTICIPATION_2023:
-        skills.extend(["problem_solving", "citizenship", "hands_on"])
-
-    # Tech prototype
-    elif action_type == ActionType.TECH_PROTOTYPE:
-        skills.extend(["critical_thinking", "entrepreneurial", "grit", "hands_on"])
-
-    # Tech solution
-    elif action_type == ActionType.TECH_SOLUTION:
-        skills.extend(["critical_thinking", "problem_solving", "hands_on"])
-
-    # Mapping asset or issue
-    elif action_type == ActionType.MAPPING_ASSET_OR_ISSUE:
-        skills.extend(["problem_solving", "data_orientation"])
-
-    # Investigation/Audit
-    elif action_type == ActionType.INVESTIGATION_AUDIT:
-        skills.extend(["critical_thinking", "data_orientation"])
-
-    # Session Taken
-    elif action_type == ActionType.SESSION_TAKEN:
-        skills.extend(["communication", "citizenship", "community_collaboration"])
+    grouped_action_types = [
+        action_type for group in action_type_groups.values() for action_type in group
+    ] + fallback_action_subtypes
+    for action_type in grouped_action_types:
+        ActionType(action_type)
 
-    # Street Cleanliness check
-    elif action_type == ActionType.STREET_CLEANLINESS_CHECK:
-        skills.extend(["citizenship", "hands_on"])
+    # the type can only be picked out of the group the action is first classified in
+    missing_types = {action_type.value for action_type in ActionType} - set(
+        grouped_action_types
+    )
+    if missing_types:
+        raise ValueError(f"Types missing from action_type_groups: {missing_types}")
 
-    # Regular waste pick up
-    elif action_type == ActionType.REGULAR_WASTE_PICK_UP:
-        skills.extend(["hands_on", "citizenship"])
+    for subcategory in fallback_action_subcategories:
+        ActionSubCategory(subcategory)
 
-    # Meet your Safai Karamchari
-    elif action_type == ActionType.MEET_YOUR_SAFAI_KARAMCHARI:
-        skills.extend(["applied_empathy", "communication"])
 
-    # Community engagement
-    elif action_type == ActionType.COMMUNITY_ENGAGEMENT:
-        skills.extend(["community_collaboration", "communication", "citizenship"])
+_validate_action_taxonomy()
 
-    # Conducted a Survey on Water Supply Scheme
-    elif action_type == ActionType.CONDUCTED_A_SURVEY_ON_WATER_SUPPLY_SCHEME:
-        skills.extend(["data_orientation", "communication", "critical_thinking"])
 
-    # Cloth Collection
-    elif action_type == ActionType.CLOTH_COLLECTION:
-        skills.extend(["hands_on", "applied_empathy"])
+def get_subcategories_for_category(action_category: str) -> List[str]:
+    subcategories = action_category_to_subcategories.get(action_category, [])
+    return subcategories + [
+        subcategory
+        for subcategory in fallback_action_subcategories
+        if subcategory not in subcategories
+    ]
 
-    # Hands on (this is an ActionType, not just a skill)
-    elif action_type == ActionType.HANDS_ON:
-        skills.extend(["hands_on", "problem_solving"])
 
-    # Urban Flooding (mapped to URBAN_FLOODING instead of URBAN_PLANNING)
-    elif action_type == ActionType.URBAN_FLOODING:
-        skills.extend(["data_orientation", "problem_solving"])
+def get_action_type_group_names() -> List[str]:
+    return list(action_type_groups) + [fallback_action_type_group]
 
-    # Keep URBAN_PLANNING separate if it exists
-    elif action_type == ActionType.URBAN_PLANNING:
-        skills.extend(["data_orientation", "problem_solving"])
 
-    # Investigation/Audit - keep the old AUDIT mapping for backwards compatibility
-    elif action_type == ActionType.AUDIT:
-        skills.extend(["critical_thinking", "data_orientation"])
+def get_action_type_group(action_type: str) -> str:
+    for group_name, group in action_type_groups.items():
+        if action_type in group:
+            return group_name
 
-    # For events not directly mapped in CSV, map to OTHER_ACTIVITY with general skills
-    elif action_type == ActionType.OTHER_ACTIVITY:
-        # This could be Session Taken, Street Cleanliness check, Regular waste pick up,
-        # Meet your Safai Karamchari, Community engagement, Conducted a Survey, Cloth Collection, etc.
-        # Using a general mapping for hands_on activities
-        skills.extend(["hands_on", "problem_solving"])
+    return fallback_action_type_group
 
-    # For CHANGEMAKER_ADDA and SHARING_ADDA (not in CSV, keeping original logic)
-    elif action_type in [ActionType.CHANGEMAKER_ADDA, ActionType.SHARING_ADDA]:
-        skills.extend(["citizenship"])
 
-    return skills
+def get_types_for_type_group(action_type_group: str) -> List[str]:
+    types = action_type_groups.get(action_type_group, [])
+    return types + [
+        subtype for subtype in fallback_action_subtypes if subtype not in types
+    ]
@@ -0,0 +1,279 @@
+"""
+Offline stand-in for the Frappe backend, for measuring the service on a laptop with no
+network. Point the service at it with
+
+    FRAPPE_BACKEND_BASE_URL=http://localhost:8102/api
+    FRAPPE_EVENT_LOOKUP=api
+
+It serves the endpoints the service calls: login (any password works) and SSO login
+(the code is taken as the email), get_user_profile, update_user_summary, create_events,
+Chat History and a lookup of tabEvents. Unknown users are created on first use. Events
+created with skills show up in the portfolio of their user the way they do on Frappe.
+Every response is delayed by a latency drawn from a log-normal distribution.
+
+    python standins/frappe_server.py [--port 8102] [--users users.json]
+        [--latency-median-ms 80] [--latency-p95-ms 400] [--error-rate 0] [--seed 0]
+
+--users takes a JSON list of profiles in the shape get_user_profile returns, keyed by
+the email of their current_user, such as the ones benchmarks/generate_data.py writes.
+"""
+
+import argparse
+import json
+import random
+import secrets
+from datetime import datetime
+from typing import Dict
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from latency import LatencyDistribution, add_latency_arguments
+
+
+def create_profile(email: str) -> Dict:
+    username = email.split("@")[0]
+
+    return {
+        "current_user": {
+            "first_name": username.capitalize(),
+            "last_name": "Standin",
+            "full_name": f"{username.capitalize()} Standin",
+            "username": username,
+            "email": email,
+            "is_verified": False,
+            "bio": "",
+            "user_image": "",
+            "state": "Karnataka",
+            "city": "Bengaluru",
+            "location": "India",
+            "highlighted_action": {},
+            "partner": None,
+        },
+        "actions": [],
+        "skills": [],
+        "skill_assignment_log": [],
+        "reviews": [],
+        "user_metadata": {},
+    }
+
+
+class FrappeState:
+    def __init__(self, profiles: list):
+        self.profiles_by_email = {}
+        self.emails_by_username = {}
+        self.emails_by_token = {}
+        # the tabEvents table
+        self.events = {}
+        self.chat_history = []
+
+        for profile in profiles:
+            self.add_profile(profile)
+
+    def add_profile(self, profile: Dict) -> Dict:
+        current_user = profile["current_user"]
+        self.profiles_by_email[current_user["email"]] = profile
+        self.emails_by_username[current_user["username"]] = current_user["email"]
+        return profile
+
+    def get_profile(self, email: str) -> Dict:
+        return self.profiles_by_email.get(email) or self.add_profile(
+            create_profile(email)
+        )
+
+    def get_profile_by_username(self, username: str) -> Dict:
+        return self.get_profile(self.emails_by_username.get(username, username))
+
+    def create_token(self, email: str) -> str:
+        self.get_profile(email)
+        token = secrets.token_hex(16)
+        self.emails_by_token[token] = email
+        return token
+
+    def save_event(self, payload: Dict):
+        event = {**self.events.get(payload["event_id"], {}), **payload}
+        event.setdefault("creation", datetime.now().isoformat(sep=" "))
+        self.events[payload["event_id"]] = event
+
+        if "user" not in event:
+            return
+
+        profile = self.get_profile(event["user"])
+        profile["actions"] = [
+            action
+            for action in profile["actions"]
+            if action["event_id"] != event["event_id"]
+        ]
+        profile["actions"].insert(
+            0,
+            {
+                "event_id": event["event_id"],
+                "title": event.get("title", ""),
+                "description": event.get("description", ""),
+                "category": event.get("category", ""),
+                "type": event.get("type", ""),
+                "hours_invested": event.get("hours_invested"),
+                "creation": event["creation"],
+            },
+        )
+
+        skill_names = {skill["name"] for skill in profile["skills"]}
+        for skill in payload.get("skills", []):
+            if skill["label"] not in skill_names:
+                profile["skills"].append({"name": skill["label"]})
+                skill_names.add(skill["label"])
+
+            profile["skill_assignment_log"].append(
+                {
+                    "badge": skill["label"],
+                    "reference_name": event["event_id"],
+                    "reason": skill.get("summary", ""),
+                    "microskill": {
+                        "title": f"{skill['label']} {skill.get('level')}",
+                        "level": skill.get("level"),
+                        "description": "",
+                    },
+                    "creation": datetime.now().isoformat(sep=" "),
+                }
+            )
+
+
+def create_app(args) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(args.seed)
+    latency = LatencyDistribution(args.latency_median_ms, args.latency_p95_ms, rng)
+
+    profiles = []
+    if args.users:
+        with open(args.users) as f:
+            profiles = json.load(f)
+
+    state = FrappeState(profiles)
+
+    @app.middleware("http")
+    async def add_latency(request: Request, call_next):
+        await latency.wait()
+
+        if rng.random() < args.error_rate:
+            return JSONResponse({"exc_type": "StandinError"}, status_code=500)
+
+        return await call_next(request)
+
+    def get_token_email(request: Request) -> str | None:
+        authorization = request.headers.get("authorization", "")
+        if not authorization.startswith("Bearer "):
+            return None
+
+        return state.emails_by_token.get(authorization.removeprefix("Bearer "))
+
+    @app.post("/api/method/login")
+    async def login(request: Request):
+        body = await request.json()
+        profile = state.get_profile(body["usr"])
+
+        response = JSONResponse(
+            {"message": "Logged In", "full_name": profile["current_user"]["full_name"]}
+        )
+        response.set_cookie("sid", state.create_token(body["usr"]))
+        return response
+
+    @app.post("/api/method/frappe.integrations.oauth2.get_token")
+    async def get_token(request: Request):
+        form = parse_qs((await request.body()).decode())
+
+        return {
+            "access_token": state.create_token(form["code"][0]),
+            "token_type": "Bearer",
+            "expires_in": 3600,
+        }
+
+    @app.post("/api/method/solve_ninja.api.profile.get_user_profile")
+    async def get_user_profile(request: Request):
+        if email := get_token_email(request):
+            return {"message": state.get_profile(email)}
+
+        body = json.loads(await request.body() or "{}")
+        if "username" not in body:
+            return JSONResponse({"exc_type": "AuthenticationError"}, status_code=401)
+
+        return {"message": state.get_profile_by_username(body["username"])}
+
+    @app.put("/api/method/solve_ninja.api.profile.update_user_summary")
+    async def update_user_summary(request: Request):
+        body = await request.json()
+        profile = state.get_profile_by_username(body["username"])
+        profile["user_metadata"]["summary"] = body["summary"]
+        return {"message": "ok"}
+
+    @app.post("/api/method/solve_ninja.api.events.create_events")
+    async def create_events(request: Request):
+        body = await request.json()
+
+        # like frappe, an event cannot be created twice
+        if body["event_id"] in state.events:
+            return JSONResponse({"exc_type": "DuplicateEntryError"}, status_code=409)
+
+        state.save_event(body)
+        return {"message": {"event_id": body["event_id"]}}
+
+    @app.put("/api/method/solve_ninja.api.events.create_events")
+    async def update_events(request: Request):
+        body = await request.json()
+
+        if body["event_id"] not in state.events:
+            return JSONResponse({"exc_type": "DoesNotExistError"}, status_code=404)
+
+        state.save_event(body)
+        return {"message": {"event_id": body["event_id"]}}
+
+    @app.get("/api/resource/Events/{name}")
+    async def get_event(name: str):
+        if name not in state.events:
+            return JSONResponse({"exc_type": "DoesNotExistError"}, status_code=404)
+
+        return {"data": {"name": name, **state.events[name]}}
+
+    @app.post("/api/resource/Chat History")
+    async def add_chat_history(request: Request):
+        body = await request.json()
+        message = {
+            "name": f"CH-{len(state.chat_history) + 1:08d}",
+            "creation": datetime.now().isoformat(sep=" "),
+            **body,
+        }
+        state.chat_history.append(message)
+        return {"data": message}
+
+    @app.get("/api/resource/Chat History")
+    async def list_chat_history(event_id: str | None = None):
+        return {
+            "data": [
+                message
+                for message in state.chat_history
+                if event_id is None or message["event_id"] == event_id
+            ]
+        }
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--users", default=None)
+    add_latency_arguments(parser, "latency", 80, 400, "response latency")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,52 @@
+import asyncio
+import math
+import random
+
+# z-score of the 95th percentile of a normal distribution
+p95_z_score = 1.645
+
+
+class LatencyDistribution:
+    """
+    Log-normal latencies with the given median and p95, the long tail upstream APIs show.
+    A p95 equal to the median gives a constant latency.
+    """
+
+    def __init__(self, median_ms: float, p95_ms: float, rng: random.Random):
+        if median_ms < 0 or p95_ms < median_ms:
+            raise ValueError("Expected 0 <= median <= p95")
+
+        self.median_ms = median_ms
+        self.p95_ms = p95_ms
+        self.rng = rng
+
+        self._mu = math.log(median_ms) if median_ms > 0 else None
+        self._sigma = (
+            math.log(p95_ms / median_ms) / p95_z_score if median_ms > 0 else 0
+        )
+
+    def sample_seconds(self) -> float:
+        if self._mu is None:
+            return 0
+
+        return self.rng.lognormvariate(self._mu, self._sigma) / 1000
+
+    async def wait(self):
+        await asyncio.sleep(self.sample_seconds())
+
+
+def add_latency_arguments(
+    parser, name: str, median_ms: float, p95_ms: float, description: str
+):
+    parser.add_argument(
+        f"--{name}-median-ms",
+        type=float,
+        default=median_ms,
+        help=f"median {description} in milliseconds",
+    )
+    parser.add_argument(
+        f"--{name}-p95-ms",
+        type=float,
+        default=p95_ms,
+        help=f"p95 {description} in milliseconds",
+    )
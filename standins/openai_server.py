@@ -0,0 +1,468 @@
+"""
+Offline stand-in for the OpenAI Responses API, for measuring the service on a laptop
+with no network. Point the service at it with OPENAI_BASE_URL=http://localhost:8101/v1.
+
+Every request is answered with, in order of preference:
+- the output recorded for the exact same request
+- an output recorded for the same stage (from its prompt cache key) and JSON schema
+- an output generated from the JSON schema of the request (or plain text without one),
+  the same for the same request
+
+Streams start after a first token latency drawn from a log-normal distribution and then
+send a token every 1 / --tokens-per-second. Usage reports prompt cache hits the way
+openai does, for the prefix shared with the previous request of the same cache key.
+
+    python standins/openai_server.py [--port 8101] [--fixtures standins/fixtures/openai.jsonl]
+        [--first-token-median-ms 500] [--first-token-p95-ms 2000] [--tokens-per-second 80]
+        [--error-rate 0] [--rate-limit-rate 0] [--seed 0]
+
+With --record, requests are forwarded to --upstream with the API key they came with and
+their outputs are appended to the fixtures, to be replayed later:
+
+    python standins/openai_server.py --record [--upstream https://api.openai.com/v1]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from latency import LatencyDistribution, add_latency_arguments
+
+standins_dir = os.path.dirname(os.path.abspath(__file__))
+
+default_fixtures_path = os.path.join(standins_dir, "fixtures", "openai.jsonl")
+
+# openai caches prompt prefixes of at least 1024 tokens, in steps of 128 tokens
+min_cached_tokens = 1024
+cached_tokens_step = 128
+
+lorem_words = (
+    "the students cleaned up the lake shore and mapped the waste they found there "
+    "before sharing a report with the local ward office and planning a follow up "
+    "drive with their neighbours to keep the area clean every week"
+).split()
+
+
+def count_tokens(text: str) -> int:
+    # about 4 characters per token, close enough for the load it generates
+    return max(len(text) // 4, 1)
+
+
+def split_into_tokens(text: str) -> List[str]:
+    return re.findall(r".{1,4}", text, re.S)
+
+
+def get_stage(body: Dict) -> str:
+    # the service sends "<prefix>:<stage>" as the prompt cache key
+    return (body.get("prompt_cache_key") or "unknown").split(":")[-1]
+
+
+def get_json_schema(body: Dict) -> Dict | None:
+    text_format = (body.get("text") or {}).get("format") or {}
+    if text_format.get("type") != "json_schema":
+        return None
+
+    return text_format["schema"]
+
+
+def hash_json(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def get_request_hash(body: Dict) -> str:
+    # not the model, so that outputs replay whichever model the service routes to
+    return hash_json({"input": body.get("input"), "schema": get_json_schema(body)})
+
+
+def generate_text(rng: random.Random, num_words: int) -> str:
+    start = rng.randrange(len(lorem_words))
+    words = [lorem_words[(start + i) % len(lorem_words)] for i in range(num_words)]
+    return " ".join(words).capitalize() + "."
+
+
+def resolve_ref(schema: Dict, defs: Dict) -> Dict:
+    if "$ref" in schema:
+        return defs[schema["$ref"].split("/")[-1]]
+
+    return schema
+
+
+def generate_from_schema(schema: Dict, defs: Dict, rng: random.Random, num_words: int):
+    """A value for the subset of JSON schema that strict structured outputs allow."""
+    schema = resolve_ref(schema, defs)
+
+    if "anyOf" in schema:
+        return generate_from_schema(rng.choice(schema["anyOf"]), defs, rng, num_words)
+
+    if "const" in schema:
+        return schema["const"]
+
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list):
+        schema_type = rng.choice(schema_type)
+
+    if schema_type == "object":
+        return {
+            name: generate_from_schema(property_schema, defs, rng, num_words)
+            for name, property_schema in schema.get("properties", {}).items()
+        }
+
+    if schema_type == "array":
+        items_schema = resolve_ref(schema.get("items", {}), defs)
+
+        # a list of objects keyed by an enum, e.g. the relevance of each skill, has an
+        # item for every value like the models answer it
+        for name, property_schema in items_schema.get("properties", {}).items():
+            if "enum" in property_schema:
+                return [
+                    {
+                        **generate_from_schema(items_schema, defs, rng, num_words),
+                        name: value,
+                    }
+                    for value in property_schema["enum"]
+                ]
+
+        num_items = rng.randint(schema.get("minItems", 1), schema.get("maxItems", 3))
+        return [
+            generate_from_schema(items_schema, defs, rng, num_words)
+            for _ in range(num_items)
+        ]
+
+    if schema_type == "integer":
+        return rng.randint(schema.get("minimum", 0), schema.get("maximum", 10))
+
+    if schema_type == "number":
+        return round(rng.uniform(schema.get("minimum", 0), schema.get("maximum", 10)), 2)
+
+    if schema_type == "boolean":
+        return rng.random() < 0.5
+
+    if schema_type == "null":
+        return None
+
+    return generate_text(rng, rng.randint(num_words // 2, num_words))
+
+
+class Fixtures:
+    """Recorded outputs, one JSON object per line, indexed by request and by stage and schema."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._by_request = {}
+        self._by_stage = defaultdict(list)
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, fixture: Dict):
+        self._by_request[fixture["request_hash"]] = fixture
+        self._by_stage[(fixture["stage"], fixture["schema_hash"])].append(fixture)
+
+    def find(self, body: Dict, rng: random.Random) -> Dict | None:
+        if fixture := self._by_request.get(get_request_hash(body)):
+            return fixture
+
+        # an output of another request only fits if it was made for the same schema,
+        # e.g. the subcategories allowed depend on the category
+        candidates = self._by_stage.get(
+            (get_stage(body), hash_json(get_json_schema(body)))
+        )
+        return rng.choice(candidates) if candidates else None
+
+    def add(self, body: Dict, output_text: str, usage: Dict, latency_seconds: float):
+        fixture = {
+            "request_hash": get_request_hash(body),
+            "stage": get_stage(body),
+            "schema_hash": hash_json(get_json_schema(body)),
+            "model": body.get("model"),
+            "output_text": output_text,
+            "usage": usage,
+            "latency_seconds": latency_seconds,
+        }
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(fixture) + "\n")
+
+        self._index(fixture)
+
+
+class PromptCache:
+    """Remembers the last input of each prompt cache key to report the cached tokens."""
+
+    def __init__(self):
+        self._last_input = {}
+
+    def get_cached_tokens(self, body: Dict) -> int:
+        key = body.get("prompt_cache_key")
+        serialized_input = json.dumps(body.get("input"))
+        previous_input = self._last_input.get(key, "")
+        self._last_input[key] = serialized_input
+
+        prefix_tokens = count_tokens(os.path.commonprefix([previous_input, serialized_input]))
+        if prefix_tokens < min_cached_tokens:
+            return 0
+
+        return prefix_tokens - prefix_tokens % cached_tokens_step
+
+
+def build_response(body: Dict, status: str, output_text: str | None, usage: Dict) -> Dict:
+    output = []
+    if output_text is not None:
+        output.append(build_message(output_text, "completed"))
+
+    return {
+        "id": f"resp_{hashlib.sha1(os.urandom(8)).hexdigest()}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": body.get("model"),
+        "status": status,
+        "output": output,
+        "parallel_tool_calls": False,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": usage,
+    }
+
+
+def build_message(text: str, status: str) -> Dict:
+    return {
+        "id": "msg_standin",
+        "type": "message",
+        "role": "assistant",
+        "status": status,
+        "content": [{"type": "output_text", "text": text, "annotations": []}],
+    }
+
+
+def build_usage(input_tokens: int, cached_tokens: int, output_tokens: int) -> Dict:
+    return {
+        "input_tokens": input_tokens,
+        "input_tokens_details": {"cached_tokens": cached_tokens},
+        "output_tokens": output_tokens,
+        "output_tokens_details": {"reasoning_tokens": 0},
+        "total_tokens": input_tokens + output_tokens,
+    }
+
+
+def format_event(event_type: str, sequence_number: int, **data) -> str:
+    data = {"type": event_type, "sequence_number": sequence_number, **data}
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def get_output_text(response: Dict) -> str:
+    return "".join(
+        content["text"]
+        for item in response.get("output", [])
+        if item.get("type") == "message"
+        for content in item.get("content", [])
+        if content.get("type") == "output_text"
+    )
+
+
+def create_app(args) -> FastAPI:
+    app = FastAPI()
+    fixtures = Fixtures(args.fixtures)
+    prompt_cache = PromptCache()
+    rng = random.Random(args.seed)
+    first_token_latency = LatencyDistribution(
+        args.first_token_median_ms, args.first_token_p95_ms, rng
+    )
+    upstream = httpx.AsyncClient(base_url=args.upstream, timeout=300)
+
+    async def stream_output(body: Dict, output_text: str, usage: Dict, wait: bool):
+        if wait:
+            await first_token_latency.wait()
+
+        sequence_number = 0
+
+        def next_event(event_type: str, **data) -> str:
+            nonlocal sequence_number
+            sequence_number += 1
+            return format_event(event_type, sequence_number, **data)
+
+        yield next_event(
+            "response.created", response=build_response(body, "in_progress", None, usage)
+        )
+        yield next_event(
+            "response.output_item.added",
+            output_index=0,
+            item={**build_message("", "in_progress"), "content": []},
+        )
+        yield next_event(
+            "response.content_part.added",
+            item_id="msg_standin",
+            output_index=0,
+            content_index=0,
+            part={"type": "output_text", "text": "", "annotations": []},
+        )
+
+        for token in split_into_tokens(output_text):
+            yield next_event(
+                "response.output_text.delta",
+                item_id="msg_standin",
+                output_index=0,
+                content_index=0,
+                delta=token,
+                logprobs=[],
+            )
+            if wait and args.tokens_per_second > 0:
+                await asyncio.sleep(1 / args.tokens_per_second)
+
+        yield next_event(
+            "response.output_text.done",
+            item_id="msg_standin",
+            output_index=0,
+            content_index=0,
+            text=output_text,
+            logprobs=[],
+        )
+        yield next_event(
+            "response.content_part.done",
+            item_id="msg_standin",
+            output_index=0,
+            content_index=0,
+            part={"type": "output_text", "text": output_text, "annotations": []},
+        )
+        yield next_event(
+            "response.output_item.done",
+            output_index=0,
+            item=build_message(output_text, "completed"),
+        )
+        yield next_event(
+            "response.completed",
+            response=build_response(body, "completed", output_text, usage),
+        )
+
+    async def record(request: Request, body: Dict):
+        started_at = time.perf_counter()
+        upstream_response = await upstream.post(
+            "/responses",
+            json={**body, "stream": False},
+            headers={"Authorization": request.headers.get("authorization", "")},
+        )
+        if upstream_response.status_code != 200:
+            return JSONResponse(
+                upstream_response.json(), status_code=upstream_response.status_code
+            )
+
+        response = upstream_response.json()
+        output_text = get_output_text(response)
+        fixtures.add(
+            body, output_text, response["usage"], time.perf_counter() - started_at
+        )
+
+        if not body.get("stream"):
+            return response
+
+        # the upstream latency already passed, replay the recording right away
+        return StreamingResponse(
+            stream_output(body, output_text, response["usage"], wait=False),
+            media_type="text/event-stream",
+        )
+
+    @app.post("/v1/responses")
+    async def create_response(request: Request):
+        body = await request.json()
+
+        if args.record:
+            return await record(request, body)
+
+        if rng.random() < args.error_rate:
+            return JSONResponse(
+                {"error": {"message": "Stand-in server error", "type": "server_error"}},
+                status_code=500,
+            )
+
+        if rng.random() < args.rate_limit_rate:
+            return JSONResponse(
+                {"error": {"message": "Stand-in rate limit", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"retry-after-ms": "500"},
+            )
+
+        request_hash = get_request_hash(body)
+
+        if fixture := fixtures.find(body, rng):
+            output_text = fixture["output_text"]
+        else:
+            # the same output for the same request
+            request_rng = random.Random(f"{args.seed}:{request_hash}")
+            schema = get_json_schema(body)
+            output_text = (
+                json.dumps(
+                    generate_from_schema(
+                        schema, schema.get("$defs", {}), request_rng, args.words
+                    )
+                )
+                if schema is not None
+                else generate_text(request_rng, args.words * 3)
+            )
+
+        usage = build_usage(
+            count_tokens(json.dumps(body.get("input"))),
+            prompt_cache.get_cached_tokens(body),
+            len(split_into_tokens(output_text)),
+        )
+
+        if body.get("stream"):
+            return StreamingResponse(
+                stream_output(body, output_text, usage, wait=True),
+                media_type="text/event-stream",
+            )
+
+        await asyncio.sleep(
+            first_token_latency.sample_seconds()
+            + (
+                usage["output_tokens"] / args.tokens_per_second
+                if args.tokens_per_second > 0
+                else 0
+            )
+        )
+        return build_response(body, "completed", output_text, usage)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--fixtures", default=default_fixtures_path)
+    add_latency_arguments(parser, "first-token", 500, 2000, "first token latency")
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    # length of the generated strings
+    parser.add_argument("--words", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--upstream", default="https://api.openai.com/v1")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
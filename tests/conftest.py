@@ -0,0 +1,20 @@
+import os
+import sys
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root_dir, "src"))
+sys.path.insert(0, os.path.join(root_dir, "benchmarks"))
+
+# settings.py requires these; the tests never reach openai or frappe
+for name in [
+    "OPENAI_API_KEY",
+    "FRAPPE_BACKEND_BASE_URL",
+    "FRAPPE_BACKEND_CLIENT_ID",
+    "FRAPPE_BACKEND_CLIENT_SECRET",
+    "FRAPPE_SSO_CLIENT_ID",
+    "FRAPPE_SSO_CLIENT_SECRET",
+    "FRAPPE_SSO_REDIRECT_URI",
+    "ENV",
+    "DATABASE_URL",
+]:
+    os.environ.setdefault(name, "test")
@@ -0,0 +1,35 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("tiktoken")
+
+from prompt_tokens import count_stage_tokens, find_regressions  # noqa: E402
+from tokens import get_tokenizer_name  # noqa: E402
+
+fixtures_dir = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures"
+)
+
+# same as the default of benchmarks/prompt_tokens.py
+tolerance = 0.05
+
+
+def test_prompt_tokens_within_snapshot():
+    tokenizer = get_tokenizer_name()
+    if tokenizer == "estimate":
+        pytest.skip("The tiktoken encoding could not be loaded")
+
+    with open(os.path.join(fixtures_dir, "prompt_histories.json")) as f:
+        fixtures = json.load(f)
+
+    with open(os.path.join(fixtures_dir, "prompt_tokens_snapshot.json")) as f:
+        snapshot = json.load(f).get(tokenizer)
+
+    assert (
+        snapshot
+    ), f"No snapshot for the {tokenizer} tokenizer, create it with python benchmarks/prompt_tokens.py --update"
+
+    regressions = find_regressions(count_stage_tokens(fixtures), snapshot, tolerance)
+    assert not regressions, "\n".join(regressions)